@@ -0,0 +1,56 @@
+"""users.categories（カンマ区切り）を正規化した user_categories テーブルを作成
+
+- user_categories: (user_id, category_id) を主キー、(category_id, user_id) に副インデックス
+  「ユーザーの所属カテゴリー」「カテゴリーに所属するユーザー」の両方がインデックスで引ける
+- backfill_progress: 既存データ移行（app/services/category_backfill.py）の再開位置を保存する
+
+既存データの移行はマイグレーション後に別途実行する:
+    python -m app.services.category_backfill
+
+Revision ID: 0001_user_categories
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_user_categories"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user_categories",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "category_id"),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index(
+        "idx_user_categories_category_user", "user_categories", ["category_id", "user_id"]
+    )
+
+    op.create_table(
+        "backfill_progress",
+        sa.Column("job_name", sa.String(64), primary_key=True),
+        sa.Column("last_id", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("processed", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+            nullable=False,
+        ),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+
+
+def downgrade():
+    op.drop_table("backfill_progress")
+    op.drop_index("idx_user_categories_category_user", table_name="user_categories")
+    op.drop_table("user_categories")
@@ -0,0 +1,62 @@
+"""メッセージ機能のテーブルを作成
+
+- messages: 1対1の会話。会話は2人のuser_idから作る conversation_key（"小さいID:大きいID"）で識別する
+  一覧はキーセットページングで引くため (conversation_key, message_id) にインデックス
+  未読の一括既読化のため (recipient_id, conversation_key, is_read, message_id) にインデックス
+- message_unread_counts: ユーザー×会話ごとの未読数。送信・既読化のたびに増減させ、COUNT(*) しない
+
+Revision ID: 0002_messages
+Revises: 0001_user_categories
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_messages"
+down_revision = "0001_user_categories"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "messages",
+        sa.Column("message_id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("conversation_key", sa.String(41), nullable=False),
+        sa.Column("sender_id", sa.Integer(), nullable=False),
+        sa.Column("recipient_id", sa.Integer(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("is_read", sa.Boolean(), nullable=False, server_default=sa.text("0")),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index("idx_messages_conversation", "messages", ["conversation_key", "message_id"])
+    op.create_index(
+        "idx_messages_recipient_unread",
+        "messages",
+        ["recipient_id", "conversation_key", "is_read", "message_id"],
+    )
+
+    op.create_table(
+        "message_unread_counts",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("conversation_key", sa.String(41), nullable=False),
+        sa.Column("other_user_id", sa.Integer(), nullable=False),
+        sa.Column("unread_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_message_id", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("user_id", "conversation_key"),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index(
+        "idx_message_unread_counts_recent", "message_unread_counts", ["user_id", "last_message_id"]
+    )
+
+
+def downgrade():
+    op.drop_index("idx_message_unread_counts_recent", table_name="message_unread_counts")
+    op.drop_table("message_unread_counts")
+    op.drop_index("idx_messages_recipient_unread", table_name="messages")
+    op.drop_index("idx_messages_conversation", table_name="messages")
+    op.drop_table("messages")
@@ -0,0 +1,51 @@
+"""お困りごと（troubles）テーブルを作成
+
+- (category_id, trouble_id) インデックス: カテゴリー別一覧
+- (user_id, trouble_id) インデックス: 自分のお困りごと一覧
+- updated_at インデックス: 検索インデックスの差分同期（他ワーカーでの作成・編集の取り込み）
+
+全文検索はアプリ内のbigram転置インデックス（app/services/trouble_search.py）で行うため、
+FULLTEXTインデックスは作成しない。
+
+Revision ID: 0003_troubles
+Revises: 0002_messages
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_troubles"
+down_revision = "0002_messages"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "troubles",
+        sa.Column("trouble_id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("description", sa.Text(), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(20), nullable=False, server_default="open"),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+            nullable=False,
+        ),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index("idx_troubles_category", "troubles", ["category_id", "trouble_id"])
+    op.create_index("idx_troubles_user", "troubles", ["user_id", "trouble_id"])
+    op.create_index("idx_troubles_updated_at", "troubles", ["updated_at"])
+
+
+def downgrade():
+    op.drop_index("idx_troubles_updated_at", table_name="troubles")
+    op.drop_index("idx_troubles_user", table_name="troubles")
+    op.drop_index("idx_troubles_category", table_name="troubles")
+    op.drop_table("troubles")
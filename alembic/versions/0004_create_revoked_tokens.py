@@ -0,0 +1,39 @@
+"""失効済みトークン（revoked_tokens）テーブルを作成
+
+ログアウトしたトークンの jti を有効期限まで保存する。各ワーカーは起動時に有効期限内のものを
+読み込み、その後は id を追いかけて他ワーカーで追加された分を取り込む（app/core/revocation.py）。
+
+- jti の一意インデックス: 同じトークンの二重登録を防ぐ
+- expires_at インデックス: 起動時の読み込みと期限切れの削除
+
+Revision ID: 0004_revoked_tokens
+Revises: 0003_troubles
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_revoked_tokens"
+down_revision = "0003_troubles"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "revoked_tokens",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("jti", sa.String(64), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index("uq_revoked_tokens_jti", "revoked_tokens", ["jti"], unique=True)
+    op.create_index("idx_revoked_tokens_expires_at", "revoked_tokens", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("idx_revoked_tokens_expires_at", table_name="revoked_tokens")
+    op.drop_index("uq_revoked_tokens_jti", table_name="revoked_tokens")
+    op.drop_table("revoked_tokens")
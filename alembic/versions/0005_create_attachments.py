@@ -0,0 +1,72 @@
+"""添付ファイルのテーブルを作成
+
+ファイルの中身はディスク（ATTACHMENT_DIR）に SHA-256 をファイル名にして1つだけ置き、
+同じ中身のアップロードは参照数を増やすだけにする（app/services/attachments.py）。
+
+- attachment_blobs: 中身（sha256）ごとのサイズと参照数。参照数が0になったらファイルごと消す
+- attachments: ユーザーがアップロードした1件ごとの行。お困りごと・メッセージに紐づけられる
+  (trouble_id) / (message_id) / (user_id, attachment_id) にインデックス
+- attachment_usage: ユーザーごとの使用量。アップロード・削除のたびに増減させ、
+  クォータの判定でファイルを読み直したり SUM() したりしない
+
+Revision ID: 0005_attachments
+Revises: 0004_revoked_tokens
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_attachments"
+down_revision = "0004_revoked_tokens"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "attachment_blobs",
+        sa.Column("sha256", sa.CHAR(64), primary_key=True),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+
+    op.create_table(
+        "attachments",
+        sa.Column("attachment_id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("sha256", sa.CHAR(64), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("filename", sa.String(255), nullable=False),
+        sa.Column("content_type", sa.String(127), nullable=False),
+        sa.Column("trouble_id", sa.Integer(), nullable=True),
+        sa.Column("message_id", sa.BigInteger(), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index("idx_attachments_user", "attachments", ["user_id", "attachment_id"])
+    op.create_index("idx_attachments_trouble", "attachments", ["trouble_id"])
+    op.create_index("idx_attachments_message", "attachments", ["message_id"])
+    op.create_index("idx_attachments_sha256", "attachments", ["sha256"])
+
+    op.create_table(
+        "attachment_usage",
+        sa.Column("user_id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("bytes_used", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("file_count", sa.Integer(), nullable=False, server_default="0"),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+
+
+def downgrade():
+    op.drop_table("attachment_usage")
+    op.drop_index("idx_attachments_sha256", table_name="attachments")
+    op.drop_index("idx_attachments_message", table_name="attachments")
+    op.drop_index("idx_attachments_trouble", table_name="attachments")
+    op.drop_index("idx_attachments_user", table_name="attachments")
+    op.drop_table("attachments")
+    op.drop_table("attachment_blobs")
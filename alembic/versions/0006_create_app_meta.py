@@ -0,0 +1,35 @@
+"""アプリのメタ情報（app_meta）テーブルを作成
+
+起動処理で使う小さなキー・値を保存する。現在はデフォルトカテゴリーを登録済みかどうかの判定に、
+登録したカテゴリー一覧のチェックサム（category_catalog_checksum）を入れている
+（app/api/categories/models.py の ensure_categories_exist）。
+
+Revision ID: 0006_app_meta
+Revises: 0005_attachments
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_app_meta"
+down_revision = "0005_attachments"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "app_meta",
+        sa.Column("meta_key", sa.String(64), primary_key=True),
+        sa.Column("meta_value", sa.String(255), nullable=False),
+        sa.Column(
+            "updated_at", sa.TIMESTAMP(),
+            server_default=sa.text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), nullable=False,
+        ),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+
+
+def downgrade():
+    op.drop_table("app_meta")
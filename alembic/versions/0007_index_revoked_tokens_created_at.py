@@ -0,0 +1,24 @@
+"""revoked_tokens の created_at にインデックスを追加
+
+失効済みトークンの差分同期（app/core/revocation.py の TokenDenylist.sync）は、
+AUTO_INCREMENT の id がコミット順に並ばないため、前回の最新の created_at から一定時間遡って
+(created_at, id) 順に読み直す。その範囲検索用。
+
+Revision ID: 0007_revoked_tokens_created_at
+Revises: 0006_app_meta
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0007_revoked_tokens_created_at"
+down_revision = "0006_app_meta"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("idx_revoked_tokens_created_at", "revoked_tokens", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("idx_revoked_tokens_created_at", table_name="revoked_tokens")
@@ -0,0 +1,59 @@
+from app.core.database import get_db_connection
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# メッセージへの添付は送信者・受信者を見て閲覧できるか判定する
+_SELECT_ATTACHMENT = """
+SELECT a.*, m.sender_id, m.recipient_id
+FROM attachments a
+LEFT JOIN messages m ON m.message_id = a.message_id
+"""
+
+class AttachmentModel:
+    """添付ファイルモデル - 添付の行と使用量の参照（登録・削除は app.services.attachments）"""
+
+    @staticmethod
+    def get_by_id(attachment_id: int):
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(_SELECT_ATTACHMENT + " WHERE a.attachment_id = %s", (attachment_id,))
+                    attachment = cursor.fetchone()
+            return attachment
+        except Exception:
+            logger.exception("Error getting attachment")
+            return None
+
+    @staticmethod
+    def list_for(trouble_id: Optional[int] = None, message_id: Optional[int] = None, limit: int = 100):
+        """お困りごと、またはメッセージの添付を古い順に取得"""
+        column, value = ("a.trouble_id", trouble_id) if trouble_id is not None else ("a.message_id", message_id)
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        _SELECT_ATTACHMENT + f" WHERE {column} = %s ORDER BY a.attachment_id LIMIT %s",
+                        (value, limit)
+                    )
+                    attachments = cursor.fetchall()
+            return attachments
+        except Exception:
+            logger.exception("Error listing attachments")
+            return None
+
+    @staticmethod
+    def get_usage(user_id: int):
+        """使用量（行がなければ0）"""
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT bytes_used, file_count FROM attachment_usage WHERE user_id = %s", (user_id,)
+                    )
+                    usage = cursor.fetchone()
+            return usage or {"bytes_used": 0, "file_count": 0}
+        except Exception:
+            logger.exception("Error getting attachment usage")
+            return None
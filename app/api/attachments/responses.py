@@ -0,0 +1,144 @@
+"""
+添付ファイルのダウンロード用レスポンス
+
+starlette 0.27 の FileResponse は Range に対応していないため、単一範囲の Range / If-Range と
+ETag（中身の SHA-256）による If-None-Match をここで扱う。
+
+- サーバーが ASGI の "http.response.zerocopysend" 拡張を提供していれば、ファイル記述子を渡して
+  sendfile(2) で送らせる（ワーカーでファイルの中身を読まない）
+- 提供していない場合（uvicorn）は chunk_size ごとにスレッドプールで読みながら送る
+- ATTACHMENT_ACCEL_REDIRECT_PREFIX を設定した場合は本文を送らず X-Accel-Redirect を返し、
+  前段の nginx に sendfile で送らせる（Range も nginx が処理する）
+"""
+import os
+import stat
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+ATTACHMENT_ACCEL_REDIRECT_PREFIX = os.getenv("ATTACHMENT_ACCEL_REDIRECT_PREFIX", "")
+
+# 中身のアドレスで引くので、同じ添付IDの内容は変わらない
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+# ブラウザでそのまま表示させる種類（それ以外はダウンロードさせる）
+INLINE_CONTENT_TYPES = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp", "application/pdf"})
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Range ヘッダーから (開始, 終了) を返す（終了を含む）
+    ヘッダーがない・読めない・複数範囲の場合は None（全体を返す）。範囲がファイル外なら RangeNotSatisfiable
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else max(start, size - 1)
+            if end < start:
+                return None
+        else:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            start, end = max(size - suffix, 0), size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(FileResponse):
+    """Range 指定の部分だけを送る FileResponse（stat_result は呼び出し側で取っておく）"""
+
+    def __init__(self, path: str, stat_result: os.stat_result, etag: str, byte_range: Optional[Tuple[int, int]] = None,
+                 **kwargs):
+        size = stat_result.st_size
+        self.start, self.end = byte_range if byte_range is not None else (0, size - 1)
+        super().__init__(
+            path,
+            status_code=206 if byte_range is not None else 200,
+            stat_result=stat_result,
+            **kwargs,
+        )
+        self.headers["etag"] = etag
+        self.headers["content-length"] = str(self.end - self.start + 1)
+        if byte_range is not None:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        super().set_stat_headers(stat_result)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["cache-control"] = CACHE_CONTROL
+        self.headers["x-content-type-options"] = "nosniff"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not stat.S_ISREG(self.stat_result.st_mode):
+            raise RuntimeError(f"File at path {self.path} is not a file.")
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        remaining = self.end - self.start + 1
+        if self.send_header_only or remaining <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": fd,
+                    "offset": self.start,
+                    "count": remaining,
+                    "more_body": False,
+                })
+            finally:
+                os.close(fd)
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.start)
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    # 送信中にファイルが短くなった（通常は起きない）
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+def content_disposition(filename: str, content_type: str) -> str:
+    disposition = "inline" if content_type in INLINE_CONTENT_TYPES else "attachment"
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+def accel_redirect_response(location: str, etag: str, content_type: str, filename: str) -> Response:
+    """本文を前段の nginx に送らせるレスポンス"""
+    return Response(
+        status_code=200,
+        media_type=content_type,
+        headers={
+            "x-accel-redirect": location,
+            "etag": etag,
+            "cache-control": CACHE_CONTROL,
+            "x-content-type-options": "nosniff",
+            "content-disposition": content_disposition(filename, content_type),
+        },
+    )
@@ -0,0 +1,213 @@
+import os
+from typing import List, Optional
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+
+from app.api.attachments.models import AttachmentModel
+from app.api.attachments.responses import (
+    ATTACHMENT_ACCEL_REDIRECT_PREFIX, CACHE_CONTROL, RangeFileResponse, RangeNotSatisfiable,
+    accel_redirect_response, content_disposition, parse_range,
+)
+from app.api.attachments.schemas import Attachment, AttachmentUsage
+from app.api.categories.catalog import etag_matches
+from app.api.messages.models import MessageModel
+from app.api.troubles.models import TroubleModel
+from app.api.users.schemas import UserInDB
+from app.core.database import run_db
+from app.core.dependencies import get_current_active_user
+from app.services.attachments import (
+    ATTACHMENT_MAX_BYTES, UploadError, attachment_store, blob_path, blob_relpath, receive_upload,
+)
+
+router = APIRouter()
+
+def _can_read(attachment: dict, user: UserInDB) -> bool:
+    """アップロードした本人、お困りごとの添付はログインユーザー全員、メッセージの添付は送信者・受信者"""
+    if attachment["user_id"] == user.user_id:
+        return True
+    if attachment["trouble_id"] is not None:
+        return True
+    if attachment["message_id"] is not None:
+        return user.user_id in (attachment["sender_id"], attachment["recipient_id"])
+    return False
+
+async def _get_readable(attachment_id: int, user: UserInDB) -> dict:
+    attachment = await run_db(AttachmentModel.get_by_id, attachment_id)
+    # 見る権限がない場合も存在を明かさない
+    if attachment is None or not _can_read(attachment, user):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Attachment not found"
+        )
+    return attachment
+
+async def _check_target(trouble_id: Optional[int], message_id: Optional[int], user: UserInDB, owner: bool):
+    """
+    添付先の確認（どちらか一方だけ指定できる）
+    owner=True: 添付できるのはお困りごとの投稿者・メッセージの送信者
+    owner=False: 一覧を見られるのはログインユーザー全員（お困りごと）・送信者と受信者（メッセージ）
+    """
+    if trouble_id is not None and message_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Specify only one of trouble_id or message_id"
+        )
+    if not owner and trouble_id is None and message_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Specify trouble_id or message_id"
+        )
+    if trouble_id is not None:
+        trouble = await run_db(TroubleModel.get_by_id, trouble_id)
+        if trouble is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trouble not found")
+        if owner and trouble["user_id"] != user.user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to attach files to this trouble"
+            )
+    if message_id is not None:
+        message = await run_db(MessageModel.get_by_id, message_id)
+        if message is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
+        allowed = (message["sender_id"],) if owner else (message["sender_id"], message["recipient_id"])
+        if user.user_id not in allowed:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
+
+@router.post("/", response_model=Attachment, status_code=status.HTTP_201_CREATED)
+async def upload_attachment(
+    request: Request,
+    trouble_id: Optional[int] = Query(None, description="添付先のお困りごと"),
+    message_id: Optional[int] = Query(None, description="添付先のメッセージ"),
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """
+    添付ファイルのアップロード
+    multipart/form-data の "file" フィールドで1ファイル送る（添付先は省略可）
+    """
+    await _check_target(trouble_id, message_id, current_user, owner=True)
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > ATTACHMENT_MAX_BYTES + 64 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds {ATTACHMENT_MAX_BYTES} bytes"
+        )
+    usage = await run_db(AttachmentModel.get_usage, current_user.user_id)
+    if usage is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error getting attachment usage"
+        )
+
+    try:
+        received = await receive_upload(
+            request.stream(), request.headers.get("content-type"),
+            attachment_store.quota_bytes - usage["bytes_used"],
+        )
+        attachment = await run_db(attachment_store.save, current_user.user_id, received, trouble_id, message_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if attachment is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error saving attachment"
+        )
+    return attachment
+
+@router.get("/", response_model=List[Attachment])
+async def list_attachments(
+    trouble_id: Optional[int] = Query(None),
+    message_id: Optional[int] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """お困りごと、またはメッセージの添付一覧"""
+    await _check_target(trouble_id, message_id, current_user, owner=False)
+    attachments = await run_db(AttachmentModel.list_for, trouble_id, message_id, limit)
+    if attachments is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error listing attachments"
+        )
+    return attachments
+
+@router.get("/usage", response_model=AttachmentUsage)
+async def read_usage(current_user: UserInDB = Depends(get_current_active_user)):
+    """自分の使用量とクォータ"""
+    usage = await run_db(AttachmentModel.get_usage, current_user.user_id)
+    if usage is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error getting attachment usage"
+        )
+    return {**usage, "quota_bytes": attachment_store.quota_bytes}
+
+@router.get("/{attachment_id}", response_model=Attachment)
+async def read_attachment(attachment_id: int, current_user: UserInDB = Depends(get_current_active_user)):
+    return await _get_readable(attachment_id, current_user)
+
+@router.api_route("/{attachment_id}/content", methods=["GET", "HEAD"])
+async def download_attachment(
+    attachment_id: int,
+    request: Request,
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """
+    添付ファイルの中身
+    ETag は中身の SHA-256。If-None-Match が一致すれば304、Range（単一範囲）には206で部分を返す
+    """
+    attachment = await _get_readable(attachment_id, current_user)
+    etag = f'"{attachment["sha256"]}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"etag": etag, "cache-control": CACHE_CONTROL},
+        )
+
+    path = blob_path(attachment["sha256"])
+    if ATTACHMENT_ACCEL_REDIRECT_PREFIX:
+        location = ATTACHMENT_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + blob_relpath(attachment["sha256"])
+        return accel_redirect_response(location, etag, attachment["content_type"], attachment["filename"])
+
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Attachment content not found"
+        )
+
+    # If-Range が現在の ETag と違えば Range を無視して全体を返す
+    if_range = request.headers.get("if-range")
+    range_header = request.headers.get("range") if if_range in (None, etag) else None
+    try:
+        byte_range = parse_range(range_header, stat_result.st_size)
+    except RangeNotSatisfiable:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"content-range": f"bytes */{stat_result.st_size}", "etag": etag},
+        )
+    return RangeFileResponse(
+        path, stat_result, etag, byte_range,
+        media_type=attachment["content_type"],
+        headers={"content-disposition": content_disposition(attachment["filename"], attachment["content_type"])},
+        method=request.method,
+    )
+
+@router.delete("/{attachment_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_attachment(attachment_id: int, current_user: UserInDB = Depends(get_current_active_user)):
+    """添付の削除（アップロードした本人のみ）。使用量から差し引く"""
+    attachment = await run_db(AttachmentModel.get_by_id, attachment_id)
+    if attachment is None or attachment["user_id"] != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Attachment not found"
+        )
+    if not await run_db(attachment_store.delete, attachment_id):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error deleting attachment"
+        )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class Attachment(BaseModel):
+    attachment_id: int
+    user_id: int
+    sha256: str
+    size: int
+    filename: str
+    content_type: str
+    trouble_id: Optional[int] = None
+    message_id: Optional[int] = None
+    created_at: datetime
+
+class AttachmentUsage(BaseModel):
+    bytes_used: int
+    file_count: int
+    quota_bytes: int
@@ -1,8 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import timedelta
+from jose import JWTError, jwt
 
-from app.core.security import verify_password, create_access_token, get_password_hash, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.core.database import mark_read_sticky, run_db
+from app.core.rate_limit import (
+    rate_limiter, client_ip, LOGIN_LIMIT_PER_IP, LOGIN_LIMIT_PER_USERNAME, REGISTER_LIMIT_PER_IP,
+)
+from app.core.revocation import token_denylist
+from app.core.security import (
+    verify_password_async, create_access_token, get_password_hash_async,
+    PasswordHasherBusy, ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY, ALGORITHM,
+)
 from app.api.users.models import UserModel
 from app.api.users.schemas import Token, UserCreate
 from app.api.categories.models import CategoryModel  # カテゴリーモデルをインポート
@@ -12,17 +21,36 @@ router = APIRouter()
 # トークンURLを修正 - ルートレベルでも提供
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
-def authenticate_user(username: str, password: str):
-    user = UserModel.get_by_username(username)
+busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Server is busy, please retry",
+    headers={"Retry-After": "1"},
+)
+
+async def authenticate_user(username: str, password: str, ip: str = None):
+    # DB参照やハッシュ検証の前に試行回数を制限する（超過時は429）
+    rate_limiter.enforce(
+        "login",
+        ("ip", ip, LOGIN_LIMIT_PER_IP),
+        ("username", username.lower(), LOGIN_LIMIT_PER_USERNAME),
+    )
+    user = await run_db(UserModel.get_by_username, username)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    try:
+        valid, new_hash = await verify_password_async(password, user.password)
+    except PasswordHasherBusy:
+        raise busy_exception
+    if not valid:
         return False
+    # 古いコストのハッシュはログイン成功時に置き換える
+    if new_hash:
+        await run_db(UserModel.update_password, user.user_id, new_hash)
     return user
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), request: Request = None):
+    user = await authenticate_user(form_data.username, form_data.password, client_ip(request))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -31,20 +59,24 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
         
     # 最終ログイン時間を更新
-    UserModel.update_last_login(user.user_id)        
+    await run_db(UserModel.update_last_login, user.user_id)        
         
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.name}, expires_delta=access_token_expires
     )
+    # このトークンでの次の読み取りはプライマリへ（最終ログイン時刻などの更新がレプリカに届く前に読まない）
+    mark_read_sticky(user.name)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register_user(user: UserCreate):
+async def register_user(user: UserCreate, request: Request):
     """
     新規ユーザー登録エンドポイント
     name, password, confirm_password, categories（オプション）を受け取る
     """
+    rate_limiter.enforce("register", ("ip", client_ip(request), REGISTER_LIMIT_PER_IP))
+
     # パスワード確認
     if user.password != user.confirm_password:
         raise HTTPException(
@@ -53,7 +85,7 @@ async def register_user(user: UserCreate):
         )
     
     # 既存ユーザーチェック
-    existing_user = UserModel.get_by_username(user.name)
+    existing_user = await run_db(UserModel.get_by_username, user.name)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -61,16 +93,18 @@ async def register_user(user: UserCreate):
         )
     
     # パスワード処理
-    password_to_store = get_password_hash(user.password)
+    try:
+        password_to_store = await get_password_hash_async(user.password)
+    except PasswordHasherBusy:
+        raise busy_exception
     
-    # カテゴリー処理
+    # カテゴリー処理（カテゴリー一覧にない名前は users.categories にだけ残り、user_categories には入らない）
     categories_str = None
     if user.categories and len(user.categories) > 0:
-        # カテゴリーのIDを取得または新規作成
         categories_str = ",".join(user.categories)
     
     # ユーザー作成
-    user_id = UserModel.create_with_categories(user.name, password_to_store, categories_str)
+    user_id = await run_db(UserModel.create_with_categories, user.name, password_to_store, categories_str)
     
     if not user_id:
         raise HTTPException(
@@ -83,6 +117,8 @@ async def register_user(user: UserCreate):
     access_token = create_access_token(
         data={"sub": user.name}, expires_delta=access_token_expires
     )
+    # 登録直後の /me などがレプリカの遅延で見つからないことがないように
+    mark_read_sticky(user.name)
     
     return {
         "user_id": user_id, 
@@ -91,6 +127,34 @@ async def register_user(user: UserCreate):
         "token_type": "bearer"
     }
 
+@router.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme)):
+    """
+    ログアウト: このトークンを有効期限まで失効させる
+    （他ワーカーには TOKEN_DENYLIST_SYNC_SECONDS 以内に反映される）
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    jti = payload.get("jti")
+    if not jti:
+        # jti を持たない古いトークンは失効できない（有効期限切れを待つ）
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token cannot be revoked"
+        )
+    if not await run_db(token_denylist.revoke, jti, payload["exp"]):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error revoking token"
+        )
+    return {"message": "Successfully logged out"}
+
 @router.get("/validate-token")
 async def validate_token(token: str = Depends(oauth2_scheme)):
     from app.core.dependencies import get_current_user
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.api.categories.models import CategoryModel
+from app.core.database import run_db
+
+# カテゴリー一覧のプロセス内キャッシュ設定
+CATEGORY_CATALOG_TTL_SECONDS = float(os.getenv("CATEGORY_CATALOG_TTL_SECONDS", "300"))
+# DBから取得できずデフォルト値を返している間の再取得間隔
+CATEGORY_CATALOG_RETRY_SECONDS = float(os.getenv("CATEGORY_CATALOG_RETRY_SECONDS", "10"))
+# クライアント側キャッシュ（Cache-Control: max-age）
+CATEGORY_CACHE_MAX_AGE = int(os.getenv("CATEGORY_CACHE_MAX_AGE", "60"))
+
+
+class CategorySnapshot:
+    """ある時点のカテゴリー一覧（JSONエンコード済みの本文とETagを持つ）"""
+
+    __slots__ = ("names", "ids", "version", "etag", "body", "from_db", "expires_at")
+
+    def __init__(self, names: Tuple[str, ...], version: int, from_db: bool, ttl: float,
+                 ids: Optional[Dict[str, int]] = None):
+        self.names = names
+        # 名前 -> カテゴリーID（DBから読めずデフォルト値を使っている間は空）
+        self.ids = ids or {}
+        self.version = version
+        self.from_db = from_db
+        self.body = json.dumps(list(names), ensure_ascii=False).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.expires_at = time.monotonic() + ttl
+
+
+class CategoryCatalog:
+    """
+    カテゴリー一覧のバージョン付きスナップショット
+    - TTL切れ、または invalidate() 後の最初のアクセスでDBから読み直す
+    - 内容が変わった場合のみ version を上げる
+    """
+
+    def __init__(self, ttl: float = CATEGORY_CATALOG_TTL_SECONDS,
+                 retry_seconds: float = CATEGORY_CATALOG_RETRY_SECONDS):
+        self.ttl = ttl
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CategorySnapshot] = None
+        self._version = 0
+
+    def current(self) -> Optional[CategorySnapshot]:
+        """有効なスナップショットを返す。期限切れ・未ロードなら None"""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.expires_at <= time.monotonic():
+            return None
+        return snapshot
+
+    def refresh(self) -> CategorySnapshot:
+        """DBから読み直す（同時に呼ばれた場合は1回だけ読む）"""
+        with self._lock:
+            snapshot = self.current()
+            if snapshot is not None:
+                return snapshot
+
+            categories = CategoryModel.get_all_categories()
+            ids = {c["name"]: c["id"] for c in categories}
+            if categories:
+                names, from_db, ttl = tuple(c["name"] for c in categories), True, self.ttl
+            else:
+                # データベースから取得できない場合はデフォルト値を短い間だけ使う
+                names, from_db, ttl = tuple(CategoryModel.get_default_categories()), False, self.retry_seconds
+
+            previous = self._snapshot
+            if previous is None or previous.names != names:
+                self._version += 1
+            self._snapshot = CategorySnapshot(names, self._version, from_db, ttl, ids)
+            return self._snapshot
+
+    def invalidate(self):
+        """次のアクセスでDBから読み直させる"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            snapshot.expires_at = 0.0
+
+
+category_catalog = CategoryCatalog()
+
+
+async def load_snapshot() -> CategorySnapshot:
+    """有効なスナップショット（キャッシュが切れていればDBスレッドで読み直す）"""
+    snapshot = category_catalog.current()
+    if snapshot is None:
+        snapshot = await run_db(category_catalog.refresh)
+    return snapshot
+
+
+async def resolve_category_id(name: Optional[str]) -> Optional[int]:
+    """
+    クエリやリクエストで指定されたカテゴリー名をIDに変換する（name が空なら None、存在しない名前は400）
+    一覧のスナップショットを引き、載っていない場合（一覧の読み込み後に作られたなど）だけDBを引く
+    """
+    if not name:
+        return None
+    category_id = (await load_snapshot()).ids.get(name)
+    if category_id is None:
+        category_id = (await run_db(CategoryModel.get_ids_by_names, [name])).get(name)
+    if category_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown category: {name}"
+        )
+    return category_id
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match ヘッダーが etag に一致するか（弱い比較）"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
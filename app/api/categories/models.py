@@ -1,5 +1,15 @@
+import hashlib
+import logging
+
+import pymysql
+
 from app.core.database import get_db_connection
 
+logger = logging.getLogger(__name__)
+
+# 登録済みデフォルトカテゴリーのチェックサムを保存する app_meta のキー
+CATALOG_CHECKSUM_KEY = "category_catalog_checksum"
+
 class CategoryModel:
     """カテゴリーモデル - カテゴリー情報の管理"""
     
@@ -7,32 +17,73 @@ class CategoryModel:
     def get_all_categories():
         """全カテゴリー取得"""
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                sql = "SELECT * FROM categories ORDER BY name"
-                cursor.execute(sql)
-                categories = cursor.fetchall()
-            connection.close()
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    sql = "SELECT * FROM categories ORDER BY name"
+                    cursor.execute(sql)
+                    categories = cursor.fetchall()
             return categories
-        except Exception as e:
-            print(f"Error getting categories: {e}")
+        except Exception:
+            logger.exception("Error getting categories")
             return []
     
     @staticmethod
     def get_category_by_name(name: str):
         """名前でカテゴリー取得"""
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                sql = "SELECT * FROM categories WHERE name = %s"
-                cursor.execute(sql, (name,))
-                category = cursor.fetchone()
-            connection.close()
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    sql = "SELECT * FROM categories WHERE name = %s"
+                    cursor.execute(sql, (name,))
+                    category = cursor.fetchone()
             return category
-        except Exception as e:
-            print(f"Error getting category: {e}")
+        except Exception:
+            logger.exception("Error getting category")
             return None
     
+    @staticmethod
+    def get_ids_by_names(names, cursor=None):
+        """
+        カテゴリー名 -> ID の辞書を返す（登録済みのカテゴリーのみ。未登録の名前は含まれない）
+        cursor を渡すと呼び出し元のトランザクション内で実行する
+        """
+        names = list(dict.fromkeys(n for n in names if n))
+        if not names:
+            return {}
+        if cursor is None:
+            try:
+                with get_db_connection(read_only=True) as connection:
+                    with connection.cursor() as cursor:
+                        return CategoryModel.get_ids_by_names(names, cursor)
+            except Exception:
+                logger.exception("Error getting category ids")
+                return {}
+
+        placeholders = ", ".join(["%s"] * len(names))
+        sql = f"SELECT id, name FROM categories WHERE name IN ({placeholders})"
+        cursor.execute(sql, names)
+        return {row["name"]: row["id"] for row in cursor.fetchall()}
+    
+    @staticmethod
+    def get_categories_for_user(user_id: int):
+        """ユーザーの所属カテゴリー一覧（user_categories の主キーで検索）"""
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    sql = """
+                    SELECT c.id, c.name
+                    FROM user_categories uc
+                    JOIN categories c ON c.id = uc.category_id
+                    WHERE uc.user_id = %s
+                    ORDER BY c.name
+                    """
+                    cursor.execute(sql, (user_id,))
+                    categories = cursor.fetchall()
+            return categories
+        except Exception:
+            logger.exception("Error getting user categories")
+            return []
+    
     @staticmethod
     def get_default_categories():
         """デフォルトカテゴリー一覧"""
@@ -50,17 +101,35 @@ class CategoryModel:
         ]
     
     @staticmethod
-    def ensure_categories_exist():
-        """デフォルトカテゴリーをデータベースに登録"""
+    def get_catalog_checksum():
+        """デフォルトカテゴリー一覧のチェックサム（登録済みかどうかの判定に使う）"""
+        joined = "\n".join(CategoryModel.get_default_categories())
+        return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def ensure_categories_exist(force: bool = False):
+        """
+        デフォルトカテゴリーをデータベースに登録
+        保存済みのチェックサムが一致する場合は何もしない（force=True で必ず登録）
+        """
         default_categories = CategoryModel.get_default_categories()
+        checksum = CategoryModel.get_catalog_checksum()
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                # カテゴリーテーブルが存在するか確認
-                try:
-                    cursor.execute("SELECT 1 FROM categories LIMIT 1")
-                except:
-                    # テーブルが存在しない場合は作成
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    if not force:
+                        try:
+                            cursor.execute(
+                                "SELECT meta_value FROM app_meta WHERE meta_key = %s",
+                                (CATALOG_CHECKSUM_KEY,)
+                            )
+                            row = cursor.fetchone()
+                            if row and row["meta_value"] == checksum:
+                                return True
+                        except pymysql.err.ProgrammingError:
+                            # app_meta テーブルがまだない（マイグレーション 0006 が未適用）
+                            pass
+                    
                     cursor.execute("""
                     CREATE TABLE IF NOT EXISTS categories (
                         id INT AUTO_INCREMENT PRIMARY KEY,
@@ -68,16 +137,28 @@ class CategoryModel:
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                     """)
-                
-                # デフォルトカテゴリーを登録
-                for category in default_categories:
+                    
+                    # デフォルトカテゴリーを1回のINSERTで登録
+                    placeholders = ", ".join(["(%s)"] * len(default_categories))
+                    cursor.execute(
+                        f"INSERT IGNORE INTO categories (name) VALUES {placeholders}",
+                        default_categories
+                    )
+                    inserted = cursor.rowcount
+                    
                     cursor.execute(
-                        "INSERT IGNORE INTO categories (name) VALUES (%s)",
-                        (category,)
+                        """
+                        INSERT INTO app_meta (meta_key, meta_value) VALUES (%s, %s)
+                        ON DUPLICATE KEY UPDATE meta_value = VALUES(meta_value)
+                        """,
+                        (CATALOG_CHECKSUM_KEY, checksum)
                     )
             
-            connection.close()
+            if inserted:
+                # カテゴリーを登録したのでキャッシュ済みの一覧を破棄
+                from app.api.categories.catalog import category_catalog
+                category_catalog.invalidate()
             return True
-        except Exception as e:
-            print(f"Error ensuring categories: {e}")
-            return False
\ No newline at end of file
+        except Exception:
+            logger.exception("Error ensuring categories")
+            return False
@@ -1,19 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.api.categories.models import CategoryModel
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from app.api.categories.catalog import load_snapshot, etag_matches, CATEGORY_CACHE_MAX_AGE
 from typing import List
 
 router = APIRouter()
 
 @router.get("/", response_model=List[str])
-async def get_categories():
+async def get_categories(request: Request):
     """カテゴリー一覧を取得するエンドポイント"""
-    
-    # カテゴリーがデータベースにない場合はデフォルトカテゴリーを返す
-    categories = CategoryModel.get_all_categories()
-    
-    if not categories:
-        # データベースから取得できない場合はデフォルト値を返す
-        return CategoryModel.get_default_categories()
-    
-    # 名前のリストに変換
-    return [category["name"] for category in categories]
\ No newline at end of file
+
+    # キャッシュが有効な間はDBに問い合わせない
+    # （DBから取得できない場合はデフォルトカテゴリーが入っている）
+    snapshot = await load_snapshot()
+
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": f"public, max-age={CATEGORY_CACHE_MAX_AGE}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import Optional
+
+from app.api.categories.catalog import resolve_category_id
+from app.api.categories.models import CategoryModel
+from app.api.leaderboard.schemas import LeaderboardPage, MyRank
+from app.api.users.schemas import UserInDB
+from app.core.database import run_db
+from app.core.dependencies import get_current_active_user
+from app.services.leaderboard import leaderboards
+
+router = APIRouter()
+
+async def _ensure_listed(user: UserInDB):
+    """前回の再構築以降に登録された（他ワーカーで作成された）ユーザーをランキングに加える"""
+    if leaderboards.contains(user.user_id):
+        return
+    names = [name for name in (user.categories or "").split(",") if name]
+    category_ids = await run_db(CategoryModel.get_ids_by_names, names) if names else {}
+    leaderboards.add_user(user.user_id, user.name, user.point_total or 0, category_ids.values())
+
+@router.get("/top", response_model=LeaderboardPage)
+async def get_top(
+    limit: int = Query(10, ge=1, le=100),
+    category: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """ポイント上位のユーザー（category を指定するとカテゴリー内のランキング）"""
+    category_id = await resolve_category_id(category)
+    return {"category": category, "entries": leaderboards.top(limit, category_id)}
+
+@router.get("/me", response_model=MyRank)
+async def get_my_rank(
+    category: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """自分の順位"""
+    category_id = await resolve_category_id(category)
+    await _ensure_listed(current_user)
+    rank = leaderboards.rank(current_user.user_id, category_id)
+    if rank is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not ranked in this category"
+        )
+    return rank
+
+@router.get("/me/neighbors", response_model=LeaderboardPage)
+async def get_my_neighbors(
+    radius: int = Query(5, ge=0, le=50),
+    category: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """自分の前後 radius 人の順位"""
+    category_id = await resolve_category_id(category)
+    await _ensure_listed(current_user)
+    entries = leaderboards.neighbors(current_user.user_id, radius, category_id)
+    if entries is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not ranked in this category"
+        )
+    return {"category": category, "entries": entries}
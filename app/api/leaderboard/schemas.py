@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Optional, List
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    name: Optional[str] = None
+    point_total: int
+
+class MyRank(LeaderboardEntry):
+    total: int  # ランキングの参加人数
+
+class LeaderboardPage(BaseModel):
+    category: Optional[str] = None
+    entries: List[LeaderboardEntry]
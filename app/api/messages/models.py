@@ -0,0 +1,164 @@
+from app.core.database import get_db_connection
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MessageModel:
+    """メッセージモデル - 1対1メッセージと会話ごとの未読数の管理"""
+
+    @staticmethod
+    def conversation_key(user_id: int, other_user_id: int) -> str:
+        """2人のユーザーIDから会話キーを作る（順序に依存しない）"""
+        low, high = sorted((user_id, other_user_id))
+        return f"{low}:{high}"
+
+    @staticmethod
+    def send(sender_id: int, recipient_id: int, content: str):
+        """メッセージを保存し、受信者の未読数を1増やす"""
+        key = MessageModel.conversation_key(sender_id, recipient_id)
+        try:
+            with get_db_connection() as connection, connection.transaction():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        INSERT INTO messages (conversation_key, sender_id, recipient_id, content)
+                        VALUES (%s, %s, %s, %s)
+                        """,
+                        (key, sender_id, recipient_id, content)
+                    )
+                    message_id = cursor.lastrowid
+
+                    # 送信者・受信者の会話一覧を1文で更新（受信者側だけ未読を増やす）
+                    # 同時に送られた場合にコミット順が前後しても last_message_id は戻さない
+                    cursor.execute(
+                        """
+                        INSERT INTO message_unread_counts
+                            (user_id, conversation_key, other_user_id, unread_count, last_message_id)
+                        VALUES (%s, %s, %s, 1, %s), (%s, %s, %s, 0, %s)
+                        ON DUPLICATE KEY UPDATE
+                            unread_count = unread_count + VALUES(unread_count),
+                            last_message_id = GREATEST(last_message_id, VALUES(last_message_id))
+                        """,
+                        (recipient_id, key, sender_id, message_id,
+                         sender_id, key, recipient_id, message_id)
+                    )
+
+                    cursor.execute("SELECT * FROM messages WHERE message_id = %s", (message_id,))
+                    message = cursor.fetchone()
+            return message
+        except Exception:
+            logger.exception("Error sending message")
+            return None
+
+    @staticmethod
+    def list_messages(user_id: int, other_user_id: int, before_id: Optional[int] = None, limit: int = 50):
+        """
+        会話のメッセージを新しい順に取得（キーセットページング）
+        戻り値: (メッセージのリスト, 次ページのカーソル or None)
+        """
+        key = MessageModel.conversation_key(user_id, other_user_id)
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    if before_id is None:
+                        sql = """
+                        SELECT * FROM messages
+                        WHERE conversation_key = %s
+                        ORDER BY message_id DESC
+                        LIMIT %s
+                        """
+                        cursor.execute(sql, (key, limit + 1))
+                    else:
+                        sql = """
+                        SELECT * FROM messages
+                        WHERE conversation_key = %s AND message_id < %s
+                        ORDER BY message_id DESC
+                        LIMIT %s
+                        """
+                        cursor.execute(sql, (key, before_id, limit + 1))
+                    rows = cursor.fetchall()
+
+            # 1件多く取得して次のページがあるか判定する
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = rows[-1]["message_id"]
+            return rows, next_cursor
+        except Exception:
+            logger.exception("Error listing messages")
+            return None, None
+
+    @staticmethod
+    def mark_read(user_id: int, other_user_id: int, up_to_message_id: Optional[int] = None,
+                  message_ids: Optional[List[int]] = None):
+        """
+        会話内の自分宛て未読メッセージを1文でまとめて既読にし、未読数を既読にした件数だけ減らす
+        message_ids を指定した場合はそのメッセージだけ（空のリストなら何もしない）
+        戻り値: 既読にした件数（エラー時はNone）
+        """
+        if message_ids is not None and not message_ids:
+            return 0
+        key = MessageModel.conversation_key(user_id, other_user_id)
+        sql = """
+        UPDATE messages SET is_read = 1
+        WHERE recipient_id = %s AND conversation_key = %s AND is_read = 0
+        """
+        params = [user_id, key]
+        if up_to_message_id is not None:
+            sql += " AND message_id <= %s"
+            params.append(up_to_message_id)
+        if message_ids is not None:
+            placeholders = ", ".join(["%s"] * len(message_ids))
+            sql += f" AND message_id IN ({placeholders})"
+            params.extend(message_ids)
+
+        try:
+            with get_db_connection() as connection, connection.transaction():
+                with connection.cursor() as cursor:
+                    updated = cursor.execute(sql, params)
+                    if updated:
+                        cursor.execute(
+                            """
+                            UPDATE message_unread_counts
+                            SET unread_count = GREATEST(CAST(unread_count AS SIGNED) - %s, 0)
+                            WHERE user_id = %s AND conversation_key = %s
+                            """,
+                            (updated, user_id, key)
+                        )
+            return updated
+        except Exception:
+            logger.exception("Error marking messages as read")
+            return None
+
+    @staticmethod
+    def get_conversations(user_id: int, limit: int = 50):
+        """会話一覧と会話ごとの未読数（最新のメッセージ順）"""
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    sql = """
+                    SELECT conversation_key, other_user_id, unread_count, last_message_id
+                    FROM message_unread_counts
+                    WHERE user_id = %s
+                    ORDER BY last_message_id DESC
+                    LIMIT %s
+                    """
+                    cursor.execute(sql, (user_id, limit))
+                    conversations = cursor.fetchall()
+            return conversations
+        except Exception:
+            logger.exception("Error getting conversations")
+            return None
+
+    @staticmethod
+    def get_by_id(message_id: int):
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT * FROM messages WHERE message_id = %s", (message_id,))
+                    message = cursor.fetchone()
+            return message
+        except Exception:
+            logger.exception("Error getting message")
+            return None
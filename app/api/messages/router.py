@@ -0,0 +1,93 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from typing import List, Optional
+
+from app.api.messages.models import MessageModel
+from app.api.messages.schemas import Conversation, MarkReadRequest, Message, MessageCreate, MessagePage
+from app.api.users.models import UserModel
+from app.api.users.schemas import UserInDB
+from app.core.database import run_db
+from app.core.dependencies import get_current_active_user
+from app.services.realtime import realtime_hub
+
+router = APIRouter()
+
+@router.post("/", response_model=Message, status_code=status.HTTP_201_CREATED)
+async def send_message(message: MessageCreate, current_user: UserInDB = Depends(get_current_active_user)):
+    """メッセージ送信"""
+    if message.recipient_id == current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot send a message to yourself"
+        )
+
+    recipient = await run_db(UserModel.get_by_id, message.recipient_id)
+    if recipient is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recipient not found"
+        )
+
+    saved = await run_db(MessageModel.send, current_user.user_id, message.recipient_id, message.content)
+    if saved is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error sending message"
+        )
+
+    # 受信者の接続中クライアントに通知
+    await realtime_hub.publish(
+        [message.recipient_id],
+        {"type": "message.created", "message": jsonable_encoder(saved)},
+    )
+    return saved
+
+@router.get("/conversations", response_model=List[Conversation])
+async def get_conversations(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """会話一覧（会話ごとの未読数付き）"""
+    conversations = await run_db(MessageModel.get_conversations, current_user.user_id, limit)
+    if conversations is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error getting conversations"
+        )
+    return conversations
+
+@router.get("/conversations/{other_user_id}", response_model=MessagePage)
+async def get_messages(
+    other_user_id: int,
+    before: Optional[int] = Query(None, description="前のページの next_cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """会話のメッセージを新しい順に取得"""
+    messages, next_cursor = await run_db(
+        MessageModel.list_messages, current_user.user_id, other_user_id, before, limit
+    )
+    if messages is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error getting messages"
+        )
+    return {"messages": messages, "next_cursor": next_cursor}
+
+@router.post("/conversations/{other_user_id}/read")
+async def mark_messages_read(
+    other_user_id: int,
+    request: MarkReadRequest,
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """会話内の自分宛てメッセージをまとめて既読にする"""
+    updated = await run_db(
+        MessageModel.mark_read, current_user.user_id, other_user_id,
+        request.up_to_message_id, request.message_ids
+    )
+    if updated is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error marking messages as read"
+        )
+    return {"updated": updated}
@@ -0,0 +1,31 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+
+class MessageCreate(BaseModel):
+    recipient_id: int
+    content: str = Field(..., min_length=1, max_length=2000)
+
+class Message(BaseModel):
+    message_id: int
+    conversation_key: str
+    sender_id: int
+    recipient_id: int
+    content: str
+    is_read: bool
+    created_at: datetime
+
+class MessagePage(BaseModel):
+    messages: List[Message]
+    next_cursor: Optional[int] = None  # 次のページを取得するときに before に渡す message_id
+
+class MarkReadRequest(BaseModel):
+    # どちらも省略した場合は会話内の未読をすべて既読にする
+    up_to_message_id: Optional[int] = None
+    message_ids: Optional[List[int]] = Field(None, max_items=500)
+
+class Conversation(BaseModel):
+    conversation_key: str
+    other_user_id: int
+    unread_count: int
+    last_message_id: int
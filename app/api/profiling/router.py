@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional
+
+from app.api.profiling.schemas import ProfileSummary
+from app.api.users.schemas import UserInDB
+from app.core.dependencies import get_current_admin_user
+from app.core.profiling import profiler
+
+router = APIRouter()
+
+# 結果はワーカーごとのバッファにあるため、複数ワーカーの場合はプロファイルしたワーカーに当たったときだけ見える
+# （X-Profile-Id の先頭がワーカーのpid）
+
+@router.get("/", response_model=List[ProfileSummary])
+async def list_profiles(current_user: UserInDB = Depends(get_current_admin_user)):
+    """このワーカーに残っているプロファイル（新しい順）"""
+    return profiler.recent()
+
+@router.get("/collapsed", response_class=PlainTextResponse)
+async def read_collapsed_profiles(
+    path: Optional[str] = Query(None, description="このパスのリクエストだけを合算する"),
+    current_user: UserInDB = Depends(get_current_admin_user),
+):
+    """残っているプロファイルを合算した collapsed 形式のスタック（flamegraph.pl に渡せる）"""
+    return profiler.collapsed(path=path)
+
+@router.get("/{profile_id}", response_class=PlainTextResponse)
+async def read_profile(profile_id: str, current_user: UserInDB = Depends(get_current_admin_user)):
+    """1リクエスト分の collapsed 形式のスタック"""
+    collapsed = profiler.collapsed(profile_id)
+    if collapsed is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found (evicted or recorded by another worker)"
+        )
+    return collapsed
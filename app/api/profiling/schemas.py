@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import Optional
+
+class ProfileSummary(BaseModel):
+    profile_id: str
+    method: str
+    path: str
+    trigger: str  # header: X-Profile-Token による指定 / sampled: PROFILE_SAMPLE_RATE による抽出
+    started_at: float
+    duration_ms: Optional[float] = None
+    status: Optional[int] = None
+    samples: int
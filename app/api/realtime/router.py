@@ -0,0 +1,100 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+
+from app.core.dependencies import get_current_user
+from app.services.realtime import realtime_hub
+
+router = APIRouter()
+
+# SSE接続を維持するためのコメント送信間隔
+SSE_KEEPALIVE_SECONDS = 15
+
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
+
+async def _authenticate(token: Optional[str]):
+    """get_current_user と同じJWT検証（トークンがない場合も401）"""
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token)
+
+@router.websocket("/ws")
+async def realtime_websocket(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """
+    WebSocketでイベントを受け取る
+    ブラウザはヘッダーを付けられないため、トークンは ?token= でも受け付ける
+    """
+    token = token or _bearer_token(websocket.headers.get("authorization"))
+    try:
+        user = await _authenticate(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscription = realtime_hub.subscribe(user.user_id)
+
+    async def receive_until_disconnect():
+        # クライアントからのメッセージは使わない。切断の検知だけ行う
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            subscription.close("client disconnected")
+
+    receiver = asyncio.create_task(receive_until_disconnect())
+    try:
+        while True:
+            data = await subscription.get()
+            if data is None:
+                break
+            await websocket.send_text(data)
+        if subscription.close_reason == "slow consumer":
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        elif subscription.close_reason == "server shutdown":
+            await websocket.close(code=status.WS_1001_GOING_AWAY)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+        realtime_hub.unsubscribe(subscription)
+
+@router.get("/events")
+async def realtime_events(request: Request, token: Optional[str] = Query(None)):
+    """
+    Server-Sent Events でイベントを受け取る（WebSocketが使えない環境向け）
+    EventSource はヘッダーを付けられないため、トークンは ?token= でも受け付ける
+    """
+    token = _bearer_token(request.headers.get("authorization")) or token
+    user = await _authenticate(token)
+    subscription = realtime_hub.subscribe(user.user_id)
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    data = await subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if data is None:
+                    break
+                yield f"data: {data}\n\n"
+        finally:
+            realtime_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
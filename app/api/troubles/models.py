@@ -0,0 +1,119 @@
+from app.core.database import get_db_connection
+from datetime import datetime
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# カテゴリー名付きで取得するためのSELECT
+_SELECT_TROUBLE = """
+SELECT t.*, c.name AS category
+FROM troubles t
+LEFT JOIN categories c ON c.id = t.category_id
+"""
+
+class TroubleModel:
+    """お困りごとモデル - データベースとのやり取りを担当"""
+
+    @staticmethod
+    def create(user_id: int, title: str, description: str, category_id: Optional[int] = None):
+        try:
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    sql = """
+                    INSERT INTO troubles (user_id, title, description, category_id)
+                    VALUES (%s, %s, %s, %s)
+                    """
+                    cursor.execute(sql, (user_id, title, description, category_id))
+                    trouble_id = cursor.lastrowid
+                    cursor.execute(_SELECT_TROUBLE + " WHERE t.trouble_id = %s", (trouble_id,))
+                    trouble = cursor.fetchone()
+            return trouble
+        except Exception:
+            logger.exception("Error creating trouble")
+            return None
+
+    @staticmethod
+    def update(trouble_id: int, fields: dict):
+        """fields に含まれる列（title, description, category_id, status）だけ更新する"""
+        allowed = ("title", "description", "category_id", "status")
+        columns = [c for c in allowed if c in fields]
+        try:
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    if columns:
+                        assignments = ", ".join(f"{c} = %s" for c in columns)
+                        cursor.execute(
+                            f"UPDATE troubles SET {assignments} WHERE trouble_id = %s",
+                            [fields[c] for c in columns] + [trouble_id]
+                        )
+                    cursor.execute(_SELECT_TROUBLE + " WHERE t.trouble_id = %s", (trouble_id,))
+                    trouble = cursor.fetchone()
+            return trouble
+        except Exception:
+            logger.exception("Error updating trouble")
+            return None
+
+    @staticmethod
+    def get_by_id(trouble_id: int):
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(_SELECT_TROUBLE + " WHERE t.trouble_id = %s", (trouble_id,))
+                    trouble = cursor.fetchone()
+            return trouble
+        except Exception:
+            logger.exception("Error getting trouble")
+            return None
+
+    @staticmethod
+    def get_by_ids(trouble_ids: List[int]) -> Dict[int, dict]:
+        """複数件を1回のクエリで取得（trouble_id -> 行）"""
+        if not trouble_ids:
+            return {}
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    placeholders = ", ".join(["%s"] * len(trouble_ids))
+                    cursor.execute(
+                        _SELECT_TROUBLE + f" WHERE t.trouble_id IN ({placeholders})",
+                        list(trouble_ids)
+                    )
+                    rows = cursor.fetchall()
+            return {row["trouble_id"]: row for row in rows}
+        except Exception:
+            logger.exception("Error getting troubles")
+            return {}
+
+    @staticmethod
+    def get_batch_for_index(after_id: int = 0, limit: int = 1000):
+        """検索インデックス構築用にtrouble_id順で取得（キーセットページング）"""
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                sql = """
+                SELECT trouble_id, title, description, category_id, updated_at
+                FROM troubles
+                WHERE trouble_id > %s
+                ORDER BY trouble_id
+                LIMIT %s
+                """
+                cursor.execute(sql, (after_id, limit))
+                return cursor.fetchall()
+
+    @staticmethod
+    def get_updated_since(since: datetime, after_id: int = 0, limit: int = 1000):
+        """
+        検索インデックスの差分同期用: since 以降に作成・更新されたものを (updated_at, trouble_id) 順に取得
+        続きは最後の行の updated_at と trouble_id を渡して取得する
+        """
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                sql = """
+                SELECT trouble_id, title, description, category_id, updated_at
+                FROM troubles
+                WHERE updated_at > %s OR (updated_at = %s AND trouble_id > %s)
+                ORDER BY updated_at, trouble_id
+                LIMIT %s
+                """
+                cursor.execute(sql, (since, since, after_id, limit))
+                return cursor.fetchall()
@@ -0,0 +1,125 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+
+from app.api.categories.catalog import resolve_category_id
+from app.api.troubles.models import TroubleModel
+from app.api.troubles.schemas import (
+    Trouble, TroubleCreate, TroubleHelpersResponse, TroubleSearchResponse, TroubleUpdate,
+)
+from app.api.users.models import UserModel
+from app.api.users.schemas import UserInDB
+from app.core.database import run_db
+from app.core.dependencies import get_current_active_user
+from app.services.helper_matching import helper_matcher
+from app.services.trouble_search import trouble_search_index
+
+router = APIRouter()
+
+def _index(trouble: dict):
+    trouble_search_index.add(
+        trouble["trouble_id"], trouble["title"], trouble["description"], trouble["category_id"]
+    )
+
+@router.post("/", response_model=Trouble, status_code=status.HTTP_201_CREATED)
+async def create_trouble(trouble: TroubleCreate, current_user: UserInDB = Depends(get_current_active_user)):
+    """お困りごとを登録"""
+    category_id = await resolve_category_id(trouble.category)
+    created = await run_db(
+        TroubleModel.create, current_user.user_id, trouble.title, trouble.description, category_id
+    )
+    if created is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error creating trouble"
+        )
+    await run_in_threadpool(_index, created)
+    return created
+
+@router.get("/search", response_model=TroubleSearchResponse)
+async def search_troubles(
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """似ているお困りごとを検索（スコア順）"""
+    category_id = await resolve_category_id(category)
+    # 一般的な語だけのクエリは採点する候補が多くなるため、イベントループを止めないようにスレッドで実行する
+    total, is_estimate, hits = await run_in_threadpool(trouble_search_index.search, q, category_id, limit)
+    troubles = await run_db(TroubleModel.get_by_ids, [trouble_id for trouble_id, _ in hits])
+    return {
+        "query": q,
+        "total_candidates": total,
+        "total_is_estimate": is_estimate,
+        "results": [
+            {"trouble_id": trouble_id, "score": score, "trouble": troubles.get(trouble_id)}
+            for trouble_id, score in hits
+            if trouble_id in troubles
+        ],
+    }
+
+@router.get("/{trouble_id}", response_model=Trouble)
+async def get_trouble(trouble_id: int, current_user: UserInDB = Depends(get_current_active_user)):
+    trouble = await run_db(TroubleModel.get_by_id, trouble_id)
+    if trouble is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trouble not found"
+        )
+    return trouble
+
+@router.get("/{trouble_id}/helpers", response_model=TroubleHelpersResponse)
+async def get_trouble_helpers(
+    trouble_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """お困りごとに答えられそうなユーザー（カテゴリーの一致と回答数・ポイントでスコア順。登録者は除く）"""
+    trouble = await run_db(TroubleModel.get_by_id, trouble_id)
+    if trouble is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trouble not found"
+        )
+    category_ids = [trouble["category_id"]] if trouble["category_id"] is not None else []
+    matches = helper_matcher.top(category_ids, limit, exclude=(trouble["user_id"],))
+    names = await run_db(UserModel.get_names_by_ids, [user_id for user_id, _, _ in matches])
+    return {
+        "trouble_id": trouble_id,
+        "helpers": [
+            {"user_id": user_id, "name": names.get(user_id), "score": score, "matched_categories": overlap}
+            for user_id, score, overlap in matches
+        ],
+    }
+
+@router.put("/{trouble_id}", response_model=Trouble)
+async def update_trouble(
+    trouble_id: int,
+    update: TroubleUpdate,
+    current_user: UserInDB = Depends(get_current_active_user),
+):
+    """お困りごとを編集（登録者のみ）"""
+    trouble = await run_db(TroubleModel.get_by_id, trouble_id)
+    if trouble is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trouble not found"
+        )
+    if trouble["user_id"] != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to edit this trouble"
+        )
+
+    fields = update.dict(exclude_unset=True)
+    if "category" in fields:
+        fields["category_id"] = await resolve_category_id(fields.pop("category"))
+    updated = await run_db(TroubleModel.update, trouble_id, fields)
+    if updated is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error updating trouble"
+        )
+    await run_in_threadpool(_index, updated)
+    return updated
@@ -0,0 +1,46 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+
+class TroubleCreate(BaseModel):
+    title: str = Field(..., min_length=1, max_length=200)
+    description: str = Field(..., min_length=1, max_length=10000)
+    category: Optional[str] = None  # カテゴリー名
+
+class TroubleUpdate(BaseModel):
+    title: Optional[str] = Field(None, min_length=1, max_length=200)
+    description: Optional[str] = Field(None, min_length=1, max_length=10000)
+    category: Optional[str] = None
+    status: Optional[str] = Field(None, regex="^(open|resolved|closed)$")
+
+class Trouble(BaseModel):
+    trouble_id: int
+    user_id: int
+    title: str
+    description: str
+    category_id: Optional[int] = None
+    category: Optional[str] = None
+    status: str
+    created_at: datetime
+    updated_at: datetime
+
+class TroubleSearchResult(BaseModel):
+    trouble_id: int
+    score: float
+    trouble: Optional[Trouble] = None
+
+class TroubleSearchResponse(BaseModel):
+    query: str
+    total_candidates: int
+    total_is_estimate: bool = False  # 枝刈りで打ち切った場合 total_candidates は下限
+    results: List[TroubleSearchResult]
+
+class HelperCandidate(BaseModel):
+    user_id: int
+    name: Optional[str] = None
+    score: float
+    matched_categories: int  # お困りごとのカテゴリーと重なった数
+
+class TroubleHelpersResponse(BaseModel):
+    trouble_id: int
+    helpers: List[HelperCandidate]
@@ -1,6 +1,14 @@
+from app.api.categories.models import CategoryModel
+from app.core.cache import principal_cache
 from app.core.database import get_db_connection
+from app.services.counters import user_counter_buffer
+from app.services.helper_matching import helper_matcher
+from app.services.leaderboard import leaderboards
 from app.api.users.schemas import UserInDB, UserCreate
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 class UserModel:
     """ユーザーモデル - データベースとのやり取りを担当"""
@@ -8,114 +16,245 @@ class UserModel:
     @staticmethod
     def get_by_username(username: str):
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                sql = "SELECT * FROM users WHERE name = %s"
-                cursor.execute(sql, (username,))
-                user_data = cursor.fetchone()
-                
-            connection.close()
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    sql = "SELECT * FROM users WHERE name = %s"
+                    cursor.execute(sql, (username,))
+                    user_data = cursor.fetchone()
             
             if user_data:
                 return UserInDB(**user_data)
             return None
-        except Exception as e:
-            print(f"Database error: {e}")
+        except Exception:
+            logger.exception("Database error")
             return None
     
     @staticmethod
     def get_by_id(user_id: int):
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                sql = "SELECT * FROM users WHERE user_id = %s"
-                cursor.execute(sql, (user_id,))
-                user_data = cursor.fetchone()
-                
-            connection.close()
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    sql = "SELECT * FROM users WHERE user_id = %s"
+                    cursor.execute(sql, (user_id,))
+                    user_data = cursor.fetchone()
             
             if user_data:
                 return UserInDB(**user_data)
             return None
-        except Exception as e:
-            print(f"Database error: {e}")
+        except Exception:
+            logger.exception("Database error")
             return None
     
+    @staticmethod
+    def get_names_by_ids(user_ids):
+        """user_id -> name（1回のクエリで取得）"""
+        if not user_ids:
+            return {}
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    placeholders = ", ".join(["%s"] * len(user_ids))
+                    cursor.execute(
+                        f"SELECT user_id, name FROM users WHERE user_id IN ({placeholders})", list(user_ids)
+                    )
+                    rows = cursor.fetchall()
+            return {row["user_id"]: row["name"] for row in rows}
+        except Exception:
+            logger.exception("Database error")
+            return {}
+    
+    @staticmethod
+    def get_by_category(category_id: int, limit: int = 50, after_user_id: int = 0):
+        """
+        カテゴリーに所属するユーザーをuser_id順に取得
+        user_categories の (category_id, user_id) インデックスを使ったキーセットページング
+        次のページは最後のuser_idを after_user_id に渡す
+        """
+        try:
+            with get_db_connection(read_only=True) as connection:
+                with connection.cursor() as cursor:
+                    sql = """
+                    SELECT u.*
+                    FROM user_categories uc
+                    JOIN users u ON u.user_id = uc.user_id
+                    WHERE uc.category_id = %s AND uc.user_id > %s
+                    ORDER BY uc.user_id
+                    LIMIT %s
+                    """
+                    cursor.execute(sql, (category_id, after_user_id, limit))
+                    rows = cursor.fetchall()
+            return [UserInDB(**row) for row in rows]
+        except Exception:
+            logger.exception("Database error")
+            return []
+    
     @staticmethod
     def create(user: UserCreate, password: str):
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                sql = """
-                INSERT INTO users (name, password, category_id, last_login_at) 
-                VALUES (%s, %s, %s, NOW())
-                """
-                cursor.execute(sql, (user.name, password, user.category_id if hasattr(user, 'category_id') else None))
-                user_id = cursor.lastrowid
-            connection.close()
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    sql = """
+                    INSERT INTO users (name, password, category_id, last_login_at) 
+                    VALUES (%s, %s, %s, NOW())
+                    """
+                    cursor.execute(sql, (user.name, password, user.category_id if hasattr(user, 'category_id') else None))
+                    user_id = cursor.lastrowid
             
             return user_id
-        except Exception as e:
-            print(f"Database error: {e}")
+        except Exception:
+            logger.exception("Database error")
             return None
     
     @staticmethod
     def create_with_categories(name: str, password: str, categories: str = None):
         """カテゴリー付きでユーザーを作成"""
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                # ユーザーテーブルにcategoriesカラムがない場合は追加する必要があります
-                # ALTER TABLE users ADD COLUMN categories VARCHAR(255);
+            with get_db_connection() as connection, connection.transaction():
+                with connection.cursor() as cursor:
+                    # ユーザーテーブルにcategoriesカラムがない場合は追加する必要があります
+                    # ALTER TABLE users ADD COLUMN categories VARCHAR(255);
                 
-                sql = """
-                INSERT INTO users (name, password, categories, last_login_at) 
-                VALUES (%s, %s, %s, NOW())
-                """
-                cursor.execute(sql, (name, password, categories))
-                user_id = cursor.lastrowid
-            connection.close()
+                    sql = """
+                    INSERT INTO users (name, password, categories, last_login_at) 
+                    VALUES (%s, %s, %s, NOW())
+                    """
+                    cursor.execute(sql, (name, password, categories))
+                    user_id = cursor.lastrowid
+                    
+                    # 正規化テーブルにも書き込む（カテゴリーは作成しない。未登録の名前は users.categories にだけ残る）
+                    category_ids = {}
+                    if categories:
+                        category_ids = CategoryModel.get_ids_by_names(categories.split(","), cursor)
+                        cursor.executemany(
+                            "INSERT IGNORE INTO user_categories (user_id, category_id) VALUES (%s, %s)",
+                            [(user_id, category_id) for category_id in category_ids.values()],
+                        )
             
+            leaderboards.add_user(user_id, name, 0, category_ids.values())
+            helper_matcher.add_user(user_id, category_ids.values())
             return user_id
-        except Exception as e:
-            print(f"Database error: {e}")
+        except Exception:
+            logger.exception("Database error")
             return None
     
     @staticmethod
-    def update_last_login(user_id: int):
-        try:
-            connection = get_db_connection()
+    def get_existing_names(names):
+        """names のうち既に登録されているユーザー名の集合（IN でまとめて1往復）"""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return set()
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                placeholders = ", ".join(["%s"] * len(names))
+                cursor.execute(f"SELECT name FROM users WHERE name IN ({placeholders})", names)
+                return {row["name"] for row in cursor.fetchall()}
+
+    @staticmethod
+    def bulk_create(users):
+        """
+        ユーザーをまとめて作成（1トランザクション）
+        users: [(name, ハッシュ済みパスワード, カテゴリー名のリスト), ...]
+        戻り値: {name: user_id}
+        名前の重複（他のリクエストと競合した場合など）は IntegrityError のまま呼び出し元へ送出する
+        """
+        if not users:
+            return {}
+        with get_db_connection() as connection, connection.transaction():
             with connection.cursor() as cursor:
-                sql = "UPDATE users SET last_login_at = NOW() WHERE user_id = %s"
-                cursor.execute(sql, (user_id,))
-            connection.close()
+                # create_with_categories と同じく last_login_at は登録時刻（DBの時計）。
+                # VALUES に NOW() を書くと executemany が複数行 INSERT にまとめられないので、値として渡す
+                cursor.execute("SELECT NOW() AS now")
+                now = cursor.fetchone()["now"]
+                cursor.executemany(
+                    "INSERT INTO users (name, password, categories, last_login_at) VALUES (%s, %s, %s, %s)",
+                    [(name, password, ",".join(categories) or None, now) for name, password, categories in users],
+                )
+                names = [name for name, _, _ in users]
+                placeholders = ", ".join(["%s"] * len(names))
+                cursor.execute(f"SELECT user_id, name FROM users WHERE name IN ({placeholders})", names)
+                user_ids = {row["name"]: row["user_id"] for row in cursor.fetchall()}
+
+                category_ids = CategoryModel.get_ids_by_names(
+                    [c for _, _, categories in users for c in categories], cursor
+                )
+                links = [
+                    (user_ids[name], category_ids[c])
+                    for name, _, categories in users for c in dict.fromkeys(categories) if c in category_ids
+                ]
+                if links:
+                    cursor.executemany(
+                        "INSERT IGNORE INTO user_categories (user_id, category_id) VALUES (%s, %s)", links
+                    )
+
+        for name, _, categories in users:
+            user_category_ids = [category_ids[c] for c in dict.fromkeys(categories) if c in category_ids]
+            leaderboards.add_user(user_ids[name], name, 0, user_category_ids)
+            helper_matcher.add_user(user_ids[name], user_category_ids)
+        return user_ids
+
+    @staticmethod
+    def update_password(user_id: int, password: str):
+        try:
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    sql = "UPDATE users SET password = %s WHERE user_id = %s"
+                    cursor.execute(sql, (password, user_id))
+            principal_cache.invalidate_user(user_id)
             return True
-        except Exception as e:
-            print(f"Error updating last login: {e}")
+        except Exception:
+            logger.exception("Error updating password")
             return False
     
     @staticmethod
-    def update_points(user_id: int, points: int):
+    def update_last_login(user_id: int, sync: bool = False):
+        """sync=False の場合はライトビハインドバッファ経由でまとめて書き込む"""
+        if not sync and user_counter_buffer.touch_login(user_id):
+            return True
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                sql = "UPDATE users SET point_total = point_total + %s WHERE user_id = %s"
-                cursor.execute(sql, (points, user_id))
-            connection.close()
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    sql = "UPDATE users SET last_login_at = NOW() WHERE user_id = %s"
+                    cursor.execute(sql, (user_id,))
+            principal_cache.invalidate_user(user_id)
             return True
-        except Exception as e:
-            print(f"Error updating points: {e}")
+        except Exception:
+            logger.exception("Error updating last login")
             return False
     
     @staticmethod
-    def increment_answers(user_id: int):
+    def update_points(user_id: int, points: int, sync: bool = False):
+        """sync=False の場合はライトビハインドバッファ経由でまとめて書き込む"""
+        if not sync and user_counter_buffer.add_points(user_id, points):
+            leaderboards.apply_delta(user_id, points)
+            helper_matcher.apply_points(user_id, points)
+            return True
         try:
-            connection = get_db_connection()
-            with connection.cursor() as cursor:
-                sql = "UPDATE users SET num_answer = num_answer + 1 WHERE user_id = %s"
-                cursor.execute(sql, (user_id,))
-            connection.close()
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    sql = "UPDATE users SET point_total = point_total + %s WHERE user_id = %s"
+                    cursor.execute(sql, (points, user_id))
+            principal_cache.invalidate_user(user_id)
+            leaderboards.apply_delta(user_id, points)
+            helper_matcher.apply_points(user_id, points)
+            return True
+        except Exception:
+            logger.exception("Error updating points")
+            return False
+    
+    @staticmethod
+    def increment_answers(user_id: int, sync: bool = False):
+        """sync=False の場合はライトビハインドバッファ経由でまとめて書き込む"""
+        if not sync and user_counter_buffer.add_answers(user_id):
+            helper_matcher.add_answers(user_id)
+            return True
+        try:
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    sql = "UPDATE users SET num_answer = num_answer + 1 WHERE user_id = %s"
+                    cursor.execute(sql, (user_id,))
+            principal_cache.invalidate_user(user_id)
+            helper_matcher.add_answers(user_id)
             return True
-        except Exception as e:
-            print(f"Error updating answer count: {e}")
+        except Exception:
+            logger.exception("Error updating answer count")
             return False
\ No newline at end of file
@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.core.dependencies import get_current_active_user
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from typing import Optional
+from app.api.categories.catalog import resolve_category_id
+from app.core.database import run_db
+from app.core.dependencies import get_current_active_user, get_current_admin_user
 from app.api.users.models import UserModel
-from app.api.users.schemas import User, UserInDB
+from app.api.users.schemas import User, UserInDB, UserImportReport
+from app.services.user_import import FORMATS, ImportFormatError, detect_format, import_users
+from app.services import user_export
 
 router = APIRouter()
 
@@ -14,7 +20,7 @@ async def read_users_me(current_user: UserInDB = Depends(get_current_active_user
 
 @router.post("/points")
 async def update_user_points(points: int, current_user: UserInDB = Depends(get_current_active_user)):
-    success = UserModel.update_points(current_user.user_id, points)
+    success = await run_db(UserModel.update_points, current_user.user_id, points)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -25,11 +31,58 @@ async def update_user_points(points: int, current_user: UserInDB = Depends(get_c
 
 @router.post("/answers")
 async def increment_user_answers(current_user: UserInDB = Depends(get_current_active_user)):
-    success = UserModel.increment_answers(current_user.user_id)
+    success = await run_db(UserModel.increment_answers, current_user.user_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error updating answer count"
         )
     
-    return {"message": f"Incremented answer count for user {current_user.name}"}
\ No newline at end of file
+    return {"message": f"Incremented answer count for user {current_user.name}"}
+
+@router.post("/import", response_model=UserImportReport)
+async def import_users_endpoint(
+    request: Request,
+    format: Optional[str] = Query(None, description="csv または ndjson（省略時は Content-Type から判定）"),
+    current_user: UserInDB = Depends(get_current_admin_user),
+):
+    """
+    ユーザーの一括登録（管理者のみ）
+    リクエストボディに CSV（text/csv）または NDJSON（application/x-ndjson）をそのまま送る
+    """
+    fmt = format or detect_format(request.headers.get("content-type"))
+    if fmt not in FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson, or specify ?format=csv|ndjson"
+        )
+    try:
+        return await import_users(request.stream(), fmt)
+    except ImportFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/export")
+async def export_users(
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    category: Optional[str] = Query(None, description="このカテゴリーに所属するユーザーだけ"),
+    last_login_from: Optional[datetime] = Query(None, description="最終ログインがこの日時以降"),
+    last_login_to: Optional[datetime] = Query(None, description="最終ログインがこの日時より前"),
+    current_user: UserInDB = Depends(get_current_admin_user),
+):
+    """
+    ユーザーの一括書き出し（管理者のみ）
+    ポイント・回答数・カテゴリー付きで user_id 順に NDJSON または CSV で返す（全体をメモリに載せずに流す）
+    """
+    category_id = await resolve_category_id(category)
+    exporter = user_export.UserExporter(format, category_id, last_login_from, last_login_to)
+    try:
+        await exporter.open()
+    except user_export.ExportBusy:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many exports in progress"
+        )
+    return user_export.UserExportResponse(exporter, f"users.{format}")
@@ -30,4 +30,24 @@ class UserCreate(BaseModel):
 class UserUpdate(BaseModel):
     name: Optional[str] = None
     category_id: Optional[int] = None
-    categories: Optional[List[str]] = None
\ No newline at end of file
+    categories: Optional[List[str]] = None
+
+class UserImportRow(BaseModel):
+    """一括登録の1行（UserCreate と同じ制約。確認用パスワードはない）"""
+    name: str = Field(..., min_length=2, max_length=50)
+    password: str = Field(..., min_length=6)
+    categories: Optional[List[str]] = None
+
+class UserImportRowResult(BaseModel):
+    row: int  # 1始まり（CSVのヘッダー行は数えない）
+    name: Optional[str] = None
+    status: str  # created / exists / duplicate / invalid / error
+    user_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class UserImportReport(BaseModel):
+    total: int
+    created: int
+    failed: int
+    truncated: bool = False  # USER_IMPORT_MAX_ROWS を超えた分は読まずに打ち切った
+    results: List[UserImportRowResult]
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# 認証済みユーザーキャッシュの設定
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
+
+
+class PrincipalCache:
+    """
+    認証済みユーザー（UserInDB）のTTL付きLRUキャッシュ
+    - キーはトークンのsubject（ユーザー名）
+    - 有効期限は TTL とトークンの exp の早い方
+    - user_id 単位で無効化できる（UserModel の書き込み時に呼ばれる）
+    """
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_MAX_SIZE, ttl: float = PRINCIPAL_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # subject -> (expires_at(monotonic), user)
+        self._entries = OrderedDict()
+        # user_id -> subject
+        self._subjects_by_id = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, subject: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= now:
+                self._remove(subject)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            return user
+
+    def set(self, subject: str, user, token_exp: Optional[float] = None):
+        """token_exp はトークンの exp（UNIX時刻）"""
+        ttl = self.ttl
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            if subject in self._entries:
+                self._remove(subject)
+            self._entries[subject] = (expires_at, user)
+            self._subjects_by_id[user.user_id] = subject
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            subject = self._subjects_by_id.get(user_id)
+            if subject is not None:
+                self._remove(subject)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._subjects_by_id.clear()
+
+    def _remove(self, subject: str):
+        _, user = self._entries.pop(subject)
+        if self._subjects_by_id.get(user.user_id) == subject:
+            del self._subjects_by_id[user.user_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache()
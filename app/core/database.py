@@ -1,11 +1,30 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
 import pymysql
-from pymysql.cursors import DictCursor
+from pymysql.constants.SERVER_STATUS import SERVER_STATUS_IN_TRANS
+from pymysql.cursors import DictCursor, SSDictCursor
 from dotenv import load_dotenv
 
+from app.core.metrics import record_db_time
+from app.core.profiling import bind_thread
+from app.core.query_trace import record_query
+
 # 環境変数の読み込み
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # データベース接続設定
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_USER = os.getenv("DB_USER", "root")
@@ -13,19 +32,714 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_NAME = os.getenv("DB_NAME", "collabodb")
 DB_PORT = int(os.getenv("DB_PORT", "3306"))
 
-# データベース接続関数
-def get_db_connection():
-    connection = pymysql.connect(
-        host=DB_HOST,
+# 読み取り用レプリカ（"host:port" のカンマ区切り。ユーザー・パスワード・DB名はプライマリと同じ）
+DB_REPLICA_HOSTS = os.getenv("DB_REPLICA_HOSTS", "")
+# 書き込んだ後、同じユーザーの読み取りをプライマリに向ける秒数（レプリカの遅延を吸収する）
+DB_READ_STICKY_SECONDS = float(os.getenv("DB_READ_STICKY_SECONDS", "5"))
+# 接続に失敗したレプリカを使わない秒数（過ぎたら再び試す）
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
+# 書き込み後のスティッキー状態を覚えておくユーザー数の上限
+DB_READ_STICKY_MAX_KEYS = int(os.getenv("DB_READ_STICKY_MAX_KEYS", "100000"))
+
+# コネクションプール設定
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_RECYCLE_SECONDS = float(os.getenv("DB_POOL_RECYCLE_SECONDS", "3600"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "5"))
+# しばらく使われていない接続だけチェックアウト時にpingする
+DB_POOL_PING_INTERVAL_SECONDS = float(os.getenv("DB_POOL_PING_INTERVAL_SECONDS", "30"))
+DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv("DB_CONNECT_TIMEOUT_SECONDS", "5"))
+# 非同期ハンドラからDB処理を実行するスレッド数（プール上限を超えても接続待ちになるだけなので揃える）
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_MAX_SIZE)))
+
+
+class PoolTimeoutError(Exception):
+    """プールから接続を取得できずにタイムアウトした"""
+
+
+class _TracingMixin:
+    """実行したSQLの時間と行数を app.core.query_trace に記録するカーソル"""
+
+    # executemany 中は内部の execute を個別に記録しない
+    _in_executemany = False
+
+    def execute(self, query, args=None):
+        if self._in_executemany:
+            return super().execute(query, args)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, args):
+        self._in_executemany = True
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, args)
+        finally:
+            self._in_executemany = False
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+
+class TracingCursor(_TracingMixin, DictCursor):
+    pass
+
+
+class StreamingCursor(_TracingMixin, SSDictCursor):
+    """
+    結果をクライアント側にためず、fetchmany() のたびにサーバーから読むカーソル（大量の行の書き出し用）
+    読み切るまでその接続では他のSQLを実行できない。途中でやめる場合は残りを読まずに接続ごと捨てる
+    （release(broken=True)）
+    """
+
+
+def _connect(host=DB_HOST, port=DB_PORT):
+    """MySQLへの物理接続を1本作成する"""
+    return pymysql.connect(
+        host=host,
         user=DB_USER,
         password=DB_PASSWORD,
         db=DB_NAME,
-        port=DB_PORT,
+        port=port,
         charset='utf8mb4',
-        cursorclass=DictCursor,
-        autocommit=True
+        cursorclass=TracingCursor,
+        autocommit=True,
+        connect_timeout=DB_CONNECT_TIMEOUT_SECONDS,
     )
-    return connection
+
+
+class _PoolEntry:
+    """プール内の物理接続と、その作成・最終利用時刻"""
+
+    __slots__ = ("raw", "created_at", "last_used_at")
+
+    def __init__(self, raw):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used_at = now
+
+
+class PooledConnection:
+    """
+    プールから貸し出された接続
+    close() または with ブロックの終了で物理接続を閉じずにプールへ返却する
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def __getattr__(self, name):
+        entry = self.__dict__.get("_entry")
+        if entry is None:
+            raise pymysql.err.InterfaceError(0, "Connection already returned to pool")
+        return getattr(entry.raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(broken=exc_type is not None and issubclass(
+            exc_type, (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+        ))
+        return False
+
+    def close(self):
+        self.release()
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN〜COMMITで囲む。例外時はROLLBACKする"""
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+    def release(self, broken: bool = False):
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry, broken)
+
+
+class ConnectionPool:
+    """
+    pymysql用のスレッドセーフなコネクションプール
+    - min_size 本は常に保持し、max_size 本までは必要に応じて作成する
+    - チェックアウト時に長く使われていなかった接続はpingで生存確認する
+    - recycle_seconds を超えた接続は破棄して作り直す
+    - 空きがない場合は timeout 秒まで待ち、超えたら PoolTimeoutError
+    """
+
+    def __init__(self, connect=_connect, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 recycle_seconds=DB_POOL_RECYCLE_SECONDS, timeout=DB_POOL_TIMEOUT_SECONDS,
+                 ping_interval=DB_POOL_PING_INTERVAL_SECONDS):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("invalid pool size")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.recycle_seconds = recycle_seconds
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+
+        # 統計情報
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._wait_count = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _is_stale(self, entry, now):
+        return self.recycle_seconds > 0 and now - entry.created_at > self.recycle_seconds
+
+    def _is_alive(self, entry, now):
+        if now - entry.last_used_at < self.ping_interval:
+            return True
+        try:
+            entry.raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _close_raw(self, entry):
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+
+    def _fill_min(self):
+        """最小接続数まで事前に接続を作成する（失敗しても例外は投げない）"""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = _PoolEntry(self._connect())
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                return
+            with self._cond:
+                self._created += 1
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def acquire(self):
+        """プールから接続を借りる"""
+        if self._size < self.min_size:
+            self._fill_min()
+
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            entry = None
+            create = False
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.timeout}s waiting for a database connection"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    create = True
+                self._size += create
+                self._in_use += 1
+
+            if create:
+                try:
+                    entry = _PoolEntry(self._connect())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+            else:
+                now = time.monotonic()
+                if self._is_stale(entry, now) or not self._is_alive(entry, now):
+                    # 古い・切断された接続は捨てて取り直す
+                    self._close_raw(entry)
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._discarded += 1
+                        self._cond.notify()
+                    continue
+
+            wait_time = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._wait_count += 1
+                    self._wait_time_total += wait_time
+                    self._wait_time_max = max(self._wait_time_max, wait_time)
+            return PooledConnection(self, entry)
+
+    def _release(self, entry, broken=False):
+        now = time.monotonic()
+        if not broken:
+            try:
+                # 途中で終わったトランザクションを持ち越さない
+                raw = entry.raw
+                if not raw.get_autocommit() or raw.server_status & SERVER_STATUS_IN_TRANS:
+                    raw.rollback()
+                    raw.autocommit(True)
+            except Exception:
+                broken = True
+        discard = broken or not entry.raw.open or self._is_stale(entry, now)
+        if discard:
+            self._close_raw(entry)
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._size -= 1
+                self._discarded += 1
+            else:
+                entry.last_used_at = now
+                self._idle.append(entry)
+            self._cond.notify()
+
+    def close(self):
+        """アイドル接続をすべて閉じる（貸出中の接続は返却時に再利用される）"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for entry in idle:
+            self._close_raw(entry)
+
+    def stats(self) -> dict:
+        """プールの利用状況"""
+        with self._cond:
+            return {
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "wait_count": self._wait_count,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 3),
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+            }
+
+
+def parse_hosts(value: str) -> List[Tuple[str, int]]:
+    """"host1:3306,host2" -> [("host1", 3306), ("host2", DB_PORT)]"""
+    hosts = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":") if ":" in item else (item, "", "")
+        hosts.append((host, int(port) if port else DB_PORT))
+    return hosts
+
+
+# 接続が切れたことを表すエラーコード（SQL自体のエラーやタイムアウトはプライマリで実行し直さない）
+_DISCONNECT_ERRORS = {
+    1053,  # ER_SERVER_SHUTDOWN
+    2003,  # CR_CONN_HOST_ERROR
+    2006,  # CR_SERVER_GONE_ERROR
+    2013,  # CR_SERVER_LOST
+    2055,  # CR_SERVER_LOST_EXTENDED
+}
+
+
+def _is_disconnect(error: Exception) -> bool:
+    if isinstance(error, pymysql.err.InterfaceError):
+        return True
+    return bool(error.args) and error.args[0] in _DISCONNECT_ERRORS
+
+
+class ReplicaConnection(PooledConnection):
+    """
+    レプリカから貸し出された接続
+    SQLの実行中にレプリカとの接続が切れた場合は、そのレプリカを外し、
+    プライマリの接続に差し替えて同じSQLを実行し直す（1回だけ。トランザクション中は実行し直さない）
+    """
+
+    def __init__(self, connection: PooledConnection, on_disconnect):
+        super().__init__(None, None)
+        self._take(connection)
+        self._on_disconnect = on_disconnect
+        self.failed_over = False
+
+    def _take(self, connection: PooledConnection):
+        """connection の物理接続を引き継ぐ（返却はこちらから行う）"""
+        self._pool, self._entry, connection._entry = connection._pool, connection._entry, None
+
+    def cursor(self, cursor=None):
+        return _FailoverCursor(self, cursor)
+
+    def _can_fail_over(self, error: Exception) -> bool:
+        entry = self.__dict__.get("_entry")
+        return (
+            not self.failed_over and entry is not None and _is_disconnect(error)
+            and not entry.raw.server_status & SERVER_STATUS_IN_TRANS
+        )
+
+    def _fail_over(self):
+        self.release(broken=True)
+        self._on_disconnect()
+        self._take(get_pool().acquire())
+        self.failed_over = True
+
+
+class _FailoverCursor:
+    """ReplicaConnection のカーソル。execute / executemany で接続が切れたらプライマリで実行し直す"""
+
+    def __init__(self, connection: ReplicaConnection, cursorclass=None):
+        self._connection = connection
+        self._cursorclass = cursorclass
+        self._cursor = connection._entry.raw.cursor(cursorclass)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+        return False
+
+    def execute(self, query, args=None):
+        return self._run("execute", query, args)
+
+    def executemany(self, query, args):
+        return self._run("executemany", query, args)
+
+    def _run(self, method, query, args):
+        try:
+            return getattr(self._cursor, method)(query, args)
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as e:
+            if not self._connection._can_fail_over(e):
+                raise
+            logger.warning("Replica connection lost during a query; retrying it on the primary: %s", e)
+        self._connection._fail_over()
+        self._cursor = self._connection._entry.raw.cursor(self._cursorclass)
+        return getattr(self._cursor, method)(query, args)
+
+
+class ReplicaSet:
+    """
+    読み取り用レプリカのプール群
+    - ラウンドロビンで選び、接続できなかった（またはSQL実行中に切れた）レプリカは
+      retry_seconds の間外す（フェイルオーバー）
+    - 手元のプールが埋まっているだけ（PoolTimeoutError）のレプリカは外さず、次のレプリカを試す
+    - 使えるレプリカがなければ None（呼び出し側がプライマリを使う）
+    """
+
+    def __init__(self, hosts: List[Tuple[str, int]], retry_seconds: float = DB_REPLICA_RETRY_SECONDS):
+        self.hosts = hosts
+        self.retry_seconds = retry_seconds
+        self.pools = [ConnectionPool(connect=functools.partial(_connect, host, port)) for host, port in hosts]
+        self._down_until = [0.0] * len(hosts)
+        self._next = itertools.count()
+        self.reads = 0
+        self.failovers = 0
+        self.saturated = 0
+
+    def acquire(self) -> Optional[ReplicaConnection]:
+        count = len(self.pools)
+        start = next(self._next)
+        for i in range(count):
+            index = (start + i) % count
+            if self._down_until[index] > time.monotonic():
+                continue
+            try:
+                connection = self.pools[index].acquire()
+            except PoolTimeoutError:
+                self.saturated += 1
+                continue
+            except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+                self._mark_down(index)
+                continue
+            self.reads += 1
+            return ReplicaConnection(connection, functools.partial(self._mark_down, index))
+        return None
+
+    def _mark_down(self, index: int):
+        self._down_until[index] = time.monotonic() + self.retry_seconds
+        self.failovers += 1
+        host, port = self.hosts[index]
+        logger.warning("Replica %s:%s is unavailable; skipping it for %ss", host, port, self.retry_seconds)
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "reads": self.reads,
+            "failovers": self.failovers,
+            "saturated": self.saturated,
+            "healthy": sum(1 for until in self._down_until if until <= now),
+            "replicas": {
+                f"{host}:{port}": {"healthy": until <= now, **pool.stats()}
+                for (host, port), pool, until in zip(self.hosts, self.pools, self._down_until)
+            },
+        }
+
+
+class _ReadSession:
+    """リクエストのユーザー（認証前は None）と、読み取りをプライマリに向ける期限"""
+
+    __slots__ = ("key", "primary_until")
+
+    def __init__(self, key, primary_until: float):
+        self.key = key
+        self.primary_until = primary_until
+
+
+class _StickyClients:
+    """書き込んだユーザー -> 期限（LRUで max_keys 件まで。ワーカーごと）"""
+
+    def __init__(self, max_keys: int = DB_READ_STICKY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._until = OrderedDict()
+
+    def get(self, key) -> float:
+        with self._lock:
+            until = self._until.get(key, 0.0)
+            if until and until <= time.monotonic():
+                del self._until[key]
+                return 0.0
+            return until
+
+    def set(self, key, until: float):
+        with self._lock:
+            self._until[key] = until
+            self._until.move_to_end(key)
+            if len(self._until) > self.max_keys:
+                self._until.popitem(last=False)
+
+
+_read_session = contextvars.ContextVar("db_read_session", default=None)
+_sticky_clients = _StickyClients()
+
+
+def begin_read_session() -> contextvars.Token:
+    """リクエストの開始時に呼ぶ。誰のリクエストかは認証後に bind_read_session で結び付ける"""
+    return _read_session.set(_ReadSession(None, 0.0))
+
+
+def end_read_session(token: contextvars.Token):
+    _read_session.reset(token)
+
+
+def bind_read_session(key):
+    """
+    リクエストを認証したユーザー（key はトークンの sub）に結び付ける
+    直前に同じユーザーが書き込んでいれば、このリクエストの読み取りもプライマリに向ける。
+    このリクエストで既に書き込んでいれば、その分をユーザーの記録に残す
+    """
+    session = _read_session.get()
+    if session is None or key is None:
+        return
+    session.key = key
+    primary_until = _sticky_clients.get(key)
+    if session.primary_until > primary_until:
+        _sticky_clients.set(key, session.primary_until)
+    else:
+        session.primary_until = primary_until
+
+
+def mark_read_sticky(key):
+    """
+    key のユーザーの読み取りを DB_READ_STICKY_SECONDS 秒プライマリに向ける
+    登録・ログインのように、まだ認証されていないリクエストで書き込んだ場合に、発行したトークンの sub で呼ぶ
+    """
+    if key is None or DB_READ_STICKY_SECONDS <= 0:
+        return
+    _sticky_clients.set(key, time.monotonic() + DB_READ_STICKY_SECONDS)
+
+
+def _mark_write():
+    """プライマリの接続を借りた（書き込みの可能性がある）ので、しばらく読み取りもプライマリへ"""
+    session = _read_session.get()
+    if session is None or DB_READ_STICKY_SECONDS <= 0:
+        return
+    session.primary_until = time.monotonic() + DB_READ_STICKY_SECONDS
+    if session.key is not None:
+        _sticky_clients.set(session.key, session.primary_until)
+
+
+def _prefer_primary() -> bool:
+    session = _read_session.get()
+    return session is not None and session.primary_until > time.monotonic()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_replicas = None
+_replicas_loaded = False
+
+
+def get_pool() -> ConnectionPool:
+    """プロセス共通のコネクションプールを取得（初回呼び出し時に作成）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_replicas() -> Optional[ReplicaSet]:
+    """DB_REPLICA_HOSTS のレプリカ（設定がなければ None）"""
+    global _replicas, _replicas_loaded
+    if not _replicas_loaded:
+        with _pool_lock:
+            if not _replicas_loaded:
+                hosts = parse_hosts(DB_REPLICA_HOSTS)
+                _replicas = ReplicaSet(hosts) if hosts else None
+                _replicas_loaded = True
+    return _replicas
+
+
+def close_pool():
+    """アイドル接続を閉じてプールを破棄する（レプリカも）"""
+    global _pool, _replicas, _replicas_loaded
+    with _pool_lock:
+        pool, _pool = _pool, None
+        replicas, _replicas, _replicas_loaded = _replicas, None, False
+    if pool is not None:
+        pool.close()
+    if replicas is not None:
+        replicas.close()
+
+
+def get_pool_stats() -> dict:
+    return get_pool().stats()
+
+
+def get_replica_stats() -> dict:
+    replicas = get_replicas()
+    return replicas.stats() if replicas is not None else {}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """DB処理専用のスレッドプールを取得（初回呼び出し時に作成）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db"
+                )
+    return _executor
+
+
+def shutdown_db_executor(wait: bool = True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    同期のDB処理をDB専用スレッドプールで実行し、イベントループをブロックせずに待つ
+    例: user = await run_db(UserModel.get_by_username, username)
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    # リクエストのcontextvar（クエリのトレース先）をDBスレッドに引き継ぐ
+    context = contextvars.copy_context()
+    # プロファイル中のリクエストなら、実行するDBスレッドもサンプリングの対象にする
+    call = bind_thread(call)
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(get_db_executor(), context.run, call)
+    finally:
+        # スレッドの空き待ちも含めた、ハンドラから見たDB待ち時間
+        record_db_time(time.perf_counter() - started)
+
+
+def _reset_after_fork():
+    """
+    fork した子プロセスでは親のプール・スレッドプールを使わない（ソケットやスレッドは共有できない）
+    参照を捨てるだけで閉じない（閉じると親の接続まで切断されるため）。最初の利用時に作り直す
+    """
+    global _pool, _pool_lock, _replicas, _replicas_loaded, _executor, _executor_lock
+    _pool, _replicas, _replicas_loaded, _executor = None, None, False, None
+    _pool_lock = threading.Lock()
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def ping_database() -> bool:
+    """プライマリに接続して ping が通るか（レディネスチェック用）"""
+    try:
+        with get_pool().acquire() as connection:
+            connection.ping(reconnect=False)
+        return True
+    except Exception:
+        return False
+
+
+# データベース接続関数
+def get_db_connection(read_only: bool = False):
+    """
+    プールから接続を取得する
+    close() するか with ブロックを抜けるとプールに返却される
+    read_only=True の場合はレプリカを使う（レプリカがない・全て使えない・
+    このユーザーが直前に書き込んでいる場合はプライマリ）
+    """
+    if read_only:
+        replicas = get_replicas()
+        if replicas is not None and not _prefer_primary():
+            connection = replicas.acquire()
+            if connection is not None:
+                return connection
+        return get_pool().acquire()
+    _mark_write()
+    return get_pool().acquire()
 
 # FastAPI依存性注入用の関数
 def get_db():
@@ -33,4 +747,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -1,13 +1,21 @@
+import os
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 
+from app.core.cache import principal_cache
+from app.core.database import bind_read_session, run_db
+from app.core.revocation import token_denylist
 from app.core.security import SECRET_KEY, ALGORITHM
 from app.api.users.models import UserModel
 from app.api.users.schemas import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
+# 管理者として扱うユーザー名（カンマ区切り）
+ADMIN_USERNAMES = frozenset(n.strip() for n in os.getenv("ADMIN_USERNAMES", "").split(",") if n.strip())
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -19,14 +27,34 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
+        # ログアウト済みのトークン（ほとんどはブルームフィルターだけで判定が終わる）
+        if token_denylist.is_revoked(payload.get("jti")):
+            raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
+    # 直前に書き込んだユーザーなら、このリクエストの読み取りもプライマリへ
+    bind_read_session(token_data.username)
     
-    user = UserModel.get_by_username(username=token_data.username)
+    # キャッシュにあればDBを引かない
+    user = principal_cache.get(token_data.username)
+    if user is not None:
+        return user
+    
+    user = await run_db(UserModel.get_by_username, username=token_data.username)
     if user is None:
         raise credentials_exception    
+    principal_cache.set(token_data.username, user, payload.get("exp"))
     return user
 
 async def get_current_active_user(current_user = Depends(get_current_user)):
-    return current_user
\ No newline at end of file
+    return current_user
+
+async def get_current_admin_user(current_user = Depends(get_current_user)):
+    """ADMIN_USERNAMES に含まれるユーザーのみ（それ以外は403）"""
+    if current_user.name not in ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
@@ -0,0 +1,237 @@
+"""
+Prometheusテキスト形式のメトリクス
+
+記録はスレッドごとのシャード（threading.local に持つ dict）に対して行うためロックを取らない。
+/metrics で出力するときにだけ全シャードを合算する。
+
+値はプロセスごと。プリフォーク（app.server）ではワーカーごとに worker ラベルを付けて出力するので、
+どのワーカーが応答しても系列ごとの単調増加は崩れない（合計は sum without (worker) で取る）。
+
+リクエスト単位の集計（DB待ち時間など）は contextvar の RequestStats に積み上げ、
+MetricsMiddleware がリクエスト終了時にメトリクスへ反映する。
+"""
+import bisect
+import contextvars
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, *extra: str) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(e for e in extra if e)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # ロックを取るのはスレッドごとに最初の1回だけ
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _snapshots(self) -> List[list]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [list(shard.items()) for shard in shards]
+
+    def render(self, const: str = "") -> List[str]:
+        """const: 全ての系列に付けるラベル（'worker="0"' など）"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._render_samples(const))
+        return lines
+
+    def _render_samples(self, const: str) -> List[str]:
+        totals: Dict[Tuple, float] = {}
+        for items in self._snapshots():
+            for labels, value in items:
+                totals[labels] = totals.get(labels, 0) + value
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels, const)} {_format_value(value)}"
+            for labels, value in sorted(totals.items())
+        ]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    """増減する値（スレッドごとの増減を合算する）"""
+    type = "gauge"
+
+    def dec(self, labels: Tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels: Tuple, value: float):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # 各バケットの件数 + (+Inf の件数) + 合計値
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _render_samples(self, const: str) -> List[str]:
+        totals: Dict[Tuple, list] = {}
+        for items in self._snapshots():
+            for labels, counts in items:
+                merged = totals.get(labels)
+                if merged is None:
+                    totals[labels] = list(counts)
+                else:
+                    for i, value in enumerate(counts):
+                        merged[i] += value
+
+        lines = []
+        for labels, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, const, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels, const)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._stats: List[Tuple[str, Callable[[], dict]]] = []
+        self._const = ""
+
+    def set_const_labels(self, **labels: str):
+        """全ての系列に付けるラベル（プリフォークのワーカー番号など）"""
+        names = tuple(labels)
+        self._const = _format_labels(names, tuple(labels[name] for name in names))[1:-1]
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, func: Callable[[], dict]):
+        """
+        既存の stats() の数値項目を {prefix}_{キー} のゲージとして出力する
+        例: register_stats("db_pool", get_pool_stats)
+        """
+        self._stats.append((prefix, func))
+
+    def render(self) -> str:
+        lines = []
+        const = self._const
+        for metric in self._metrics:
+            lines.extend(metric.render(const))
+        for prefix, func in self._stats:
+            try:
+                stats = func()
+            except Exception:
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key}{_format_labels((), (), const)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_requests_total = metrics.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_request_duration_seconds = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+)
+http_requests_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+http_request_db_seconds_total = metrics.counter(
+    "http_request_db_seconds_total", "Time spent waiting for DB calls during requests", ("route",)
+)
+http_request_handler_seconds_total = metrics.counter(
+    "http_request_handler_seconds_total", "Time spent outside DB calls during requests", ("route",)
+)
+
+
+class RequestStats:
+    """1リクエストの間に積み上げる集計値"""
+    __slots__ = ("db_seconds", "db_calls", "queries")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_calls = 0
+        # 実行したSQL (正規化したSQL, 秒数, 行数)。app.core.query_trace が積む
+        self.queries = []
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+def begin_request() -> Tuple[RequestStats, contextvars.Token]:
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token: contextvars.Token):
+    _request_stats.reset(token)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def record_db_time(seconds: float):
+    """リクエスト処理中であれば、そのリクエストのDB待ち時間に加算する"""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_seconds += seconds
+        stats.db_calls += 1
@@ -0,0 +1,272 @@
+"""
+リクエスト単位のサンプリングプロファイラ（本番での調査用）
+
+対象のリクエストの処理中だけ PROFILE_INTERVAL_SECONDS ごとにスタックを取り、
+collapsed 形式（"f1;f2;f3 回数"、flamegraph.pl にそのまま渡せる）で数える。
+
+- イベントループ: SIGALRM のインターバルタイマー（ITIMER_REAL）のハンドラで、割り込んだ時点のフレームを取る。
+  ハンドラは実行中のタスクのコンテキストで動くので、そのリクエストのタスクが実行中のサンプルだけが入る
+  （別スレッドから覗くと、GIL が手放される select() の待ちばかりを拾ってしまうため）。
+  シグナルはメインスレッドにしか届かないので、イベントループがメインスレッドで動いている場合のみ。
+  （ITIMER_PROF はカーネルのティック単位でしか進まず、1ms 間隔のサンプリングには粗すぎる）
+- run_db のスレッド: サンプラースレッドが sys._current_frames() で、そのリクエストの処理を
+  実行している間だけ取る（DBの応答待ちのような CPU を使わない時間もここに出る）
+
+- 対象: X-Profile-Token ヘッダーが PROFILE_TOKEN と一致するリクエスト、または PROFILE_SAMPLE_RATE の割合
+- 結果はワーカーごとに直近 PROFILE_BUFFER_SIZE 件をリングバッファに持つ（/api/admin/profiles で参照）
+- 無効時（PROFILE_TOKEN 未設定かつ PROFILE_SAMPLE_RATE=0）の負荷はミドルウェアの判定1回と
+  run_db での contextvar の参照1回だけ。サンプラースレッドも動かない
+- プロファイル中は sys.setswitchinterval を間隔まで下げる（サンプラースレッドが GIL を待たされないように）
+- パスワードのハッシュ（別プロセス）と run_db 以外のスレッドプールで動く処理は対象外
+"""
+import contextvars
+import hmac
+import itertools
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "100"))
+# 同時にプロファイルするリクエスト数の上限（超えた分はプロファイルせずに処理する）
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "4"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "128"))
+
+PROFILE_HEADER = b"x-profile-token"
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) + os.sep
+
+
+class RequestProfile:
+    __slots__ = (
+        "profile_id", "method", "path", "trigger", "started_at", "duration_ms", "status",
+        "samples", "stacks", "loop_stacks", "threads", "_started",
+    )
+
+    def __init__(self, profile_id: str, method: str, path: str, trigger: str):
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.status = None
+        self.samples = 0
+        self.stacks = Counter()
+        # シグナルハンドラが積むイベントループのスタック（ハンドラではロックを取らず、終了時に stacks へ足す）
+        self.loop_stacks: List[str] = []
+        # このリクエストの処理を実行中の run_db のスレッド
+        self.threads = set()
+        self._started = time.perf_counter()
+
+    def summary(self) -> dict:
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "samples": self.samples,
+        }
+
+
+_current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+
+def bind_thread(call):
+    """
+    プロファイル中のリクエストから別スレッドで実行する処理を包み、実行中のスレッドを対象に加える
+    （プロファイル中でなければ call をそのまま返す）
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return call
+
+    def run():
+        thread = threading.get_ident()
+        profile.threads.add(thread)
+        try:
+            return call()
+        finally:
+            profile.threads.discard(thread)
+    return run
+
+
+class Profiler:
+    def __init__(self, token: str = PROFILE_TOKEN, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 interval: float = PROFILE_INTERVAL_SECONDS, buffer_size: int = PROFILE_BUFFER_SIZE,
+                 max_concurrent: int = PROFILE_MAX_CONCURRENT):
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._active: List[RequestProfile] = []
+        self._finished = deque(maxlen=buffer_size)
+        self._ids = itertools.count(1)
+        self._labels: Dict[object, str] = {}
+        self._thread = None
+        self._previous_handler = None
+        self.profiled = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token) or self.sample_rate > 0
+
+    def trigger_for(self, headers: Iterable) -> Optional[str]:
+        """このリクエストをプロファイルするか（"header" / "sampled" / None）"""
+        if self.token:
+            for name, value in headers:
+                if name == PROFILE_HEADER:
+                    if hmac.compare_digest(value, self.token):
+                        return "header"
+                    break
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def start(self, method: str, path: str, trigger: str):
+        """
+        プロファイルを開始して (プロファイル, contextvar のトークン) を返す
+        同時実行数の上限に達している場合は (None, None)
+        """
+        with self._lock:
+            if len(self._active) >= self.max_concurrent:
+                self.skipped += 1
+                return None, None
+            profile = RequestProfile(f"{os.getpid()}-{next(self._ids)}", method, path, trigger)
+            self._active.append(profile)
+            if len(self._active) == 1:
+                self._start_timer()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return profile, _current_profile.set(profile)
+
+    def finish(self, profile: RequestProfile, token: contextvars.Token, status: Optional[int]):
+        _current_profile.reset(token)
+        profile.duration_ms = round((time.perf_counter() - profile._started) * 1000, 3)
+        profile.status = status
+        with self._lock:
+            self._active.remove(profile)
+            if not self._active:
+                self._stop_timer()
+            profile.samples += len(profile.loop_stacks)
+            profile.stacks.update(profile.loop_stacks)
+            profile.loop_stacks = []
+            self._finished.append(profile)
+            self.profiled += 1
+
+    def _start_timer(self):
+        if threading.current_thread() is not threading.main_thread() or not hasattr(signal, "setitimer"):
+            return
+        self._previous_handler = signal.signal(signal.SIGALRM, self._on_signal)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def _stop_timer(self):
+        if self._previous_handler is None:
+            return
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous_handler)
+        self._previous_handler = None
+
+    def _on_signal(self, signum, frame):
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.loop_stacks.append(self._stack(frame, "event-loop"))
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(_ROOT):
+                filename = filename[len(_ROOT):]
+            elif "site-packages" + os.sep in filename:
+                filename = filename.split("site-packages" + os.sep, 1)[1]
+            else:
+                filename = os.path.basename(filename)
+            label = self._labels[code] = f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ",")
+        return label
+
+    def _stack(self, frame, root: str) -> str:
+        labels = []
+        while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.append(root)
+        return ";".join(reversed(labels))
+
+    def _sample(self, profiles: List[RequestProfile]):
+        frames = sys._current_frames()
+        for profile in profiles:
+            stacks = []
+            for thread in tuple(profile.threads):
+                frame = frames.get(thread)
+                if frame is not None:
+                    stacks.append(self._stack(frame, "db-thread"))
+            if stacks:
+                # 集計の読み出しと重ならないようにロックを取って加える
+                with self._lock:
+                    profile.samples += 1
+                    profile.stacks.update(stacks)
+
+    def _run(self):
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval))
+        try:
+            while True:
+                time.sleep(self.interval)
+                with self._lock:
+                    profiles = list(self._active)
+                    if not profiles:
+                        self._thread = None
+                        return
+                self._sample(profiles)
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+    def recent(self) -> List[dict]:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._finished)]
+
+    def collapsed(self, profile_id: Optional[str] = None, path: Optional[str] = None) -> Optional[str]:
+        """
+        collapsed 形式のテキスト。profile_id 指定時はその1件（なければ None）、
+        それ以外はバッファ内の（path が一致する）プロファイルを合算する
+        """
+        with self._lock:
+            if profile_id is not None:
+                profiles = [profile for profile in self._finished if profile.profile_id == profile_id]
+                if not profiles:
+                    return None
+            else:
+                profiles = [profile for profile in self._finished if path is None or profile.path == path]
+            stacks = Counter()
+            for profile in profiles:
+                stacks.update(profile.stacks)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "active": len(self._active),
+                "buffered": len(self._finished),
+                "profiled": self.profiled,
+                "skipped": self.skipped,
+            }
+
+
+profiler = Profiler()
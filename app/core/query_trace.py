@@ -0,0 +1,106 @@
+"""
+リクエスト単位のSQLトレース
+
+app.core.database の TracingCursor が実行したSQLを record_query() に渡し、
+現在のリクエストの RequestStats（contextvar）に (正規化したSQL, 秒数, 行数) を積む。
+
+- DB_SLOW_QUERY_MS を超えたSQLは WARNING でログに出す（リクエスト外の処理も対象）
+- 1リクエストで同じ形のSQLが DB_N_PLUS_ONE_THRESHOLD 回を超えたら N+1 の疑いとして WARNING
+- X-Server-Timing-Token ヘッダーが DB_QUERY_HEADER_TOKEN と一致するリクエストにだけ、
+  レスポンスの Server-Timing ヘッダーでクエリ数とDB時間を返す（未設定なら付けない。
+  DBの内部的な時間を一般のクライアントに見せないため、プロファイラーの X-Profile-Token と同じ方式）
+"""
+import functools
+import hmac
+import logging
+import os
+import re
+from collections import Counter as _Counter
+from typing import Iterable, List, Optional, Tuple
+
+from app.core.metrics import current_request_stats, metrics
+
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+DB_N_PLUS_ONE_THRESHOLD = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "5"))
+DB_QUERY_HEADER_TOKEN = os.getenv("DB_QUERY_HEADER_TOKEN", "").encode()
+
+SERVER_TIMING_TOKEN_HEADER = b"x-server-timing-token"
+
+logger = logging.getLogger(__name__)
+
+db_queries_total = metrics.counter("db_queries_total", "SQL statements executed")
+db_slow_queries_total = metrics.counter("db_slow_queries_total", "SQL statements slower than DB_SLOW_QUERY_MS")
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+\b|%s")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_LIST = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+_CASE_LIST = re.compile(r"(WHEN \? THEN \? )(?:WHEN \? THEN \? )+", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """
+    値と件数の違いを取り除いたSQLの形
+    例: "SELECT * FROM users WHERE user_id IN (%s, %s)" -> "SELECT * FROM users WHERE user_id IN (?+)"
+    """
+    shape = _WHITESPACE.sub(" ", sql).strip()
+    shape = _LITERALS.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?+)", shape)
+    shape = _VALUES_LIST.sub("(?+), ...", shape)
+    return _CASE_LIST.sub(r"\1... ", shape)
+
+
+def record_query(sql, seconds: float, rows: int):
+    """TracingCursor から1文ごとに呼ばれる"""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    shape = normalize_sql(sql)
+    db_queries_total.inc()
+    if seconds * 1000 >= DB_SLOW_QUERY_MS:
+        db_slow_queries_total.inc()
+        logger.warning("Slow query", extra={
+            "sql": shape, "duration_ms": round(seconds * 1000, 2), "rows": rows,
+        })
+    stats = current_request_stats()
+    if stats is not None:
+        # list.append はスレッドセーフなので、並行したDB呼び出しからでもそのまま積める
+        stats.queries.append((shape, seconds, rows))
+
+
+def summarize(queries: List[Tuple[str, float, int]]) -> Tuple[int, float]:
+    """(クエリ数, 合計秒数)"""
+    return len(queries), sum(seconds for _, seconds, _ in queries)
+
+
+def repeated_statements(queries: List[Tuple[str, float, int]],
+                        threshold: int = DB_N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+    """同じ形のSQLが threshold 回を超えて実行されたもの（N+1の疑い）"""
+    if len(queries) <= threshold:
+        return []
+    counts = _Counter(shape for shape, _, _ in queries)
+    return [(shape, count) for shape, count in counts.most_common() if count > threshold]
+
+
+def check_request(queries: List[Tuple[str, float, int]], method: str, route: str):
+    """リクエスト終了時に呼ぶ: N+1 の疑いがあればログに出す"""
+    for shape, count in repeated_statements(queries):
+        logger.warning("Possible N+1 query", extra={
+            "method": method, "route": route, "sql": shape, "count": count,
+        })
+
+
+def server_timing_requested(headers: Iterable, token: bytes = DB_QUERY_HEADER_TOKEN) -> bool:
+    """リクエストヘッダーの X-Server-Timing-Token が token と一致するか"""
+    if not token:
+        return False
+    for name, value in headers:
+        if name == SERVER_TIMING_TOKEN_HEADER:
+            return hmac.compare_digest(value, token)
+    return False
+
+
+def server_timing_header(queries: List[Tuple[str, float, int]]) -> Tuple[bytes, bytes]:
+    """クエリ数とDB時間の Server-Timing ヘッダー"""
+    count, seconds = summarize(queries)
+    return b"server-timing", f'db;desc="{count} queries";dur={seconds * 1000:.2f}'.encode()
@@ -0,0 +1,171 @@
+"""
+ログイン・新規登録のレート制限（トークンバケット）
+
+IPアドレスごと・ユーザー名ごとにバケットを持ち、1回の試行で1トークン消費する。
+トークンは per_minute/60 個/秒で burst 個まで貯まる。判定は O(1) で、
+DB参照やbcryptの前に行うため、超過した試行はほぼコストなしで 429 を返せる。
+
+バックエンド（RATE_LIMIT_BACKEND）:
+- local:  プロセス内の dict（LRUで最大 RATE_LIMIT_MAX_KEYS 個。古い・使われていないバケットから捨てる）
+- shared: 起動前に確保した共有メモリ上の固定長テーブル。app を読み込んでから fork した
+          ワーカー間で同じバケットを使う（同一ホストのみ。満杯時は同じスロットを上書きする）
+- "module:Class": 独自のバックエンド（Redis など、複数ホストで共有する場合）
+"""
+import hashlib
+import importlib
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+
+from app.core.metrics import metrics
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# X-Forwarded-For の先頭をクライアントIPとして信用する（リバースプロキシの内側で動かす場合のみ）
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes", "on")
+
+# (1分あたりの回数, バースト)
+LOGIN_LIMIT_PER_IP = (float(os.getenv("LOGIN_RATE_PER_IP_PER_MINUTE", "30")),
+                      float(os.getenv("LOGIN_RATE_PER_IP_BURST", "10")))
+LOGIN_LIMIT_PER_USERNAME = (float(os.getenv("LOGIN_RATE_PER_USERNAME_PER_MINUTE", "10")),
+                            float(os.getenv("LOGIN_RATE_PER_USERNAME_BURST", "5")))
+REGISTER_LIMIT_PER_IP = (float(os.getenv("REGISTER_RATE_PER_IP_PER_MINUTE", "10")),
+                         float(os.getenv("REGISTER_RATE_PER_IP_BURST", "5")))
+
+rate_limited_total = metrics.counter("rate_limited_total", "Requests rejected by rate limiting", ("scope",))
+
+
+class RateLimitBackend(ABC):
+    """
+    バケットの保存先のインターフェース
+    consume() は1トークン消費を試み、許可なら 0、拒否なら次に1トークン貯まるまでの秒数を返す
+    """
+
+    @abstractmethod
+    def consume(self, key: str, rate: float, burst: float, now: float) -> float:
+        ...
+
+
+def _refill(tokens: float, updated_at: float, rate: float, burst: float, now: float):
+    """(消費後のトークン数, 待ち秒数)"""
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class LocalBackend(RateLimitBackend):
+    """プロセス内のLRU付き dict（ワーカーごとに独立）"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> [トークン数, 更新時刻]
+        self._buckets = OrderedDict()
+        self.evictions = 0
+
+    def consume(self, key: str, rate: float, burst: float, now: float) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(key)
+            bucket[0], wait = _refill(bucket[0], bucket[1], rate, burst, now)
+            bucket[1] = now
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SharedMemoryBackend(RateLimitBackend):
+    """
+    fork したワーカー間で共有する固定長テーブル（匿名共有メモリ）
+    スロット = (キーのハッシュ, トークン数, 更新時刻)。ハッシュで決まるスロットに別のキーが
+    入っていれば上書きする（＝そのバケットは満タンから数え直し）ので、メモリは一定
+    """
+
+    _SLOT = struct.Struct("<Qdd")
+
+    def __init__(self, slots: int = RATE_LIMIT_MAX_KEYS):
+        self.slots = slots
+        self._memory = mmap.mmap(-1, slots * self._SLOT.size)
+        self._lock = multiprocessing.Lock()
+
+    def consume(self, key: str, rate: float, burst: float, now: float) -> float:
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+        offset = (digest % self.slots) * self._SLOT.size
+        with self._lock:
+            stored, tokens, updated_at = self._SLOT.unpack_from(self._memory, offset)
+            if stored != digest:
+                tokens, updated_at = burst, now
+            tokens, wait = _refill(tokens, updated_at, rate, burst, now)
+            self._SLOT.pack_into(self._memory, offset, digest, tokens, now)
+            return wait
+
+
+def create_backend(name: str = RATE_LIMIT_BACKEND) -> RateLimitBackend:
+    if not name or name == "local":
+        return LocalBackend()
+    if name == "shared":
+        return SharedMemoryBackend()
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class RateLimiter:
+    def __init__(self, backend: Optional[RateLimitBackend] = None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.backend = backend or create_backend()
+        self.enabled = enabled
+
+    def check(self, scope: str, key: str, limit) -> float:
+        """許可なら 0、拒否なら Retry-After の秒数"""
+        per_minute, burst = limit
+        return self.backend.consume(f"{scope}:{key}", per_minute / 60.0, burst, time.monotonic())
+
+    def enforce(self, scope: str, *checks):
+        """
+        checks: (キーの種類, キー, (1分あたりの回数, バースト)) のいずれかが超過していれば 429
+        キーが None のものは飛ばす
+        """
+        if not self.enabled:
+            return
+        wait = 0.0
+        for kind, key, limit in checks:
+            if key is None:
+                continue
+            wait = max(wait, self.check(f"{scope}:{kind}", key, limit))
+        if wait > 0:
+            rate_limited_total.inc((scope,))
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many attempts, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+
+def client_ip(request: Optional[Request]) -> Optional[str]:
+    if request is None:
+        return None
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,224 @@
+"""
+トークンの失効（ログアウト）
+
+失効したトークンの jti を有効期限（exp）まで保持するメモリ上のデニーリスト。
+前段にブルームフィルターを置き、ほとんどのリクエスト（失効していないトークン）は
+ハッシュ計算数回だけで判定する（DBやネットワークには行かない）。
+
+- revoke() は revoked_tokens テーブルにも書き込むため、再起動後も失効したまま
+- sync() で他ワーカーが追加した分を created_at 順に取り込む（TOKEN_DENYLIST_SYNC_SECONDS ごと）。
+  そのため他ワーカーでの失効が反映されるまで最大でその秒数かかる。
+  AUTO_INCREMENT の id はコミット前に割り当てられ、小さい id の行が後からコミットされることがあるため、
+  id ではなく前回取り込んだ最新の created_at から TOKEN_DENYLIST_SYNC_OVERLAP_SECONDS 遡って読み直す
+  （取り込み済みの jti は読み飛ばす）
+- 期限切れのエントリは purge() で取り除き、ブルームフィルターも作り直す
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from app.core.database import get_db_connection, run_db
+
+TOKEN_DENYLIST_SYNC_SECONDS = float(os.getenv("TOKEN_DENYLIST_SYNC_SECONDS", "2"))
+TOKEN_DENYLIST_SYNC_OVERLAP_SECONDS = float(os.getenv("TOKEN_DENYLIST_SYNC_OVERLAP_SECONDS", "30"))
+TOKEN_DENYLIST_BLOOM_CAPACITY = int(os.getenv("TOKEN_DENYLIST_BLOOM_CAPACITY", "100000"))
+TOKEN_DENYLIST_BLOOM_ERROR_RATE = float(os.getenv("TOKEN_DENYLIST_BLOOM_ERROR_RATE", "0.001"))
+# 期限切れエントリの掃除間隔
+TOKEN_DENYLIST_PURGE_SECONDS = float(os.getenv("TOKEN_DENYLIST_PURGE_SECONDS", "300"))
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    追加のみのブルームフィルター（偽陽性あり・偽陰性なし）
+    capacity 件を入れたときの偽陽性率が error_rate になるようにビット数とハッシュ数を決める
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    @staticmethod
+    def _hash(key: str):
+        # 128bitのダイジェストを2つのハッシュに分け、h1 + i*h2 で k 個の位置を作る（double hashing）
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def add(self, key: str):
+        h1, h2 = self._hash(key)
+        bits, size = self._bits, self.size
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % size
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        h1, h2 = self._hash(key)
+        bits, size = self._bits, self.size
+        # 含まれないキーはたいてい最初の数ビットで判定が終わる
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class TokenDenylist:
+    def __init__(self, capacity: int = TOKEN_DENYLIST_BLOOM_CAPACITY,
+                 error_rate: float = TOKEN_DENYLIST_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        # jti -> exp（UNIX時刻）
+        self._entries: Dict[str, float] = {}
+        self._bloom = BloomFilter(capacity, error_rate)
+        # 取り込んだ行の最新の created_at（DBの時刻）
+        self._watermark: Optional[datetime] = None
+        self._last_purge = time.time()
+        self.loaded = False
+        self.checks = 0
+        self.bloom_hits = 0
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        """失効済みか（ブルームフィルターに無ければ辞書も見ない）"""
+        if not jti:
+            return False
+        self.checks += 1
+        if jti not in self._bloom:
+            return False
+        self.bloom_hits += 1
+        exp = self._entries.get(jti)
+        return exp is not None and exp > time.time()
+
+    def _add_locked(self, jti: str, exp: float) -> bool:
+        if jti in self._entries:
+            return False
+        self._entries[jti] = exp
+        if self._bloom.count >= self._bloom.capacity:
+            self._rebuild_bloom_locked()
+        else:
+            self._bloom.add(jti)
+        return True
+
+    def _rebuild_bloom_locked(self):
+        """有効なエントリだけで作り直す（入りきらなければ容量を倍にする）"""
+        capacity = self.capacity
+        while capacity < len(self._entries) * 2:
+            capacity *= 2
+        bloom = BloomFilter(capacity, self.error_rate)
+        for jti in self._entries:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def revoke(self, jti: str, exp: float) -> bool:
+        """失効させる（DBに保存してからメモリに反映する）"""
+        if exp <= time.time():
+            return True
+        try:
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "INSERT IGNORE INTO revoked_tokens (jti, expires_at) VALUES (%s, %s)",
+                        (jti, datetime.utcfromtimestamp(exp))
+                    )
+        except Exception:
+            logger.exception("Error revoking token")
+            return False
+        with self._lock:
+            self._add_locked(jti, exp)
+        return True
+
+    def sync(self, batch_size: int = 1000) -> int:
+        """
+        DBから取り込み、新しく加えた件数を返す
+        初回は有効期限内のものをすべて、以降は前回の最新の created_at から
+        TOKEN_DENYLIST_SYNC_OVERLAP_SECONDS 遡った分以降（(created_at, id) 順にページング）
+        """
+        if self._watermark is None:
+            since = datetime(1970, 1, 2)
+        else:
+            since = self._watermark - timedelta(seconds=TOKEN_DENYLIST_SYNC_OVERLAP_SECONDS)
+        after_id = 0
+        added = 0
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                while True:
+                    cursor.execute(
+                        """
+                        SELECT id, jti, expires_at, created_at FROM revoked_tokens
+                        WHERE (created_at > %s OR (created_at = %s AND id > %s))
+                          AND expires_at > UTC_TIMESTAMP()
+                        ORDER BY created_at, id
+                        LIMIT %s
+                        """,
+                        (since, since, after_id, batch_size)
+                    )
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    with self._lock:
+                        for row in rows:
+                            exp = (row["expires_at"] - datetime(1970, 1, 1)).total_seconds()
+                            added += self._add_locked(row["jti"], exp)
+                        if self._watermark is None or rows[-1]["created_at"] > self._watermark:
+                            self._watermark = rows[-1]["created_at"]
+                    since, after_id = rows[-1]["created_at"], rows[-1]["id"]
+        self.loaded = True
+        if time.time() - self._last_purge >= TOKEN_DENYLIST_PURGE_SECONDS:
+            self.purge()
+        return added
+
+    def purge(self) -> int:
+        """期限切れのエントリをメモリとDBから取り除く"""
+        now = time.time()
+        with self._lock:
+            expired = [jti for jti, exp in self._entries.items() if exp <= now]
+            for jti in expired:
+                del self._entries[jti]
+            if expired:
+                self._rebuild_bloom_locked()
+            self._last_purge = now
+        try:
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "DELETE FROM revoked_tokens WHERE expires_at <= UTC_TIMESTAMP() LIMIT 10000"
+                    )
+        except Exception:
+            logger.exception("Error purging revoked tokens")
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bloom_bits": self._bloom.size,
+                "bloom_hashes": self._bloom.hashes,
+                "checks": self.checks,
+                "bloom_hits": self.bloom_hits,
+                "loaded": self.loaded,
+            }
+
+
+token_denylist = TokenDenylist()
+
+
+async def run_sync_loop(denylist: TokenDenylist = token_denylist):
+    """起動時に有効期限内の失効を読み込み、その後は他ワーカーの追加分を定期的に取り込む"""
+    while True:
+        try:
+            await run_db(denylist.sync)
+        except Exception:
+            logger.exception("Error syncing token denylist")
+        await asyncio.sleep(TOKEN_DENYLIST_SYNC_SECONDS)
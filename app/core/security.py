@@ -1,8 +1,15 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+import asyncio
+import logging
 import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
 
 # シークレットキーの設定
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
@@ -12,13 +19,29 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # 開発モード設定 - パスワードハッシュをスキップ
 DEV_MODE = True  # 開発モードをオンに
 
+# bcryptのコスト。これより低いコストのハッシュはログイン成功時に再ハッシュする
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# ハッシュ計算用のワーカープロセス数と、実行待ちにできる最大件数
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
 # パスワードハッシュのためのコンテキスト
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """ハッシュ計算の待ち行列が上限に達している"""
 
 def verify_password(plain_password, stored_password):
     if DEV_MODE:
         # 開発モード: 平文パスワード同士を直接比較
-        print(f"平文パスワード比較: {plain_password} と {stored_password}")
+        logger.debug("DEV_MODE: comparing plaintext passwords")
         return plain_password == stored_password
     else:
         # 本番モード: ハッシュ化されたパスワードを検証
@@ -29,6 +52,109 @@ def get_password_hash(password):
         return password
     return pwd_context.hash(password)
 
+def _verify_and_rehash(plain_password: str, stored_password: str) -> Tuple[bool, Optional[str]]:
+    """ワーカープロセス側で実行: 検証し、コストが古ければ新しいハッシュも返す"""
+    try:
+        if not pwd_context.verify(plain_password, stored_password):
+            return False, None
+    except (ValueError, TypeError):
+        # ハッシュ形式でない値が保存されている
+        return False, None
+    if pwd_context.needs_update(stored_password):
+        return True, pwd_context.hash(plain_password)
+    return True, None
+
+
+def _hash_password(password: str) -> str:
+    """ワーカープロセス側で実行"""
+    return pwd_context.hash(password)
+
+
+_hash_executor = None
+_hash_lock = threading.Lock()
+_hash_pending = 0
+
+
+def get_password_executor() -> ProcessPoolExecutor:
+    """ハッシュ計算用のプロセスプールを取得（初回呼び出し時に作成）"""
+    global _hash_executor
+    if _hash_executor is None:
+        with _hash_lock:
+            if _hash_executor is None:
+                _hash_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _hash_executor
+
+
+def shutdown_password_executor(wait: bool = True):
+    global _hash_executor
+    with _hash_lock:
+        executor, _hash_executor = _hash_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _reset_after_fork():
+    """fork した子プロセスでは親のプロセスプールを使わない（最初の利用時に作り直す）"""
+    global _hash_executor, _hash_lock, _hash_pending
+    _hash_executor, _hash_pending = None, 0
+    _hash_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+async def _run_in_hash_pool(func, *args):
+    """
+    プロセスプールでハッシュ処理を実行する
+    実行中+待ちの件数が PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE を超える場合は
+    PasswordHasherBusy を送出して即座に諦める
+    """
+    global _hash_pending
+    with _hash_lock:
+        if _hash_pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+            raise PasswordHasherBusy("Password hashing queue is full")
+        _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_password_executor(), func, *args)
+    finally:
+        with _hash_lock:
+            _hash_pending -= 1
+
+
+async def verify_password_async(plain_password: str, stored_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    パスワードを検証する（イベントループはブロックしない）
+    戻り値: (一致したか, 再ハッシュが必要な場合は新しいハッシュ、不要ならNone)
+    """
+    if DEV_MODE:
+        return verify_password(plain_password, stored_password), None
+    return await _run_in_hash_pool(_verify_and_rehash, plain_password, stored_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    if DEV_MODE:
+        return get_password_hash(password)
+    return await _run_in_hash_pool(_hash_password, password)
+
+def _hash_passwords(passwords):
+    """ワーカープロセス側で実行（まとめて受け取り、プロセス間の往復を減らす）"""
+    return [pwd_context.hash(password) for password in passwords]
+
+
+async def hash_passwords_async(passwords) -> list:
+    """
+    複数のパスワードをワーカープロセスに分けて並列にハッシュする（順序は入力と同じ）
+    ワーカー数ぶんのチャンクに分けるので、待ち行列の消費もチャンク数ぶんだけ
+    """
+    passwords = list(passwords)
+    if DEV_MODE or not passwords:
+        return [get_password_hash(password) for password in passwords]
+    size = -(-len(passwords) // PASSWORD_HASH_WORKERS)
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    results = await asyncio.gather(*(_run_in_hash_pool(_hash_passwords, chunk) for chunk in chunks))
+    return [hashed for chunk in results for hashed in chunk]
+
 # JWTトークン作成
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -36,7 +162,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
+    # jti: ログアウト時に個々のトークンを失効させるためのID
     to_encode.update({"exp": expire})
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
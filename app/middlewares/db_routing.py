@@ -0,0 +1,24 @@
+"""
+読み取りのレプリカ振り分け用のリクエスト単位の状態（ASGIミドルウェア）
+
+ユーザー（トークンの sub。認証時に app.core.dependencies.get_current_user が結び付ける）ごとに、
+書き込んだ直後の DB_READ_STICKY_SECONDS 秒は読み取りもプライマリに向ける（app.core.database.get_db_connection）。
+登録・ログインは認証前なので、発行したトークンの sub をそれぞれのエンドポイントで記録する。
+この記録はワーカーごとなので、複数ワーカーの場合は同じワーカーに来たリクエストにだけ効く。
+"""
+from app.core.database import begin_read_session, end_read_session
+
+
+class ReadRoutingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = begin_read_session()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            end_read_session(token)
@@ -0,0 +1,102 @@
+"""
+構造化ログ（1行1JSON）とサンプリング
+
+- LOG_SAMPLED_LOGGERS（既定: アクセスログ app.access）のINFO以下は LOG_SAMPLE_RATE（既定 10%）の割合だけ出力し、
+  件数を推定できるように sample_rate を付ける。それ以外のロガー（起動・ワーカーの状態など）は間引かない。
+  エラー（5xx）と遅いリクエストのアクセスログは WARNING 以上なので必ず出る
+- WARNING以上は必ず出力するが、同じ (logger, メッセージ) は LOG_BURST_PER_SECOND 件/秒までに抑え、
+  抑止した件数は次に出力するレコードの suppressed に入れる（DB停止時などのログの洪水を防ぐ）
+
+使い方:
+    logger = logging.getLogger(__name__)
+    logger.exception("Error getting trouble")
+    logger.info("request", extra={"route": "/api/users/me", "status": 200})
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_SAMPLED_LOGGERS = tuple(name.strip() for name in os.getenv("LOG_SAMPLED_LOGGERS", "app.access").split(",") if name.strip())
+LOG_BURST_PER_SECOND = int(os.getenv("LOG_BURST_PER_SECOND", "10"))
+
+# LogRecord の標準属性（これ以外は extra で渡された項目としてJSONに含める）
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and record.exc_info[1] is not None:
+            error = record.exc_info[1]
+            entry["error_type"] = type(error).__name__
+            entry["error"] = str(error)
+            if record.levelno >= logging.ERROR:
+                entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, sample_rate: float = LOG_SAMPLE_RATE, burst_per_second: int = LOG_BURST_PER_SECOND,
+                 sampled_loggers=LOG_SAMPLED_LOGGERS):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_loggers = frozenset(sampled_loggers)
+        self.burst_per_second = burst_per_second
+        self._lock = threading.Lock()
+        # (logger, msg) -> [秒, その秒に出力した件数, 抑止した件数]
+        self._windows = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            if self.sample_rate >= 1.0 or record.name not in self.sampled_loggers:
+                return True
+            if random.random() >= self.sample_rate:
+                return False
+            record.sample_rate = self.sample_rate
+            return True
+
+        key = (record.name, record.msg)
+        second = int(time.monotonic())
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or window[0] != second:
+                suppressed = window[2] if window is not None else 0
+                if len(self._windows) > 10000:
+                    self._windows.clear()
+                window = self._windows[key] = [second, 0, suppressed]
+            if window[1] >= self.burst_per_second:
+                window[2] += 1
+                return False
+            window[1] += 1
+            if window[2]:
+                record.suppressed = window[2]
+                window[2] = 0
+        return True
+
+
+def setup_logging(level: str = LOG_LEVEL):
+    """app.* のロガーにJSON出力のハンドラーを設定する（何度呼んでも1つだけ）"""
+    logger = logging.getLogger("app")
+    if any(isinstance(h.formatter, JsonFormatter) for h in logger.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(SamplingFilter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
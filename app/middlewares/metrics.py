@@ -0,0 +1,107 @@
+"""
+リクエストのメトリクス計測とアクセスログ（ASGIミドルウェア）
+
+- ルート（パスのテンプレート）ごとのレイテンシのヒストグラム、ステータス別の件数、処理中の件数
+- DB待ち時間（run_db で計測）とそれ以外の時間の内訳
+- 実行したSQLの N+1 チェックと、要求されたリクエストへの Server-Timing ヘッダー（app.core.query_trace）
+- アクセスログ（サンプリング対象。5xxと遅いリクエストは WARNING 以上で必ず出力）
+"""
+import logging
+import os
+import time
+
+from app.core import query_trace
+from app.core.metrics import (
+    begin_request,
+    end_request,
+    http_request_db_seconds_total,
+    http_request_duration_seconds,
+    http_request_handler_seconds_total,
+    http_requests_in_flight,
+    http_requests_total,
+)
+
+# これより時間のかかったリクエストは WARNING でログに出す
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "1000"))
+
+access_logger = logging.getLogger("app.access")
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        # エンドポイント関数 -> ルートのパス（初回のリクエストで作る）
+        self._routes = None
+
+    def _route_for(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            self._routes = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if getattr(route, "endpoint", None) is not None
+            }
+        route = self._routes.get(endpoint)
+        if route is None:
+            route = self._routes[endpoint] = getattr(endpoint, "__name__", "unknown")
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        server_timing = query_trace.server_timing_requested(scope["headers"])
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if server_timing:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        query_trace.server_timing_header(stats.queries)
+                    ]
+            await send(message)
+
+        started = time.perf_counter()
+        stats, token = begin_request()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            end_request(token)
+            duration = time.perf_counter() - started
+            method = scope["method"]
+            route = self._route_for(scope)
+            http_requests_total.inc((method, route, str(status_code)))
+            http_request_duration_seconds.observe((method, route), duration)
+            http_request_db_seconds_total.inc((route,), stats.db_seconds)
+            http_request_handler_seconds_total.inc((route,), max(duration - stats.db_seconds, 0.0))
+            query_trace.check_request(stats.queries, method, route)
+            self._log(method, scope["path"], route, status_code, duration, stats)
+
+    @staticmethod
+    def _log(method, path, route, status_code, duration, stats):
+        duration_ms = duration * 1000
+        if status_code >= 500:
+            level = logging.ERROR
+        elif duration_ms >= ACCESS_LOG_SLOW_MS:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+        if not access_logger.isEnabledFor(level):
+            return
+        access_logger.log(level, "request", extra={
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status_code,
+            "duration_ms": round(duration_ms, 2),
+            "db_ms": round(stats.db_seconds * 1000, 2),
+            "db_calls": stats.db_calls,
+            "db_queries": len(stats.queries),
+        })
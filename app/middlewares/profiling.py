@@ -0,0 +1,41 @@
+"""
+リクエスト単位のプロファイル（ASGIミドルウェア）
+
+対象のリクエストだけ app.core.profiling のサンプラーで計測し、レスポンスに X-Profile-Id を付ける。
+結果は /api/admin/profiles/{X-Profile-Id} で collapsed 形式のテキストとして取得できる。
+"""
+from app.core.profiling import profiler
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+        trigger = profiler.trigger_for(scope.get("headers", ()))
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+        profile, token = profiler.start(scope["method"], scope["path"], trigger)
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = None
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.profile_id.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.finish(profile, token, status_code)
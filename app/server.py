@@ -0,0 +1,247 @@
+"""
+本番用のマルチワーカー起動（プリフォーク）
+
+親プロセスでアプリを読み込み、DBからのキャッシュ類（カテゴリー一覧・失効済みトークン・
+お困りごと検索インデックス・ランキング・ヘルパーマッチング）を構築してから、待ち受けソケットを作って
+SERVER_WORKERS 個のワーカーを fork する。読み込んだモジュールと構築済みのキャッシュは
+copy-on-write で共有され、各ワーカーの lifespan は差分の取り込みだけで済む。
+
+- 各ワーカーは同じ待ち受けソケットで uvicorn を動かす（accept はカーネルが振り分ける）
+- SIGTERM / SIGINT: 親は全ワーカーに SIGTERM を送る。ワーカーは新しい接続の受け付けをやめ、
+  処理中のリクエストを SERVER_GRACEFUL_TIMEOUT_SECONDS まで待ってから lifespan の終了処理
+  （保留中のカウンター更新の書き込み、各種プールのクローズ）を行う。期限を過ぎたワーカーは SIGKILL
+- 停止中以外にワーカーが終了した場合は、同じワーカー番号（0〜SERVER_WORKERS-1）で fork し直す
+- /healthz（生存）と /readyz（起動完了・停止中でない・DBに接続できる）はワーカーごとに応答する
+- メトリクスはワーカーごとの値に worker="<ワーカー番号>" ラベルを付けて出す。/metrics はどれか1つの
+  ワーカーが応答するので、全ワーカーを取得するには SERVER_METRICS_PORT を設定し、
+  各ワーカーが SERVER_METRICS_PORT + ワーカー番号 で待ち受ける /metrics をそれぞれスクレイプする
+
+使い方:
+    python -m app.server --workers 4 --port 8000
+    APP_ENV=production python main.py
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import uvicorn
+
+SERVER_HOST = os.getenv("HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+SERVER_GRACEFUL_TIMEOUT_SECONDS = float(os.getenv("SERVER_GRACEFUL_TIMEOUT_SECONDS", "30"))
+# 起動直後に落ちたワーカーを fork し直すまでの待ち時間（起動失敗の繰り返しで親が空回りしないように）
+SERVER_RESPAWN_DELAY_SECONDS = float(os.getenv("SERVER_RESPAWN_DELAY_SECONDS", "1"))
+# ワーカーごとの /metrics の待ち受けポートの先頭（0 なら待ち受けない）
+SERVER_METRICS_PORT = int(os.getenv("SERVER_METRICS_PORT", "0"))
+
+logger = logging.getLogger(__name__)
+
+
+def preload():
+    """
+    fork 前にDBからキャッシュ類を構築する（失敗してもワーカーの lifespan で読み直す）
+    最後にプールを閉じ、親の接続をワーカーに持ち越さない
+    """
+    from app.api.categories.catalog import category_catalog
+    from app.api.categories.models import CategoryModel
+    from app.core.database import close_pool
+    from app.core.revocation import token_denylist
+    from app.services.helper_matching import helper_matcher
+    from app.services.leaderboard import leaderboards
+    from app.services.trouble_search import trouble_search_index
+
+    started = time.perf_counter()
+    for name, func in (
+        ("categories", CategoryModel.ensure_categories_exist),
+        ("category catalog", category_catalog.refresh),
+        ("token denylist", token_denylist.sync),
+        ("trouble search index", trouble_search_index.rebuild),
+        ("leaderboard", leaderboards.rebuild),
+        ("helper matcher", helper_matcher.rebuild),
+    ):
+        try:
+            func()
+        except Exception:
+            logger.exception("Error preloading %s", name)
+    close_pool()
+    logger.info("Preloaded caches in %.1fms", (time.perf_counter() - started) * 1000)
+
+
+def create_socket(host: str, port: int, backlog: int = SERVER_BACKLOG) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):
+    """停止のシグナルを受けた時点で /readyz を 503 にする"""
+
+    def handle_exit(self, sig, frame):
+        self.config.app.state.draining = True
+        super().handle_exit(sig, frame)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        from app.core.metrics import metrics
+
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve_metrics(host: str, port: int):
+    """このワーカーの /metrics だけを返すHTTPサーバーをスレッドで動かす"""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError:
+        logger.exception("Could not listen for metrics on %s:%d", host, port)
+        return
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+
+
+def _run_worker(app, sock: socket.socket, slot: int):
+    from app.core.metrics import metrics
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    metrics.set_const_labels(worker=str(slot))
+    if SERVER_METRICS_PORT:
+        _serve_metrics(sock.getsockname()[0], SERVER_METRICS_PORT + slot)
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        # アクセスログは app.middlewares.metrics が出す
+        access_log=False,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT_SECONDS,
+    )
+    WorkerServer(config).run(sockets=[sock])
+
+
+class Arbiter:
+    """ワーカーの fork・監視・停止を行う親プロセス"""
+
+    def __init__(self, app, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.children = {}  # pid -> (ワーカー番号, 起動時刻)
+        self.stopping = False
+
+    def spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(self.app, self.sock, slot)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        self.children[pid] = (slot, time.monotonic())
+        logger.info("Started worker %d (pid %d)", slot, pid)
+
+    def stop(self, sig=None, frame=None):
+        if not self.stopping:
+            logger.info("Stopping %d workers", len(self.children))
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            child = self.children.pop(pid, None)
+            if child is None:
+                continue
+            slot, started = child
+            if not self.stopping:
+                logger.warning("Worker %d (pid %d) exited with status %d; restarting",
+                               slot, pid, os.waitstatus_to_exitcode(status))
+                if time.monotonic() - started < SERVER_RESPAWN_DELAY_SECONDS:
+                    time.sleep(SERVER_RESPAWN_DELAY_SECONDS)
+                self.spawn(slot)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # fork 前に既存オブジェクトをGCの対象から外し、GCによる書き込みでページが複製されないようにする
+        gc.freeze()
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        while not self.stopping:
+            self._reap()
+            time.sleep(0.2)
+
+        deadline = time.monotonic() + SERVER_GRACEFUL_TIMEOUT_SECONDS + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logger.warning("Worker %d did not stop in time; killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.children.clear()
+        self.sock.close()
+
+
+def serve(app, host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = SERVER_WORKERS):
+    preload()
+    sock = create_socket(host, port)
+    logger.info("Listening on %s:%d with %d workers (pid %d)", host, port, workers, os.getpid())
+    Arbiter(app, sock, max(1, workers)).run()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Run the API with preforked workers")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import main
+    serve(main.app, args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,476 @@
+"""
+添付ファイルの保存（お困りごと・メッセージへの添付）
+
+アップロードは multipart/form-data の "file" パートを受信したチャンクのまま読み進め、
+ATTACHMENT_CHUNK_SIZE ごとに一時ファイルへ書き出しながら SHA-256 を計算する（全体をメモリに載せない）。
+ファイルは ATTACHMENT_DIR/<sha256の先頭2文字>/<次の2文字>/<sha256> に1つだけ置き、
+同じ中身のアップロードは attachment_blobs の参照数を増やすだけにする（内容アドレスによる重複排除）。
+
+- 1ファイルの上限は ATTACHMENT_MAX_BYTES、ユーザーごとの合計は ATTACHMENT_USER_QUOTA_BYTES
+- 使用量は attachment_usage に持ち、登録と同じトランザクションで条件付きの UPDATE で加算する
+  （ファイルを読み直したり SUM() したりしない。受信中も残り容量を超えた時点で打ち切る）
+- ファイルの配置は attachment_blobs の行をロックしている間に行う。登録のトランザクションが失敗したら、
+  置いたファイルは行がないことをロックして確かめてから消す
+- 削除はコミットしてから、行がないことをロックして確かめてファイルを消す（DBの削除が失敗してもファイルは残る）
+- 行がないのにファイルだけ残ったもの（消す前にプロセスが落ちた場合など）は run_sweep_loop が定期的に消す
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import AsyncIterator, List, Optional
+
+from python_multipart.exceptions import ParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+from app.core.database import get_db_connection, run_db
+
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "./data/attachments")
+ATTACHMENT_CHUNK_SIZE = int(os.getenv("ATTACHMENT_CHUNK_SIZE", str(256 * 1024)))
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+ATTACHMENT_USER_QUOTA_BYTES = int(os.getenv("ATTACHMENT_USER_QUOTA_BYTES", str(500 * 1024 * 1024)))
+# 参照のないファイルを探す間隔と、登録中の可能性があるので残す経過時間
+ATTACHMENT_SWEEP_SECONDS = float(os.getenv("ATTACHMENT_SWEEP_SECONDS", "3600"))
+ATTACHMENT_ORPHAN_GRACE_SECONDS = float(os.getenv("ATTACHMENT_ORPHAN_GRACE_SECONDS", "3600"))
+
+UPLOAD_FIELD = "file"
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+MAX_FILENAME_LENGTH = 255
+MAX_CONTENT_TYPE_LENGTH = 127
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    """アップロードを受け付けられない（status_code はそのままレスポンスに使う）"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def blob_relpath(sha256: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def blob_path(sha256: str, directory: str = ATTACHMENT_DIR) -> str:
+    return os.path.join(directory, blob_relpath(sha256))
+
+
+def _clean_filename(raw: bytes) -> str:
+    """パス区切りと制御文字を取り除いたファイル名"""
+    name = raw.decode("utf-8", "replace").replace("\\", "/").rsplit("/", 1)[-1]
+    name = "".join(c for c in name if c.isprintable()).strip()
+    return name[:MAX_FILENAME_LENGTH] or "file"
+
+
+def _clean_content_type(raw: Optional[bytes]) -> str:
+    if not raw:
+        return DEFAULT_CONTENT_TYPE
+    media_type = raw.decode("latin-1").split(";")[0].strip().lower()
+    if "/" not in media_type or len(media_type) > MAX_CONTENT_TYPE_LENGTH:
+        return DEFAULT_CONTENT_TYPE
+    return media_type
+
+
+class _ChunkWriter:
+    """
+    一時ファイルへ固定長のチャンク単位で書き込み、書き込んだ内容の SHA-256 とサイズを数える
+    （ファイル操作を伴うのでスレッドプールから呼ぶ）
+    """
+
+    def __init__(self, directory: str, chunk_size: int):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix="upload-", dir=directory)
+        self._file = os.fdopen(fd, "wb", buffering=0)
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self._hasher.update(data)
+        self.size += len(data)
+        self._buffer += data
+        if len(self._buffer) < self._chunk_size:
+            return
+        view = memoryview(self._buffer)
+        written = 0
+        while len(self._buffer) - written >= self._chunk_size:
+            self._file.write(view[written:written + self._chunk_size])
+            written += self._chunk_size
+        view.release()
+        del self._buffer[:written]
+
+    def finish(self) -> str:
+        """残りを書き出して閉じ、SHA-256（16進）を返す"""
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return self._hasher.hexdigest()
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ReceivedFile:
+    """一時ファイルまで受信し終えたアップロード"""
+
+    __slots__ = ("path", "sha256", "size", "filename", "content_type")
+
+    def __init__(self, path: str, sha256: str, size: int, filename: str, content_type: str):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.filename = filename
+        self.content_type = content_type
+
+    def discard(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _PartState:
+    """MultipartParser のコールバックで読み取ったパートのヘッダーと本文"""
+
+    def __init__(self):
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.in_file = False
+        self.file_seen = False
+        self.filename = None
+        self.content_type = None
+        self.data: List[bytes] = []
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition"))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name != UPLOAD_FIELD or b"filename" not in options:
+            return
+        if self.file_seen:
+            raise UploadError(400, "Only one file can be uploaded per request")
+        self.in_file = self.file_seen = True
+        self.filename = _clean_filename(options[b"filename"])
+        self.content_type = _clean_content_type(self.headers.get(b"content-type"))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        # 添付以外のフィールドは読み捨てる
+        if self.in_file:
+            self.data.append(data[start:end])
+
+    def on_part_end(self):
+        self.in_file = False
+
+
+async def receive_upload(
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str],
+    remaining_quota: int,
+    directory: str = ATTACHMENT_DIR,
+    chunk_size: int = ATTACHMENT_CHUNK_SIZE,
+    max_bytes: int = ATTACHMENT_MAX_BYTES,
+) -> ReceivedFile:
+    """
+    multipart/form-data の "file" パートを一時ファイルに書き出す
+    1ファイルの上限か残り容量を超えた時点で打ち切り、一時ファイルを消して UploadError
+    """
+    media_type, options = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if media_type != b"multipart/form-data" or not boundary:
+        raise UploadError(415, "Send the file as multipart/form-data")
+
+    state = _PartState()
+    parser = MultipartParser(boundary, state.callbacks())
+    writer = None
+    try:
+        async for chunk in chunks:
+            try:
+                parser.write(chunk)
+            except ParseError:
+                raise UploadError(400, "Malformed multipart body")
+            if not state.data:
+                continue
+            data = b"".join(state.data)
+            state.data.clear()
+            size = (writer.size if writer is not None else 0) + len(data)
+            if size > max_bytes:
+                raise UploadError(413, f"File exceeds {max_bytes} bytes")
+            if size > remaining_quota:
+                raise UploadError(413, "Attachment storage quota exceeded")
+            if writer is None:
+                writer = await run_in_threadpool(_ChunkWriter, os.path.join(directory, "tmp"), chunk_size)
+            await run_in_threadpool(writer.write, data)
+        try:
+            parser.finalize()
+        except ParseError:
+            raise UploadError(400, "Malformed multipart body")
+        if not state.file_seen:
+            raise UploadError(400, f"Missing '{UPLOAD_FIELD}' file field")
+        if writer is None:
+            writer = await run_in_threadpool(_ChunkWriter, os.path.join(directory, "tmp"), chunk_size)
+        sha256 = await run_in_threadpool(writer.finish)
+    except BaseException:
+        if writer is not None:
+            await run_in_threadpool(writer.discard)
+        raise
+    return ReceivedFile(writer.path, sha256, writer.size, state.filename, state.content_type)
+
+
+class AttachmentStore:
+    """attachment_blobs / attachments / attachment_usage とディスク上のファイルをまとめて更新する"""
+
+    def __init__(self, directory: str = ATTACHMENT_DIR, quota_bytes: int = ATTACHMENT_USER_QUOTA_BYTES):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.deduplicated = 0
+        self.bytes_stored = 0
+        self.bytes_deduplicated = 0
+        self.deleted_blobs = 0
+        self.swept_files = 0
+
+    def save(self, user_id: int, received: ReceivedFile,
+             trouble_id: Optional[int] = None, message_id: Optional[int] = None):
+        """
+        受信済みのファイルを登録する（使用量の加算・参照数の加算・行の追加を1トランザクションで）
+        クォータを超える場合は UploadError。一時ファイルは成否にかかわらず片付ける
+        """
+        path = blob_path(received.sha256, self.directory)
+        deduplicated = False
+        placed = False
+        try:
+            with get_db_connection() as connection, connection.transaction():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        INSERT INTO attachment_usage (user_id, bytes_used, file_count) VALUES (%s, 0, 0)
+                        ON DUPLICATE KEY UPDATE user_id = user_id
+                        """,
+                        (user_id,)
+                    )
+                    cursor.execute(
+                        """
+                        UPDATE attachment_usage
+                        SET bytes_used = bytes_used + %s, file_count = file_count + 1
+                        WHERE user_id = %s AND bytes_used + %s <= %s
+                        """,
+                        (received.size, user_id, received.size, self.quota_bytes)
+                    )
+                    if cursor.rowcount == 0:
+                        raise UploadError(413, "Attachment storage quota exceeded")
+
+                    # 行ロックを取ってからファイルを置く（同じ中身の削除と重ならないように）
+                    cursor.execute(
+                        """
+                        INSERT INTO attachment_blobs (sha256, size, ref_count) VALUES (%s, %s, 1)
+                        ON DUPLICATE KEY UPDATE ref_count = ref_count + 1
+                        """,
+                        (received.sha256, received.size)
+                    )
+                    if os.path.exists(path):
+                        deduplicated = True
+                    else:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        os.replace(received.path, path)
+                        placed = True
+
+                    cursor.execute(
+                        """
+                        INSERT INTO attachments
+                            (user_id, sha256, size, filename, content_type, trouble_id, message_id)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        """,
+                        (user_id, received.sha256, received.size, received.filename,
+                         received.content_type, trouble_id, message_id)
+                    )
+                    cursor.execute("SELECT * FROM attachments WHERE attachment_id = %s", (cursor.lastrowid,))
+                    attachment = cursor.fetchone()
+        except UploadError:
+            raise
+        except Exception:
+            logger.exception("Error saving attachment")
+            # ロールバックされたので、置いたファイルは（同じ中身が別に登録されていなければ）消す
+            if placed:
+                self._discard_unreferenced(received.sha256)
+            return None
+        finally:
+            received.discard()
+
+        with self._lock:
+            self.uploads += 1
+            if deduplicated:
+                self.deduplicated += 1
+                self.bytes_deduplicated += received.size
+            else:
+                self.bytes_stored += received.size
+        return attachment
+
+    def delete(self, attachment_id: int) -> bool:
+        """添付を削除して使用量を戻す。参照がなくなった中身はコミット後にファイルを消す"""
+        unreferenced = None
+        try:
+            with get_db_connection() as connection, connection.transaction():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT * FROM attachments WHERE attachment_id = %s FOR UPDATE", (attachment_id,)
+                    )
+                    attachment = cursor.fetchone()
+                    if attachment is None:
+                        return False
+                    cursor.execute("DELETE FROM attachments WHERE attachment_id = %s", (attachment_id,))
+                    cursor.execute(
+                        """
+                        UPDATE attachment_usage
+                        SET bytes_used = GREATEST(bytes_used - %s, 0), file_count = GREATEST(file_count - 1, 0)
+                        WHERE user_id = %s
+                        """,
+                        (attachment["size"], attachment["user_id"])
+                    )
+                    cursor.execute(
+                        "SELECT ref_count FROM attachment_blobs WHERE sha256 = %s FOR UPDATE",
+                        (attachment["sha256"],)
+                    )
+                    blob = cursor.fetchone()
+                    if blob is not None and blob["ref_count"] > 1:
+                        cursor.execute(
+                            "UPDATE attachment_blobs SET ref_count = ref_count - 1 WHERE sha256 = %s",
+                            (attachment["sha256"],)
+                        )
+                    else:
+                        cursor.execute("DELETE FROM attachment_blobs WHERE sha256 = %s", (attachment["sha256"],))
+                        unreferenced = attachment["sha256"]
+        except Exception:
+            logger.exception("Error deleting attachment")
+            return False
+        if unreferenced is not None and self._discard_unreferenced(unreferenced):
+            with self._lock:
+                self.deleted_blobs += 1
+        return True
+
+    def _discard_unreferenced(self, sha256: str) -> bool:
+        """
+        attachment_blobs に行がなければファイルを消す（消したら True）
+        行がなくても SELECT ... FOR UPDATE は同じ sha256 の INSERT を待たせる（REPEATABLE READ のギャップロック）ので、
+        消している間に同じ中身が登録されることはない（登録側は行をロックした後にファイルの有無を見て置き直す）
+        失敗した場合はファイルを残す（run_sweep_loop が後で消す）
+        """
+        try:
+            with get_db_connection() as connection, connection.transaction():
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT ref_count FROM attachment_blobs WHERE sha256 = %s FOR UPDATE", (sha256,))
+                    if cursor.fetchone() is not None:
+                        return False
+                    try:
+                        os.unlink(blob_path(sha256, self.directory))
+                    except FileNotFoundError:
+                        return False
+            return True
+        except Exception:
+            logger.exception("Error removing unreferenced attachment blob")
+            return False
+
+    def sweep(self, grace_seconds: float = ATTACHMENT_ORPHAN_GRACE_SECONDS, batch_size: int = 500) -> int:
+        """
+        DBに行のないファイルと、受信途中で残った一時ファイルを消して件数を返す
+        更新から grace_seconds 経っていないファイルは登録中かもしれないので残す
+        """
+        cutoff = time.time() - grace_seconds
+        tmp_dir = os.path.join(self.directory, "tmp")
+        removed = 0
+        candidates = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_mtime > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                if root == tmp_dir:
+                    try:
+                        os.unlink(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+                elif os.path.normpath(path) == os.path.normpath(blob_path(name, self.directory)):
+                    candidates.append(name)
+
+        for i in range(0, len(candidates), batch_size):
+            chunk = candidates[i:i + batch_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            with get_db_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT sha256 FROM attachment_blobs WHERE sha256 IN ({placeholders})", chunk)
+                    referenced = {row["sha256"] for row in cursor.fetchall()}
+            removed += sum(self._discard_unreferenced(sha256) for sha256 in chunk if sha256 not in referenced)
+
+        with self._lock:
+            self.swept_files += removed
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "deduplicated": self.deduplicated,
+                "bytes_stored": self.bytes_stored,
+                "bytes_deduplicated": self.bytes_deduplicated,
+                "deleted_blobs": self.deleted_blobs,
+                "swept_files": self.swept_files,
+            }
+
+
+attachment_store = AttachmentStore()
+
+
+async def run_sweep_loop(store: AttachmentStore = attachment_store):
+    """参照のないファイルを定期的に消す（lifespanでタスクとして起動）"""
+    while True:
+        await asyncio.sleep(ATTACHMENT_SWEEP_SECONDS)
+        try:
+            removed = await run_db(store.sweep)
+            if removed:
+                logger.info("Removed %d unreferenced attachment files", removed)
+        except Exception:
+            logger.exception("Error sweeping attachment files")
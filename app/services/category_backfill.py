@@ -0,0 +1,110 @@
+"""
+users.categories（カンマ区切り文字列）を user_categories テーブルへ移行するバックフィル
+
+user_id のキーセットページングでバッチごとに処理し、各バッチの書き込みと
+進捗（backfill_progress.last_id）の更新を同じトランザクションでコミットする。
+途中で止めても、次回は最後にコミットしたバッチの続きから再開する。
+categories テーブルにない名前は移行しない（カテゴリー一覧を広げない。users.categories には残る）。
+
+使い方:
+    python -m app.services.category_backfill --batch-size 1000
+    python -m app.services.category_backfill --restart   # 最初からやり直す
+"""
+import argparse
+import time
+
+from app.api.categories.models import CategoryModel
+from app.core.database import get_db_connection
+
+BACKFILL_JOB_NAME = "user_categories"
+
+
+def _get_last_id(cursor) -> int:
+    cursor.execute("SELECT last_id FROM backfill_progress WHERE job_name = %s", (BACKFILL_JOB_NAME,))
+    row = cursor.fetchone()
+    return row["last_id"] if row else 0
+
+
+def reset_progress():
+    with get_db_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM backfill_progress WHERE job_name = %s", (BACKFILL_JOB_NAME,))
+
+
+def backfill_batch(batch_size: int = 1000) -> int:
+    """1バッチ分を移行し、処理したユーザー数を返す（0なら完了）"""
+    with get_db_connection() as connection, connection.transaction():
+        with connection.cursor() as cursor:
+            last_id = _get_last_id(cursor)
+            cursor.execute(
+                """
+                SELECT user_id, categories FROM users
+                WHERE user_id > %s
+                ORDER BY user_id
+                LIMIT %s
+                """,
+                (last_id, batch_size),
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return 0
+
+            names_by_user = {
+                row["user_id"]: [n.strip() for n in row["categories"].split(",") if n.strip()]
+                for row in rows
+                if row["categories"]
+            }
+            all_names = {n for names in names_by_user.values() for n in names}
+            category_ids = CategoryModel.get_ids_by_names(all_names, cursor)
+            pairs = [
+                (user_id, category_ids[name])
+                for user_id, names in names_by_user.items()
+                for name in names
+                if name in category_ids
+            ]
+            if pairs:
+                cursor.executemany(
+                    "INSERT IGNORE INTO user_categories (user_id, category_id) VALUES (%s, %s)",
+                    pairs,
+                )
+
+            cursor.execute(
+                """
+                INSERT INTO backfill_progress (job_name, last_id, processed)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE last_id = VALUES(last_id), processed = processed + VALUES(processed)
+                """,
+                (BACKFILL_JOB_NAME, rows[-1]["user_id"], len(rows)),
+            )
+            return len(rows)
+
+
+def run_backfill(batch_size: int = 1000, pause_seconds: float = 0.0, max_batches: int = None) -> int:
+    """完了するまで（または max_batches まで）バッチを繰り返し、処理したユーザー数を返す"""
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        processed = backfill_batch(batch_size)
+        if processed == 0:
+            break
+        total += processed
+        batches += 1
+        print(f"backfill {BACKFILL_JOB_NAME}: batch {batches}, {total} users processed")
+        if pause_seconds:
+            # 本番DBへの負荷を抑えるためバッチ間で待つ
+            time.sleep(pause_seconds)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="users.categories を user_categories へ移行する")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.0, help="バッチ間の待ち時間（秒）")
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--restart", action="store_true", help="進捗を消して最初から実行する")
+    args = parser.parse_args()
+
+    if args.restart:
+        reset_progress()
+    total = run_backfill(args.batch_size, args.pause, args.max_batches)
+    print(f"backfill {BACKFILL_JOB_NAME}: done, {total} users processed")
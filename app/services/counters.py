@@ -0,0 +1,225 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from app.core.cache import principal_cache
+from app.core.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# ユーザーカウンター（ポイント・回答数・最終ログイン）の書き込み設定
+# buffered: メモリ上で集約してまとめて書き込む / sync: 呼び出しごとに即時UPDATE
+COUNTER_WRITE_MODE = os.getenv("COUNTER_WRITE_MODE", "buffered")
+COUNTER_FLUSH_INTERVAL_SECONDS = float(os.getenv("COUNTER_FLUSH_INTERVAL_SECONDS", "1.0"))
+COUNTER_FLUSH_MAX_PENDING = int(os.getenv("COUNTER_FLUSH_MAX_PENDING", "500"))
+
+
+class _PendingCounters:
+    __slots__ = ("points", "answers", "login")
+
+    def __init__(self):
+        self.points = 0
+        self.answers = 0
+        self.login = False
+
+
+class UserCounterBuffer:
+    """
+    usersテーブルのカウンター更新をuser_idごとに集約するライトビハインドバッファ
+    - 一定間隔、または保留中のユーザー数が上限に達したときに1本のUPDATEで書き込む
+    - stop() で残りを書き込んでから停止する
+    - 停止中、または mode が sync の場合は記録を受け付けない（呼び出し側が即時更新する）
+    """
+
+    def __init__(self, mode: str = COUNTER_WRITE_MODE, interval: float = COUNTER_FLUSH_INTERVAL_SECONDS,
+                 max_pending: int = COUNTER_FLUSH_MAX_PENDING):
+        self.mode = mode
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.flushed_users = 0
+        self.failed_flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and not self._stopping.is_set()
+
+    def start(self):
+        if self.mode != "buffered" or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="user-counter-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        フラッシュスレッドを止め、保留中の更新をすべて書き込む
+        書き込みに失敗した場合は1回だけやり直し、それでも失敗した分はユーザーごとの増減をエラーログに残す
+        """
+        thread = self._thread
+        if thread is None:
+            return
+        # _record() はロック内で running を見る。止める前に受け付けた記録は必ず最後のフラッシュに入り、
+        # 後のものは受け付けない（呼び出し側が即時更新する）
+        with self._lock:
+            self._stopping.set()
+        self._wakeup.set()
+        thread.join()
+        self._thread = None
+        self.flush()
+        if self._pending:
+            self.flush()
+        self._log_lost()
+
+    def _log_lost(self):
+        """停止時に書き込めなかった更新（プロセスの終了で失われる）を記録する"""
+        with self._lock:
+            lost, self._pending = self._pending, {}
+        for user_id, counters in lost.items():
+            logger.error("Lost user counter update", extra={
+                "user_id": user_id, "points": counters.points, "answers": counters.answers,
+                "login": counters.login,
+            })
+
+    def _record(self, user_id: int, points: int = 0, answers: int = 0, login: bool = False) -> bool:
+        with self._lock:
+            if not self.running:
+                return False
+            pending = self._pending.get(user_id)
+            if pending is None:
+                pending = self._pending[user_id] = _PendingCounters()
+            pending.points += points
+            pending.answers += answers
+            pending.login = pending.login or login
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+        return True
+
+    def add_points(self, user_id: int, points: int) -> bool:
+        return self._record(user_id, points=points)
+
+    def add_answers(self, user_id: int, count: int = 1) -> bool:
+        return self._record(user_id, answers=count)
+
+    def touch_login(self, user_id: int) -> bool:
+        return self._record(user_id, login=True)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            self.flush()
+
+    def flush(self) -> int:
+        """保留中の更新を1本のUPDATE文で書き込み、書き込んだユーザー数を返す"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            sql, params = self._build_update(pending)
+            try:
+                with get_db_connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, params)
+            except Exception:
+                logger.exception("Error flushing user counters")
+                self.failed_flushes += 1
+                self._restore(pending)
+                return 0
+
+            self.flushes += 1
+            self.flushed_users += len(pending)
+            for user_id in pending:
+                principal_cache.invalidate_user(user_id)
+            return len(pending)
+
+    def _restore(self, pending: dict):
+        """書き込みに失敗した分を次回のフラッシュに戻す"""
+        with self._lock:
+            for user_id, counters in pending.items():
+                current = self._pending.get(user_id)
+                if current is None:
+                    self._pending[user_id] = counters
+                    continue
+                current.points += counters.points
+                current.answers += counters.answers
+                current.login = current.login or counters.login
+
+    @staticmethod
+    def _build_update(pending: dict):
+        assignments = []
+        params = []
+
+        points = [(uid, c.points) for uid, c in pending.items() if c.points]
+        if points:
+            cases = " ".join(["WHEN %s THEN %s"] * len(points))
+            assignments.append(f"point_total = point_total + CASE user_id {cases} ELSE 0 END")
+            for uid, delta in points:
+                params.extend((uid, delta))
+
+        answers = [(uid, c.answers) for uid, c in pending.items() if c.answers]
+        if answers:
+            cases = " ".join(["WHEN %s THEN %s"] * len(answers))
+            assignments.append(f"num_answer = num_answer + CASE user_id {cases} ELSE 0 END")
+            for uid, delta in answers:
+                params.extend((uid, delta))
+
+        logins = [uid for uid, c in pending.items() if c.login]
+        if logins:
+            placeholders = ", ".join(["%s"] * len(logins))
+            assignments.append(
+                f"last_login_at = CASE WHEN user_id IN ({placeholders}) THEN NOW() ELSE last_login_at END"
+            )
+            params.extend(logins)
+
+        user_ids = list(pending)
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        params.extend(user_ids)
+        sql = f"UPDATE users SET {', '.join(assignments)} WHERE user_id IN ({placeholders})"
+        return sql, params
+
+    @contextmanager
+    def holding_flushes(self):
+        """
+        ブロックの間はフラッシュしない（保留中の増減がDBへ移らない）
+        DBの値と pending_points() / pending_answers() を食い違いなく組み合わせて読むために使う
+        """
+        with self._flush_lock:
+            yield
+
+    def pending_points(self) -> dict:
+        """まだ書き込まれていないポイントの増減（user_id -> 増減）"""
+        with self._lock:
+            return {user_id: c.points for user_id, c in self._pending.items() if c.points}
+
+    def pending_answers(self) -> dict:
+        """まだ書き込まれていない回答数の増分（user_id -> 増分）"""
+        with self._lock:
+            return {user_id: c.answers for user_id, c in self._pending.items() if c.answers}
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "mode": self.mode,
+            "running": self.running,
+            "pending_users": pending,
+            "flushes": self.flushes,
+            "flushed_users": self.flushed_users,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+user_counter_buffer = UserCounterBuffer()
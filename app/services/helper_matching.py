@@ -0,0 +1,360 @@
+"""
+お困りごとに答えられそうなユーザー（ヘルパー）のマッチング
+
+各ユーザーの所属カテゴリーをビットマスク（カテゴリーIDごとに1ビット）で表し、
+回答数・ポイントは user_id ごとのスロットに割り当てた配列（array）に持つ。
+
+スコア = MATCH_CATEGORY_WEIGHT × (お困りごとのカテゴリーと重なる数)
+       + MATCH_ANSWER_WEIGHT × log(1 + 回答数) + MATCH_POINT_WEIGHT × log(1 + ポイント)
+
+カテゴリーのカタログは小さいので、同じマスクのユーザーをグループにまとめ、グループごとに
+(−活動スコア（後半2項）, user_id) のソート済みリストを持つ（更新は bisect で O(log n) の探索）。
+重なりの項はグループ内で共通なので、検索時は「グループごとに1回」だけビット演算して
+各グループの先頭をヒープに積み、上位K件を取り出すまでヒープから順に進める。
+計算量はユーザー数ではなく O(グループ数 + K log グループ数)。
+
+- 登録・ポイント加算・回答数の加算のたびに差分で更新する（UserModel から呼ぶ）
+- 起動時と MATCHING_REBUILD_SECONDS ごとに rebuild() でDBから作り直す
+  （numpy は依存に無いため、数値の一括演算はグループ単位の計算で代替している）
+- ビット位置は rebuild のたびにカテゴリー一覧のID順で振り直す。64 を超えた場合はマスクを
+  array('Q') から Python の int（任意長）のリストに切り替える（カテゴリーを無視しない）
+"""
+import asyncio
+import bisect
+import heapq
+import logging
+import math
+import os
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.api.categories.catalog import category_catalog
+from app.core.database import get_db_connection, run_db
+from app.services.counters import user_counter_buffer
+
+MATCHING_REBUILD_SECONDS = float(os.getenv("MATCHING_REBUILD_SECONDS", "300"))
+MATCH_CATEGORY_WEIGHT = float(os.getenv("MATCH_CATEGORY_WEIGHT", "10"))
+MATCH_ANSWER_WEIGHT = float(os.getenv("MATCH_ANSWER_WEIGHT", "1"))
+MATCH_POINT_WEIGHT = float(os.getenv("MATCH_POINT_WEIGHT", "0.5"))
+
+# array('Q') のマスクに収まるカテゴリー数。超えたら Python の int のリストに切り替える
+MAX_CATEGORY_BITS = 64
+# 同点の判定がぶれないように、スコアはこの倍率で整数にして持つ
+_SCALE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def activity_score(num_answer: int, point_total: int) -> int:
+    """活動スコア（_SCALE 倍した整数）"""
+    return int(_SCALE * (
+        MATCH_ANSWER_WEIGHT * math.log1p(max(num_answer, 0))
+        + MATCH_POINT_WEIGHT * math.log1p(max(point_total, 0))
+    ))
+
+
+class HelperMatcher:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # カテゴリーID -> ビット位置
+        self._bits: Dict[int, int] = {}
+        # user_id -> スロット。スロットごとの配列に属性を持つ（削除したスロットは再利用する）
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._user_ids = array("q")
+        self._masks = array("Q")
+        self._answers = array("q")
+        self._points = array("q")
+        self._scores = array("q")
+        # マスク -> そのマスクのユーザーの (−活動スコア, user_id) の昇順リスト
+        self._groups: Dict[int, List[Tuple[int, int]]] = {}
+        # rebuild の読み込み中に呼ばれた更新 (メソッド名, 引数)。差し替える前に新しい方へ適用し直す
+        self._journal: Optional[list] = None
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _mask_for(self, category_ids: Iterable[int], allocate: bool) -> int:
+        mask = 0
+        for category_id in category_ids:
+            bit = self._bits.get(category_id)
+            if bit is None:
+                # 誰も持っていないカテゴリーは重なりに関係しない
+                if not allocate:
+                    continue
+                # 前回の rebuild 以降に作られたカテゴリー
+                bit = self._bits[category_id] = len(self._bits)
+                if bit >= MAX_CATEGORY_BITS and isinstance(self._masks, array):
+                    self._widen()
+            mask |= 1 << bit
+        return mask
+
+    def _widen(self):
+        logger.warning("More than %d categories; using arbitrary-precision masks for matching", MAX_CATEGORY_BITS)
+        self._masks = list(self._masks)
+
+    def _record(self, name: str, *args):
+        if self._journal is not None:
+            self._journal.append((name, args))
+
+    def _unlink(self, slot: int):
+        """スロットのユーザーをグループから外す"""
+        mask = self._masks[slot]
+        group = self._groups[mask]
+        del group[bisect.bisect_left(group, (-self._scores[slot], self._user_ids[slot]))]
+        if not group:
+            del self._groups[mask]
+
+    def _link(self, slot: int):
+        score = self._scores[slot] = activity_score(self._answers[slot], self._points[slot])
+        group = self._groups.get(self._masks[slot])
+        if group is None:
+            group = self._groups[self._masks[slot]] = []
+        bisect.insort(group, (-score, self._user_ids[slot]))
+
+    def _rescore(self, slot: int):
+        self._unlink(slot)
+        self._link(slot)
+
+    def add_user(self, user_id: int, category_ids: Iterable[int] = (), num_answer: int = 0, point_total: int = 0):
+        """ユーザーを登録（既にいる場合はカテゴリーと回答数・ポイントを置き換える）"""
+        category_ids = tuple(category_ids)
+        with self._lock:
+            self._record("add_user", user_id, category_ids, num_answer, point_total)
+            self._remove(user_id)
+            mask = self._mask_for(category_ids, allocate=True)
+            if self._free:
+                slot = self._free.pop()
+                self._user_ids[slot], self._masks[slot] = user_id, mask
+                self._answers[slot], self._points[slot] = num_answer, point_total
+            else:
+                slot = len(self._user_ids)
+                self._user_ids.append(user_id)
+                self._masks.append(mask)
+                self._answers.append(num_answer)
+                self._points.append(point_total)
+                self._scores.append(0)
+            self._slots[user_id] = slot
+            self._link(slot)
+
+    def remove_user(self, user_id: int):
+        with self._lock:
+            self._record("remove_user", user_id)
+            self._remove(user_id)
+
+    def _remove(self, user_id: int):
+        slot = self._slots.pop(user_id, None)
+        if slot is None:
+            return
+        self._unlink(slot)
+        self._free.append(slot)
+
+    def apply_points(self, user_id: int, delta: int):
+        """ポイント加算（未登録のユーザーは次の rebuild で入る）"""
+        with self._lock:
+            self._record("apply_points", user_id, delta)
+            slot = self._slots.get(user_id)
+            if slot is not None:
+                self._points[slot] += delta
+                self._rescore(slot)
+
+    def add_answers(self, user_id: int, count: int = 1):
+        with self._lock:
+            self._record("add_answers", user_id, count)
+            slot = self._slots.get(user_id)
+            if slot is not None:
+                self._answers[slot] += count
+                self._rescore(slot)
+
+    def top(self, category_ids: Iterable[int], k: int = 10, exclude: Iterable[int] = ()) -> List[Tuple[int, float, int]]:
+        """
+        上位 k 人の (user_id, スコア, 重なったカテゴリー数)
+        スコアが同じ場合は user_id の小さい方が上
+        """
+        exclude = set(exclude)
+        category_weight = int(MATCH_CATEGORY_WEIGHT * _SCALE)
+        with self._lock:
+            target = self._mask_for(category_ids, allocate=False)
+            # (−スコア, user_id, グループ内の位置, 重なりの項, 重なり, グループ)
+            heap = []
+            for mask, group in self._groups.items():
+                overlap = (mask & target).bit_count()
+                negative_activity, user_id = group[0]
+                bonus = overlap * category_weight
+                heap.append((negative_activity - bonus, user_id, 0, bonus, overlap, group))
+            heapq.heapify(heap)
+
+            results = []
+            while heap and len(results) < k:
+                negative_score, user_id, position, bonus, overlap, group = heap[0]
+                if user_id not in exclude:
+                    results.append((user_id, round(-negative_score / _SCALE, 3), overlap))
+                position += 1
+                if position < len(group):
+                    negative_activity, user_id = group[position]
+                    heapq.heapreplace(heap, (negative_activity - bonus, user_id, position, bonus, overlap, group))
+                else:
+                    heapq.heappop(heap)
+            return results
+
+    def rebuild(self, batch_size: int = 5000) -> int:
+        """
+        DBから全ユーザーの回答数・ポイントと所属カテゴリーを読み込んで作り直す
+        読み込み中に呼ばれた add_user / remove_user / apply_points / add_answers は journal に記録し、
+        差し替える直前に新しい方へ適用し直す（読み込みの間に入った更新を取りこぼさない）
+
+        読み込みの間もカウンターのフラッシュは止めない。その間に値が変わりうるユーザー
+        （読み込み開始時に保留中の加算があった / journal に加算が記録された）は、仕上げで
+        フラッシュを止めてからプライマリの値 + 保留中の加算で置き換える
+        """
+        with self._lock:
+            journal = self._journal = []
+        try:
+            dirty = set(user_counter_buffer.pending_points()) | set(user_counter_buffer.pending_answers())
+            users, categories = self._load(batch_size)
+            fresh = self._build(users, categories)
+
+            with user_counter_buffer.holding_flushes():
+                # ここまでの journal の加算は、DBの値か保留中の加算のどちらかに入っている
+                with self._lock:
+                    replayed = len(journal)
+                    pending_points = user_counter_buffer.pending_points()
+                    pending_answers = user_counter_buffer.pending_answers()
+                for name, args in journal[:replayed]:
+                    if name in ("add_user", "remove_user"):
+                        getattr(fresh, name)(*args)
+                    dirty.add(args[0])
+                dirty.update(pending_points)
+                dirty.update(pending_answers)
+                fresh._set_counts(self._load_counts(dirty, batch_size), pending_points, pending_answers)
+
+                with self._lock:
+                    for name, args in journal[replayed:]:
+                        getattr(fresh, name)(*args)
+                    self._bits = fresh._bits
+                    self._slots = fresh._slots
+                    self._free = fresh._free
+                    self._user_ids = fresh._user_ids
+                    self._masks = fresh._masks
+                    self._answers = fresh._answers
+                    self._points = fresh._points
+                    self._scores = fresh._scores
+                    self._groups = fresh._groups
+                    self.loaded = True
+        finally:
+            with self._lock:
+                self._journal = None
+        return len(users)
+
+    @staticmethod
+    def _load(batch_size: int):
+        categories: Dict[int, List[int]] = {}
+        users = []
+        with get_db_connection(read_only=True) as connection:
+            with connection.cursor() as cursor:
+                after_id = 0
+                while True:
+                    cursor.execute(
+                        """
+                        SELECT user_id, num_answer, point_total FROM users
+                        WHERE user_id > %s ORDER BY user_id LIMIT %s
+                        """,
+                        (after_id, batch_size)
+                    )
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    users.extend(rows)
+                    after_id = rows[-1]["user_id"]
+
+                cursor.execute("SELECT user_id, category_id FROM user_categories")
+                for row in cursor.fetchall():
+                    categories.setdefault(row["user_id"], []).append(row["category_id"])
+        return users, categories
+
+    @staticmethod
+    def _load_counts(user_ids, batch_size: int) -> List[dict]:
+        """指定したユーザーの回答数・ポイント（プライマリから読む。書き込み直後の値が要るため）"""
+        user_ids = sorted(user_ids)
+        rows = []
+        if not user_ids:
+            return rows
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                for i in range(0, len(user_ids), batch_size):
+                    chunk = user_ids[i:i + batch_size]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cursor.execute(
+                        f"SELECT user_id, num_answer, point_total FROM users WHERE user_id IN ({placeholders})",
+                        chunk
+                    )
+                    rows.extend(cursor.fetchall())
+        return rows
+
+    @staticmethod
+    def _category_bits(categories: Dict[int, List[int]]) -> Dict[int, int]:
+        """カテゴリーID -> ビット位置。カテゴリー一覧のID順に振り、一覧にないID（読み込み後に作られたもの）を後ろに足す"""
+        snapshot = category_catalog.current() or category_catalog.refresh()
+        catalog_ids = sorted(set(snapshot.ids.values()))
+        seen = {category_id for ids in categories.values() for category_id in ids}
+        ordered = catalog_ids + sorted(seen.difference(catalog_ids))
+        return {category_id: bit for bit, category_id in enumerate(ordered)}
+
+    @classmethod
+    def _build(cls, users, categories) -> "HelperMatcher":
+        fresh = cls()
+        fresh._bits = cls._category_bits(categories)
+        if len(fresh._bits) > MAX_CATEGORY_BITS:
+            fresh._widen()
+        for slot, row in enumerate(users):
+            user_id = row["user_id"]
+            fresh._slots[user_id] = slot
+            fresh._user_ids.append(user_id)
+            fresh._masks.append(fresh._mask_for(categories.get(user_id, ()), allocate=True))
+            fresh._answers.append(row["num_answer"] or 0)
+            fresh._points.append(row["point_total"] or 0)
+            score = activity_score(fresh._answers[slot], fresh._points[slot])
+            fresh._scores.append(score)
+            fresh._groups.setdefault(fresh._masks[slot], []).append((-score, user_id))
+        # 1件ずつ insort せず、グループごとにまとめてソートする
+        for group in fresh._groups.values():
+            group.sort()
+        return fresh
+
+    def _set_counts(self, rows: Iterable[dict], pending_points: dict, pending_answers: dict):
+        """DBから読み直した回答数・ポイントに、まだDBに書き込まれていない加算を足して置き換える"""
+        with self._lock:
+            for row in rows:
+                user_id = row["user_id"]
+                slot = self._slots.get(user_id)
+                if slot is not None:
+                    self._answers[slot] = (row["num_answer"] or 0) + pending_answers.get(user_id, 0)
+                    self._points[slot] = (row["point_total"] or 0) + pending_points.get(user_id, 0)
+                    self._rescore(slot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._slots),
+                "groups": len(self._groups),
+                "categories": len(self._bits),
+                "loaded": self.loaded,
+            }
+
+
+helper_matcher = HelperMatcher()
+
+
+async def run_rebuild_loop(matcher: HelperMatcher = helper_matcher):
+    """起動時にDBから読み込み、その後も定期的に作り直す（lifespanでタスクとして起動）"""
+    # fork 前に読み込み済み（app.server のプリロード）なら次の周期から
+    if matcher.loaded:
+        await asyncio.sleep(MATCHING_REBUILD_SECONDS)
+    while True:
+        try:
+            await run_db(matcher.rebuild)
+        except Exception:
+            logger.exception("Error rebuilding helper matcher")
+        await asyncio.sleep(MATCHING_REBUILD_SECONDS)
@@ -0,0 +1,390 @@
+"""
+ポイントランキング
+
+(−point_total, user_id) をキーにしたインデックス付きスキップリストで順位を保持し、
+上位N件・自分の順位・自分の前後の取得をいずれも O(log n) で行う。
+
+- UserModel.update_points のたびに apply_delta() で更新する
+- 起動時と LEADERBOARD_REBUILD_SECONDS ごとに rebuild() でDBから作り直す
+  （他ワーカーでのポイント変更を取り込むため。読み込み中の更新は journal に記録して差し替える前に
+  適用し直し、未書き込みのバッファ分は足し戻す。helper_matching の rebuild と同じ手順）
+- 全体のランキングに加え、user_categories に基づくカテゴリー別ランキングを持つ
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.database import get_db_connection, run_db
+from app.services.counters import user_counter_buffer
+
+LEADERBOARD_REBUILD_SECONDS = float(os.getenv("LEADERBOARD_REBUILD_SECONDS", "300"))
+
+_MAX_LEVELS = 32
+
+logger = logging.getLogger(__name__)
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """
+    位置（0始まりの順位）で要素を引けるスキップリスト
+    各リンクが飛ばす要素数（width）を持つことで、挿入・削除・順位計算・位置指定の取得が O(log n)
+    """
+
+    _TAIL_KEY = (math.inf,)
+
+    def __init__(self):
+        self._tail = _Node(self._TAIL_KEY, 0)
+        self._head = _Node(None, _MAX_LEVELS)
+        self._head.next = [self._tail] * _MAX_LEVELS
+        # 使用中の段数（これより上の段は走査しない）
+        self._levels = 1
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, key):
+        levels = min(_MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2.0)))
+        head = self._head
+        for level in range(self._levels, levels):
+            head.next[level] = self._tail
+            head.width[level] = self.size + 1
+        self._levels = max(self._levels, levels)
+
+        chain = [None] * self._levels
+        steps_at_level = [0] * self._levels
+        node = head
+        for level in reversed(range(self._levels)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        new_node = _Node(key, levels)
+        steps = 0
+        for level in range(levels):
+            previous = chain[level]
+            new_node.next[level] = previous.next[level]
+            previous.next[level] = new_node
+            new_node.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self._levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * self._levels
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            previous = chain[level]
+            previous.width[level] += target.width[level] - 1
+            previous.next[level] = target.next[level]
+        for level in range(len(target.next), self._levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def index(self, key) -> int:
+        """key の位置（0始まり）。key より小さい要素の数"""
+        position = 0
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def slice(self, start: int, stop: int) -> List:
+        """位置 start から stop の手前までの要素"""
+        start = max(start, 0)
+        stop = min(stop, self.size)
+        if start >= stop:
+            return []
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(self._levels)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        for _ in range(stop - start):
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """1つのランキング（全体 or 1カテゴリー）"""
+
+    def __init__(self):
+        self._points: Dict[int, int] = {}
+        self._ranking = IndexableSkipList()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, user_id: int):
+        return user_id in self._points
+
+    def set(self, user_id: int, points: int):
+        current = self._points.get(user_id)
+        if current == points:
+            return
+        if current is not None:
+            self._ranking.remove((-current, user_id))
+        self._points[user_id] = points
+        self._ranking.insert((-points, user_id))
+
+    def add(self, user_id: int, delta: int):
+        self.set(user_id, self._points.get(user_id, 0) + delta)
+
+    def discard(self, user_id: int):
+        current = self._points.pop(user_id, None)
+        if current is not None:
+            self._ranking.remove((-current, user_id))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1始まりの順位（同点の場合は user_id の小さい方が上）"""
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        return self._ranking.index((-points, user_id)) + 1
+
+    def entries(self, start: int, stop: int) -> List[Tuple[int, int, int]]:
+        """(順位, user_id, ポイント) のリスト。start/stop は0始まりの位置"""
+        start = max(start, 0)
+        return [
+            (start + offset + 1, user_id, -negative_points)
+            for offset, (negative_points, user_id) in enumerate(self._ranking.slice(start, stop))
+        ]
+
+
+class LeaderboardRegistry:
+    """全体ランキングとカテゴリー別ランキングをまとめて管理する"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._global = Leaderboard()
+        self._by_category: Dict[int, Leaderboard] = {}
+        self._categories: Dict[int, Tuple[int, ...]] = {}
+        self._names: Dict[int, str] = {}
+        # rebuild の読み込み中に呼ばれた更新 (メソッド名, 引数)。差し替える前に新しい方へ適用し直す
+        self._journal: Optional[list] = None
+        self.loaded = False
+
+    def _record(self, name: str, *args):
+        if self._journal is not None:
+            self._journal.append((name, args))
+
+    def _boards_for(self, user_id: int) -> List[Leaderboard]:
+        boards = [self._global]
+        for category_id in self._categories.get(user_id, ()):
+            board = self._by_category.get(category_id)
+            if board is None:
+                board = self._by_category[category_id] = Leaderboard()
+            boards.append(board)
+        return boards
+
+    def add_user(self, user_id: int, name: str, points: int, category_ids: Iterable[int] = ()):
+        """ユーザーを登録（既にいる場合はポイントとカテゴリーを置き換える）"""
+        category_ids = tuple(category_ids)
+        with self._lock:
+            self._record("add_user", user_id, name, points, category_ids)
+            self._remove(user_id)
+            self._names[user_id] = name
+            self._categories[user_id] = category_ids
+            for board in self._boards_for(user_id):
+                board.set(user_id, points)
+
+    def remove_user(self, user_id: int):
+        with self._lock:
+            self._record("remove_user", user_id)
+            self._remove(user_id)
+
+    def _remove(self, user_id: int):
+        for board in self._boards_for(user_id):
+            board.discard(user_id)
+        self._categories.pop(user_id, None)
+        self._names.pop(user_id, None)
+
+    def apply_delta(self, user_id: int, delta: int):
+        """ポイントの増減を反映（未登録のユーザーは次回の rebuild で取り込まれる）"""
+        with self._lock:
+            self._record("apply_delta", user_id, delta)
+            if user_id not in self._global:
+                return
+            for board in self._boards_for(user_id):
+                board.add(user_id, delta)
+
+    def contains(self, user_id: int) -> bool:
+        return user_id in self._global
+
+    def _board(self, category_id: Optional[int]) -> Leaderboard:
+        if category_id is None:
+            return self._global
+        return self._by_category.get(category_id) or Leaderboard()
+
+    def _to_dicts(self, entries):
+        return [
+            {"rank": rank, "user_id": user_id, "name": self._names.get(user_id), "point_total": points}
+            for rank, user_id, points in entries
+        ]
+
+    def top(self, n: int, category_id: Optional[int] = None) -> List[dict]:
+        with self._lock:
+            return self._to_dicts(self._board(category_id).entries(0, n))
+
+    def rank(self, user_id: int, category_id: Optional[int] = None) -> Optional[dict]:
+        with self._lock:
+            board = self._board(category_id)
+            rank = board.rank(user_id)
+            if rank is None:
+                return None
+            return {"rank": rank, "total": len(board), **self._to_dicts(board.entries(rank - 1, rank))[0]}
+
+    def neighbors(self, user_id: int, radius: int, category_id: Optional[int] = None) -> Optional[List[dict]]:
+        """自分の前後 radius 人（自分を含む）"""
+        with self._lock:
+            board = self._board(category_id)
+            rank = board.rank(user_id)
+            if rank is None:
+                return None
+            return self._to_dicts(board.entries(rank - 1 - radius, rank + radius))
+
+    def rebuild(self, batch_size: int = 5000) -> int:
+        """
+        DBから全ユーザーのポイントと所属カテゴリーを読み込んで作り直す
+        読み込み中に呼ばれた add_user / remove_user / apply_delta は journal に記録し、
+        差し替える直前に新しい方へ適用し直す（読み込みの間に入った更新を取りこぼさない）
+
+        読み込みの間もカウンターのフラッシュは止めない。その間にポイントが変わりうるユーザー
+        （読み込み開始時に保留中の加算があった / journal に記録された）は、仕上げで
+        フラッシュを止めてからプライマリの値 + 保留中の加算で置き換える
+        """
+        with self._lock:
+            journal = self._journal = []
+        try:
+            dirty = set(user_counter_buffer.pending_points())
+            users, categories = self._load(batch_size)
+            fresh = LeaderboardRegistry()
+            for row in users:
+                fresh.add_user(
+                    row["user_id"], row["name"], row["point_total"] or 0, categories.get(row["user_id"], ())
+                )
+
+            with user_counter_buffer.holding_flushes():
+                # ここまでの journal の増減は、DBの値か保留中の加算のどちらかに入っている
+                with self._lock:
+                    replayed = len(journal)
+                    pending_points = user_counter_buffer.pending_points()
+                for name, args in journal[:replayed]:
+                    if name in ("add_user", "remove_user"):
+                        getattr(fresh, name)(*args)
+                    dirty.add(args[0])
+                dirty.update(pending_points)
+                fresh._set_points(self._load_points(dirty, batch_size), pending_points)
+
+                with self._lock:
+                    for name, args in journal[replayed:]:
+                        getattr(fresh, name)(*args)
+                    self._global = fresh._global
+                    self._by_category = fresh._by_category
+                    self._categories = fresh._categories
+                    self._names = fresh._names
+                    self.loaded = True
+        finally:
+            with self._lock:
+                self._journal = None
+        return len(users)
+
+    @staticmethod
+    def _load(batch_size: int):
+        categories: Dict[int, List[int]] = {}
+        users = []
+        with get_db_connection(read_only=True) as connection:
+            with connection.cursor() as cursor:
+                after_id = 0
+                while True:
+                    cursor.execute(
+                        """
+                        SELECT user_id, name, point_total FROM users
+                        WHERE user_id > %s ORDER BY user_id LIMIT %s
+                        """,
+                        (after_id, batch_size)
+                    )
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    users.extend(rows)
+                    after_id = rows[-1]["user_id"]
+
+                cursor.execute("SELECT user_id, category_id FROM user_categories")
+                for row in cursor.fetchall():
+                    categories.setdefault(row["user_id"], []).append(row["category_id"])
+        return users, categories
+
+    @staticmethod
+    def _load_points(user_ids, batch_size: int) -> List[dict]:
+        """指定したユーザーのポイント（プライマリから読む。書き込み直後の値が要るため）"""
+        user_ids = sorted(user_ids)
+        rows = []
+        if not user_ids:
+            return rows
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                for i in range(0, len(user_ids), batch_size):
+                    chunk = user_ids[i:i + batch_size]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cursor.execute(f"SELECT user_id, point_total FROM users WHERE user_id IN ({placeholders})", chunk)
+                    rows.extend(cursor.fetchall())
+        return rows
+
+    def _set_points(self, rows: Iterable[dict], pending_points: dict):
+        """DBから読み直したポイントに、まだDBに書き込まれていない加算を足して置き換える"""
+        with self._lock:
+            for row in rows:
+                user_id = row["user_id"]
+                if user_id in self._global:
+                    points = (row["point_total"] or 0) + pending_points.get(user_id, 0)
+                    for board in self._boards_for(user_id):
+                        board.set(user_id, points)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"users": len(self._global), "categories": len(self._by_category), "loaded": self.loaded}
+
+
+leaderboards = LeaderboardRegistry()
+
+
+async def run_rebuild_loop(registry: LeaderboardRegistry = leaderboards):
+    """起動時にDBから読み込み、その後も定期的に作り直す（lifespanでタスクとして起動）"""
+    # fork 前に読み込み済み（app.server のプリロード）なら次の周期から
+    if registry.loaded:
+        await asyncio.sleep(LEADERBOARD_REBUILD_SECONDS)
+    while True:
+        try:
+            await run_db(registry.rebuild)
+        except Exception:
+            logger.exception("Error rebuilding leaderboard")
+        await asyncio.sleep(LEADERBOARD_REBUILD_SECONDS)
@@ -0,0 +1,294 @@
+"""
+リアルタイム配信（WebSocket / SSE）用のプロセス内ファンアウトハブ
+
+- 接続ごとに上限付きの送信キューを持ち、溢れた接続（遅いクライアント）は切断する
+- イベントはブローカー経由で配信する。ブローカーは差し替え可能:
+    REALTIME_BROKER_URL=local                 同一プロセス内のみ（既定）
+    REALTIME_BROKER_URL=tcp://127.0.0.1:8765  複数ワーカー間で共有（ローカル中継ブローカー）
+    REALTIME_BROKER_URL=package.module:Class  独自実装（Broker を継承したクラス）
+- ローカル中継ブローカーの起動:
+    python -m app.services.realtime --host 127.0.0.1 --port 8765
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, Optional, Set
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+REALTIME_BROKER_URL = os.getenv("REALTIME_BROKER_URL", "local")
+# 接続ごとの送信待ちイベント数の上限（超えたら遅いクライアントとして切断）
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
+# ローカル中継ブローカーに再接続するまでの待ち時間
+REALTIME_RECONNECT_SECONDS = float(os.getenv("REALTIME_RECONNECT_SECONDS", "1.0"))
+
+
+class Subscription:
+    """1接続分の購読。送信キューは上限付き"""
+
+    def __init__(self, user_id: int, maxsize: int = REALTIME_QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = asyncio.Event()
+        self.close_reason: Optional[str] = None
+
+    def offer(self, data: str) -> bool:
+        """送信キューに積む。満杯なら False"""
+        if self.closed.is_set():
+            return True
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self, reason: str):
+        if not self.closed.is_set():
+            self.close_reason = reason
+            self.closed.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        次に送るイベント（JSON文字列）。切断済みなら None
+        timeout 秒以内にイベントがなければ asyncio.TimeoutError
+        """
+        if self.closed.is_set():
+            return None
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        getter = asyncio.ensure_future(self.queue.get())
+        closer = asyncio.ensure_future(self.closed.wait())
+        try:
+            await asyncio.wait({getter, closer}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closer.cancel()
+            if not getter.done():
+                getter.cancel()
+        if getter.done() and not getter.cancelled():
+            return getter.result()
+        if self.closed.is_set():
+            return None
+        raise asyncio.TimeoutError
+
+
+class Broker(ABC):
+    """
+    ワーカー間でイベントを共有するブローカーのインターフェース
+    publish されたメッセージは、start() で登録された on_message に（自プロセス分も含め）届けること
+    """
+
+    @abstractmethod
+    async def start(self, on_message: Callable[[dict], None]):
+        ...
+
+    @abstractmethod
+    async def publish(self, message: dict):
+        ...
+
+    async def stop(self):
+        pass
+
+
+class LocalBroker(Broker):
+    """同一プロセス内だけで配信するブローカー"""
+
+    def __init__(self):
+        self._on_message = None
+
+    async def start(self, on_message):
+        self._on_message = on_message
+
+    async def publish(self, message: dict):
+        if self._on_message is not None:
+            self._on_message(message)
+
+
+class TCPBroker(Broker):
+    """
+    ローカル中継ブローカー（serve_broker）に接続するブローカー
+    1行1メッセージのJSONをやり取りする。中継ブローカーは受け取った行を全接続に送り返す。
+    接続できていない間は自プロセス内だけに配信する。
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._on_message = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, on_message):
+        self._on_message = on_message
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                logger.warning("Realtime broker unavailable (%s:%s): %s", self.host, self.port, e)
+                await asyncio.sleep(REALTIME_RECONNECT_SECONDS)
+                continue
+            self._writer = writer
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._on_message(message)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(REALTIME_RECONNECT_SECONDS)
+
+    async def publish(self, message: dict):
+        writer = self._writer
+        if writer is None:
+            self._on_message(message)
+            return
+        try:
+            writer.write(json.dumps(message, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+            await writer.drain()
+        except ConnectionError:
+            self._on_message(message)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def create_broker(url: str = REALTIME_BROKER_URL) -> Broker:
+    if not url or url == "local":
+        return LocalBroker()
+    if url.startswith("tcp://"):
+        parsed = urlparse(url)
+        return TCPBroker(parsed.hostname or "127.0.0.1", parsed.port or 8765)
+    module_name, _, class_name = url.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class RealtimeHub:
+    """
+    ユーザーごとの接続を管理し、ブローカーから届いたイベントを配る
+    イベントは1回だけJSONエンコードし、全接続で同じ文字列を共有する
+    """
+
+    def __init__(self, broker: Optional[Broker] = None, queue_size: int = REALTIME_QUEUE_SIZE):
+        self.broker = broker or create_broker()
+        self.queue_size = queue_size
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._started = False
+        self.delivered = 0
+        self.evicted = 0
+
+    async def start(self):
+        if not self._started:
+            await self.broker.start(self.dispatch)
+            self._started = True
+
+    async def stop(self):
+        if self._started:
+            await self.broker.stop()
+            self._started = False
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                subscription.close("server shutdown")
+        self._subscriptions.clear()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+
+    async def publish(self, user_ids: Iterable[int], event: dict):
+        """指定ユーザーの全接続（全ワーカー）にイベントを送る"""
+        await self.broker.publish({"user_ids": list(user_ids), "event": event})
+
+    def dispatch(self, message: dict):
+        """ブローカーから届いたメッセージを自プロセスの接続に配る"""
+        data = None
+        for user_id in message.get("user_ids", ()):
+            subscriptions = self._subscriptions.get(user_id)
+            if not subscriptions:
+                continue
+            if data is None:
+                data = json.dumps(message["event"], ensure_ascii=False, default=str)
+            for subscription in list(subscriptions):
+                if subscription.offer(data):
+                    self.delivered += 1
+                else:
+                    # 送信キューが溢れた = 読むのが遅いクライアントなので切断する
+                    subscription.close("slow consumer")
+                    self.unsubscribe(subscription)
+                    self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscriptions),
+            "connections": sum(len(s) for s in self._subscriptions.values()),
+            "delivered": self.delivered,
+            "evicted": self.evicted,
+        }
+
+
+realtime_hub = RealtimeHub()
+
+
+async def serve_broker(host: str = "127.0.0.1", port: int = 8765):
+    """ローカル中継ブローカー: 受け取った行をすべての接続にそのまま送る"""
+    clients: Set[asyncio.StreamWriter] = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for client in list(clients):
+                    try:
+                        client.write(line)
+                    except ConnectionError:
+                        clients.discard(client)
+        except ConnectionError:
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Realtime broker listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ワーカー間でリアルタイムイベントを中継するローカルブローカー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(serve_broker(args.host, args.port))
@@ -0,0 +1,308 @@
+"""
+お困りごとの全文検索用インデックス（プロセス内のbigram転置インデックス）
+
+日本語は単語の区切りがないため、NFKC正規化・小文字化した本文を記号と空白で区切り、
+各区間を文字bigramに分解して索引する（1文字だけの区間はその1文字を索引する）。
+ランキングは BM25（タイトルの出現は TITLE_WEIGHT 倍）。
+
+- 作成・編集時に add() で差分更新する
+- 検索はロック内で必要な転置リストなどの参照だけを取り、採点はロックの外で行う。
+  検索が参照中のものは add() が書き換えずに複製してから更新する（コピーオンライト）
+- 起動時に rebuild() でDBから作り直し、sync() で他ワーカーでの作成・編集を取り込む
+"""
+import asyncio
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.api.troubles.models import TroubleModel
+from app.core.database import run_db
+
+# 差分同期の間隔と、取りこぼし防止のために遡る秒数
+TROUBLE_INDEX_SYNC_SECONDS = float(os.getenv("TROUBLE_INDEX_SYNC_SECONDS", "5"))
+TROUBLE_INDEX_SYNC_OVERLAP_SECONDS = float(os.getenv("TROUBLE_INDEX_SYNC_OVERLAP_SECONDS", "5"))
+
+TITLE_WEIGHT = 2
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> List[str]:
+    """正規化した文字列をbigramに分解する"""
+    tokens = []
+    for segment in _SEPARATORS.split(unicodedata.normalize("NFKC", text or "").lower()):
+        if len(segment) == 1:
+            tokens.append(segment)
+        else:
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return tokens
+
+
+class _Document:
+    __slots__ = ("length", "category_id", "terms")
+
+    def __init__(self, length: int, category_id: Optional[int], terms: Tuple[str, ...]):
+        self.length = length
+        self.category_id = category_id
+        self.terms = terms
+
+
+class TroubleSearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # bigram -> {trouble_id: 重み付き出現回数}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._documents: Dict[int, _Document] = {}
+        # category_id -> trouble_id の集合（カテゴリー絞り込み用）
+        self._by_category: Dict[Optional[int], Set[int]] = {}
+        self._total_length = 0
+        self._watermark = None
+        # 検索に参照を渡していない（その場で書き換えてよい）転置リスト・カテゴリー・文書表
+        self._owned_terms: Set[str] = set()
+        self._owned_categories: Set[Optional[int]] = set()
+        self._owns_documents = True
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, trouble_id: int, title: str, description: str, category_id: Optional[int] = None):
+        """追加または更新（同じIDがあれば置き換える）"""
+        frequencies: Dict[str, int] = {}
+        for term in tokenize(title):
+            frequencies[term] = frequencies.get(term, 0) + TITLE_WEIGHT
+        for term in tokenize(description):
+            frequencies[term] = frequencies.get(term, 0) + 1
+        length = sum(frequencies.values())
+
+        with self._lock:
+            self._remove_locked(trouble_id)
+            for term, frequency in frequencies.items():
+                self._writable_postings(term)[trouble_id] = frequency
+            self._writable_documents()[trouble_id] = _Document(length, category_id, tuple(frequencies))
+            self._writable_category(category_id).add(trouble_id)
+            self._total_length += length
+
+    def remove(self, trouble_id: int):
+        with self._lock:
+            self._remove_locked(trouble_id)
+
+    def _remove_locked(self, trouble_id: int):
+        if trouble_id not in self._documents:
+            return
+        document = self._writable_documents().pop(trouble_id)
+        self._total_length -= document.length
+        self._writable_category(document.category_id).discard(trouble_id)
+        for term in document.terms:
+            if term in self._postings:
+                postings = self._writable_postings(term)
+                postings.pop(trouble_id, None)
+                if not postings:
+                    del self._postings[term]
+                    self._owned_terms.discard(term)
+
+    def _writable_postings(self, term: str) -> Dict[int, int]:
+        """書き換えてよい転置リスト（検索が参照中なら複製して差し替える）"""
+        postings = self._postings.get(term)
+        if postings is None or term not in self._owned_terms:
+            postings = self._postings[term] = dict(postings or ())
+            self._owned_terms.add(term)
+        return postings
+
+    def _writable_documents(self) -> Dict[int, _Document]:
+        if not self._owns_documents:
+            self._documents = dict(self._documents)
+            self._owns_documents = True
+        return self._documents
+
+    def _writable_category(self, category_id: Optional[int]) -> Set[int]:
+        members = self._by_category.get(category_id)
+        if members is None or category_id not in self._owned_categories:
+            members = self._by_category[category_id] = set(members or ())
+            self._owned_categories.add(category_id)
+        return members
+
+    def search(
+        self, query: str, category_id: Optional[int] = None, limit: int = 20
+    ) -> Tuple[int, bool, List[Tuple[int, float]]]:
+        """
+        BM25でランキングした上位 limit 件を返す
+        戻り値: (候補件数, 候補件数が下限かどうか, [(trouble_id, score), ...])
+
+        クエリのbigramのどれかを含む文書が候補（OR）。出現頻度の高いbigram（「ます」など）の
+        転置リストを全件なめると遅いため、MaxScore で枝刈りする:
+        1. 珍しいbigram（idfが大きい順）から転置リストをなめて候補を集め、採点する
+        2. 残りのbigramの最大寄与（1語あたり idf * (k1 + 1) 未満）の合計が、上位 limit 件の
+           最終スコアの下限以下になったら、まだ出てきていない文書は上位に入れないので打ち切る
+        3. 残りのbigramは候補の加点だけに使う（満点で加点しても上位に届かない候補は都度外す）
+        打ち切った場合、なめていない転置リストにしかない文書は数えられないため候補件数は下限になる
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return 0, False, []
+
+        with self._lock:
+            n = len(self._documents)
+            if n == 0:
+                return 0, False, []
+            weighted = []
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings:
+                    df = len(postings)
+                    weighted.append((math.log(1 + (n - df + 0.5) / (df + 0.5)), postings))
+            if not weighted:
+                return 0, False, []
+            allowed = self._by_category.get(category_id, set()) if category_id is not None else None
+            documents = self._documents
+            average_length = self._total_length / n
+            # ここで参照を取ったものは、以後 add() が複製してから書き換える
+            self._owned_terms.difference_update(terms)
+            self._owned_categories.discard(category_id)
+            self._owns_documents = False
+
+        weighted.sort(key=lambda item: item[0], reverse=True)
+        k = BM25_K1 * (1 - BM25_B)
+        k_length = BM25_K1 * BM25_B / average_length
+
+        # 1語あたりの寄与は idf * (k1 + 1) 未満
+        remaining = sum(idf for idf, _ in weighted) * (BM25_K1 + 1)
+        threshold = 0.0
+        scores: Dict[int, float] = {}
+        essential = 0
+        # 下限はスコアが変わったときだけ計算し直す
+        changed = False
+        for idf, postings in weighted:
+            if changed and len(scores) >= limit:
+                threshold = max(
+                    threshold, self._lower_bound(documents, scores, weighted[essential:], limit, k, k_length)
+                )
+                changed = False
+            if remaining <= threshold:
+                break
+            weight = idf * (BM25_K1 + 1)
+            remaining -= weight
+            essential += 1
+            get = scores.get
+            if allowed is None:
+                matched = postings.items()
+            else:
+                matched = [(trouble_id, postings[trouble_id]) for trouble_id in postings.keys() & allowed]
+            changed = changed or bool(matched)
+            for trouble_id, tf in matched:
+                scores[trouble_id] = get(trouble_id, 0.0) + weight * tf / (
+                    tf + k + k_length * documents[trouble_id].length
+                )
+
+        total = len(scores)
+        is_estimate = essential < len(weighted)
+        if is_estimate and allowed is None:
+            # なめていない転置リストの文書も候補なので、最長のものの件数も下限になる
+            total = max(total, max(len(postings) for _, postings in weighted[essential:]))
+        candidates = scores.keys()
+        for idf, postings in weighted[essential:]:
+            if len(candidates) > limit:
+                floor = threshold - remaining
+                candidates = {trouble_id for trouble_id in candidates if scores[trouble_id] >= floor}
+            weight = idf * (BM25_K1 + 1)
+            remaining -= weight
+            for trouble_id in postings.keys() & candidates:
+                tf = postings[trouble_id]
+                scores[trouble_id] += weight * tf / (tf + k + k_length * documents[trouble_id].length)
+        # 途中で外した候補は上位に入らない（スコアは途中までの値のまま）
+        candidates = {trouble_id: scores[trouble_id] for trouble_id in candidates}
+
+        # スコアが同じなら新しいもの（IDが大きいもの）を優先
+        top = heapq.nlargest(limit, candidates.items(), key=lambda item: (item[1], item[0]))
+        return total, is_estimate, [(trouble_id, round(score, 4)) for trouble_id, score in top]
+
+    @staticmethod
+    def _lower_bound(
+        documents: Dict[int, _Document], scores: Dict[int, float], rest, limit: int, k: float, k_length: float
+    ) -> float:
+        """
+        上位 limit 件目の最終スコアの下限
+        途中までのスコアの上位 limit 件を残りのbigramでも採点し、その limit 番目の値を返す
+        """
+        cutoff = heapq.nlargest(limit, scores.values())[-1]
+        finals = []
+        for trouble_id, score in scores.items():
+            if score < cutoff:
+                continue
+            length = documents[trouble_id].length
+            for idf, postings in rest:
+                tf = postings.get(trouble_id)
+                if tf:
+                    score += idf * (BM25_K1 + 1) * tf / (tf + k + k_length * length)
+            finals.append(score)
+        return heapq.nlargest(limit, finals)[-1]
+
+    def _add_rows(self, rows: Iterable[dict]):
+        for row in rows:
+            self.add(row["trouble_id"], row["title"], row["description"], row["category_id"])
+            updated_at = row.get("updated_at")
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+    def rebuild(self, batch_size: int = 1000) -> int:
+        """DBから全件読み直して作り直す"""
+        fresh = TroubleSearchIndex()
+        after_id = 0
+        while True:
+            rows = TroubleModel.get_batch_for_index(after_id, batch_size)
+            if not rows:
+                break
+            fresh._add_rows(rows)
+            after_id = rows[-1]["trouble_id"]
+        with self._lock:
+            self._postings = fresh._postings
+            self._documents = fresh._documents
+            self._by_category = fresh._by_category
+            self._total_length = fresh._total_length
+            self._watermark = fresh._watermark
+            self._owned_terms = fresh._owned_terms
+            self._owned_categories = fresh._owned_categories
+            self._owns_documents = fresh._owns_documents
+        return len(self._documents)
+
+    def sync(self, batch_size: int = 1000) -> int:
+        """前回以降にDBで作成・更新されたものを取り込む（他ワーカーでの変更を反映する）"""
+        if self._watermark is None:
+            return self.rebuild(batch_size)
+        since = self._watermark - timedelta(seconds=TROUBLE_INDEX_SYNC_OVERLAP_SECONDS)
+        after_id = 0
+        synced = 0
+        while True:
+            rows = TroubleModel.get_updated_since(since, after_id, batch_size)
+            if not rows:
+                break
+            self._add_rows(rows)
+            synced += len(rows)
+            since, after_id = rows[-1]["updated_at"], rows[-1]["trouble_id"]
+        return synced
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._documents), "terms": len(self._postings)}
+
+
+trouble_search_index = TroubleSearchIndex()
+
+
+async def run_sync_loop(index: TroubleSearchIndex = trouble_search_index):
+    """起動時に全件読み込み、その後は定期的に差分を取り込む（lifespanでタスクとして起動）"""
+    while True:
+        try:
+            await run_db(index.sync)
+        except Exception:
+            logger.exception("Error syncing trouble search index")
+        await asyncio.sleep(TROUBLE_INDEX_SYNC_SECONDS)
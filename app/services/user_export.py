@@ -0,0 +1,225 @@
+"""
+ユーザーの一括書き出し（NDJSON / CSV のダウンロード）
+
+サーバー側カーソル（StreamingCursor = SSDictCursor）で USER_EXPORT_BATCH_SIZE 行ずつ読み、
+バッチごとにエンコードしてそのまま送る。結果全体をメモリに載せないので、
+メモリ使用量はテーブルの大きさによらず1バッチ分で一定。
+
+- 読み取りはレプリカ（あれば）。書き出し中は接続を1本占有するため、同時実行数は USER_EXPORT_MAX_CONCURRENT まで
+- クライアントの読み出しが遅いとMySQLが送信待ちで接続を切る（net_write_timeout）ため、
+  書き出し中だけセッションの net_write_timeout を USER_EXPORT_NET_WRITE_TIMEOUT_SECONDS に延ばす
+- 途中で切断された場合は残りの行を読まずに接続を捨てる（読み切るまで待たない）
+
+CSV:    1行目はヘッダー。categories は ";" 区切り（app.services.user_import と同じ形）
+        表計算ソフトで数式として解釈される文字（= + - @ タブ CR）で始まる値は先頭に ' を付ける
+NDJSON: 1行1オブジェクト。categories はカテゴリー名のリスト
+"""
+import csv
+import io
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.core.database import StreamingCursor, get_db_connection, get_db_executor, run_db
+
+USER_EXPORT_BATCH_SIZE = int(os.getenv("USER_EXPORT_BATCH_SIZE", "1000"))
+USER_EXPORT_MAX_CONCURRENT = int(os.getenv("USER_EXPORT_MAX_CONCURRENT", "2"))
+USER_EXPORT_NET_WRITE_TIMEOUT_SECONDS = int(os.getenv("USER_EXPORT_NET_WRITE_TIMEOUT_SECONDS", "600"))
+
+CSV_CATEGORY_SEPARATOR = ";"
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+COLUMNS = ("user_id", "name", "point_total", "num_answer", "last_login_at", "categories")
+# CSVを表計算ソフトで開いたときに数式として解釈される先頭文字（CSVインジェクション対策）
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+logger = logging.getLogger(__name__)
+
+_slots = threading.BoundedSemaphore(USER_EXPORT_MAX_CONCURRENT)
+
+
+class ExportBusy(Exception):
+    """同時に実行できる書き出しの数を超えている"""
+
+
+def build_query(category_id: Optional[int] = None, last_login_from: Optional[datetime] = None,
+                last_login_to: Optional[datetime] = None) -> Tuple[str, list]:
+    """
+    書き出し用のSELECT
+    カテゴリーは行ごとの相関サブクエリで集めるため、GROUP BY の一時テーブルを作らずに主キー順で流せる
+    """
+    conditions = []
+    params = []
+    if category_id is not None:
+        conditions.append(
+            "EXISTS (SELECT 1 FROM user_categories f WHERE f.user_id = u.user_id AND f.category_id = %s)"
+        )
+        params.append(category_id)
+    if last_login_from is not None:
+        conditions.append("u.last_login_at >= %s")
+        params.append(last_login_from)
+    if last_login_to is not None:
+        conditions.append("u.last_login_at < %s")
+        params.append(last_login_to)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"""
+    SELECT u.user_id, u.name, u.point_total, u.num_answer, u.last_login_at,
+        (SELECT GROUP_CONCAT(c.name ORDER BY c.name SEPARATOR '{CSV_CATEGORY_SEPARATOR}')
+         FROM user_categories uc JOIN categories c ON c.id = uc.category_id
+         WHERE uc.user_id = u.user_id) AS categories
+    FROM users u
+    {where}
+    ORDER BY u.user_id
+    """
+    return sql, params
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def encode_ndjson(rows: List[dict]) -> bytes:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({
+            "user_id": row["user_id"],
+            "name": row["name"],
+            "point_total": row["point_total"] or 0,
+            "num_answer": row["num_answer"] or 0,
+            "last_login_at": _isoformat(row["last_login_at"]),
+            "categories": row["categories"].split(CSV_CATEGORY_SEPARATOR) if row["categories"] else [],
+        }, ensure_ascii=False))
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+def _csv_text(value: Optional[str]) -> str:
+    """数式として解釈される文字で始まる値は ' を付けて文字列として扱わせる"""
+    if not value:
+        return ""
+    return "'" + value if value.startswith(CSV_FORMULA_PREFIXES) else value
+
+
+def encode_csv(rows: List[dict]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow((
+            row["user_id"], _csv_text(row["name"]), row["point_total"] or 0, row["num_answer"] or 0,
+            _isoformat(row["last_login_at"]) or "", _csv_text(row["categories"]),
+        ))
+    return buffer.getvalue().encode("utf-8")
+
+
+class UserExporter:
+    """
+    1回分の書き出し。open() でクエリを実行し、stream() でエンコード済みのバッチを返す
+    読み切れば接続をプールに返し、途中でやめた場合は close() で接続を捨てる
+    """
+
+    def __init__(self, fmt: str, category_id: Optional[int] = None, last_login_from: Optional[datetime] = None,
+                 last_login_to: Optional[datetime] = None, batch_size: int = USER_EXPORT_BATCH_SIZE):
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self._query = build_query(category_id, last_login_from, last_login_to)
+        self._encode = encode_csv if fmt == "csv" else encode_ndjson
+        # fetchmany（DBスレッド）と close() が同じ接続を同時に触らないように
+        self._lock = threading.Lock()
+        self._connection = None
+        self._cursor = None
+        self.rows = 0
+
+    def _open(self):
+        if not _slots.acquire(blocking=False):
+            raise ExportBusy()
+        try:
+            connection = get_db_connection(read_only=True)
+        except BaseException:
+            _slots.release()
+            raise
+        try:
+            with connection.cursor() as setup:
+                setup.execute("SET SESSION net_write_timeout = %s", (USER_EXPORT_NET_WRITE_TIMEOUT_SECONDS,))
+            cursor = connection.cursor(StreamingCursor)
+            cursor.execute(*self._query)
+        except BaseException:
+            connection.release(broken=True)
+            _slots.release()
+            raise
+        self._connection, self._cursor = connection, cursor
+
+    async def open(self):
+        """クエリを実行する（同時実行数を超えていれば ExportBusy）"""
+        await run_db(self._open)
+
+    def _fetch(self) -> List[dict]:
+        with self._lock:
+            if self._cursor is None:
+                return []
+            return list(self._cursor.fetchmany(self.batch_size))
+
+    def _finish(self):
+        """読み切った: カーソルを閉じ、セッション変数を戻して接続をプールに返す"""
+        with self._lock:
+            connection, self._connection = self._connection, None
+            cursor, self._cursor = self._cursor, None
+            if connection is None:
+                return
+            try:
+                cursor.close()
+                with connection.cursor() as reset:
+                    reset.execute("SET SESSION net_write_timeout = @@GLOBAL.net_write_timeout")
+                connection.release()
+            except Exception:
+                logger.exception("Error finishing user export")
+                connection.release(broken=True)
+            finally:
+                _slots.release()
+
+    def close(self):
+        """途中でやめた: 残りの行を読まずに接続を捨てる（読み切った後に呼んでも何もしない）"""
+        with self._lock:
+            connection, self._connection = self._connection, None
+            self._cursor = None
+            if connection is None:
+                return
+            connection.release(broken=True)
+            _slots.release()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        if self.fmt == "csv":
+            yield (",".join(COLUMNS) + "\n").encode("utf-8")
+        while True:
+            rows = await run_db(self._fetch)
+            if not rows:
+                break
+            self.rows += len(rows)
+            yield self._encode(rows)
+        await run_db(self._finish)
+
+
+class UserExportResponse(StreamingResponse):
+    """
+    書き出しのレスポンス。クライアントの切断などで途中で終わった場合も接続を片付ける
+    （DBスレッドで fetchmany の最中かもしれないので、待たずにDBスレッドプールで close() する）
+    """
+
+    def __init__(self, exporter: UserExporter, filename: str):
+        super().__init__(
+            exporter.stream(),
+            media_type=MEDIA_TYPES[exporter.fmt],
+            headers={"content-disposition": f'attachment; filename="{filename}"'},
+        )
+        self.exporter = exporter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            get_db_executor().submit(self.exporter.close)
@@ -0,0 +1,283 @@
+"""
+ユーザーの一括登録（CSV / NDJSON のアップロード）
+
+アップロードは受信したチャンクから行単位で読み進め、全体をメモリに載せない。
+USER_IMPORT_BATCH_SIZE 行ごとに
+  1. 入力チェック（UserImportRow と同じ制約・カテゴリー一覧にあるカテゴリーか）とアップロード内での名前の重複チェック
+  2. 既存ユーザー名のチェック（IN (...) で1往復）
+  3. パスワードのハッシュ（ワーカープロセスで並列）
+  4. executemany による INSERT（バッチごとに1トランザクション）
+を行い、行ごとの結果を返す。途中のバッチが失敗しても、それまでのバッチは登録済みのまま。
+
+CSV:    1行目はヘッダー（name, password, categories）。categories は ";" 区切り
+NDJSON: 1行1オブジェクト {"name": ..., "password": ..., "categories": [...]}
+"""
+import csv
+import json
+import logging
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import pymysql
+from pydantic import ValidationError
+
+from app.api.categories.catalog import load_snapshot
+from app.api.users.models import UserModel
+from app.api.users.schemas import UserImportRow
+from app.core.database import run_db
+from app.core.security import PasswordHasherBusy, hash_passwords_async
+
+USER_IMPORT_BATCH_SIZE = int(os.getenv("USER_IMPORT_BATCH_SIZE", "500"))
+USER_IMPORT_MAX_ROWS = int(os.getenv("USER_IMPORT_MAX_ROWS", "10000"))
+# 1行（CSVは1レコード）の最大バイト数（改行のない巨大な入力でメモリを使い切らないように）
+USER_IMPORT_MAX_LINE_BYTES = int(os.getenv("USER_IMPORT_MAX_LINE_BYTES", "65536"))
+
+CSV_CATEGORY_SEPARATOR = ";"
+FORMATS = ("csv", "ndjson")
+
+logger = logging.getLogger(__name__)
+
+
+class ImportFormatError(ValueError):
+    """アップロード全体として読めない（ヘッダーがない、1行が長すぎるなど）"""
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in ("text/csv", "application/csv"):
+        return "csv"
+    if media_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"):
+        return "ndjson"
+    return None
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    バイト列のチャンクを行に分割する（UTF-8、BOMと行末の \\r は取り除く）
+    UTF-8 の改行バイトは多バイト文字の途中に現れないので、デコード前のバイト列で分割し、長さもバイト数で数える
+    """
+    pending = b""
+    first = True
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield _decode_line(line, first)
+            first = False
+        if len(pending) > USER_IMPORT_MAX_LINE_BYTES:
+            raise ImportFormatError(f"Line exceeds {USER_IMPORT_MAX_LINE_BYTES} bytes")
+    if pending:
+        yield _decode_line(pending, first)
+
+
+def _decode_line(line: bytes, first: bool) -> str:
+    if len(line) > USER_IMPORT_MAX_LINE_BYTES:
+        raise ImportFormatError(f"Line exceeds {USER_IMPORT_MAX_LINE_BYTES} bytes")
+    try:
+        return line.decode("utf-8-sig" if first else "utf-8").rstrip("\r")
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f"Invalid UTF-8: {e.reason}")
+
+
+async def iter_csv_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """
+    CSV の1レコード分の行（引用符で囲まれたフィールド内の改行で複数行になる）をまとめて返す
+    引用符（"" のエスケープも2個と数える）が偶数個になった時点でレコードが閉じる
+    """
+    lines = []
+    size = 0
+    quotes = 0
+    async for line in iter_lines(chunks):
+        lines.append(line)
+        size += len(line.encode("utf-8")) + 1
+        quotes += line.count('"')
+        if quotes % 2:
+            if size > USER_IMPORT_MAX_LINE_BYTES:
+                raise ImportFormatError(f"Record exceeds {USER_IMPORT_MAX_LINE_BYTES} bytes")
+            continue
+        yield lines
+        lines, size, quotes = [], 0, 0
+    if lines:
+        yield lines
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, object]]:
+    """
+    (行番号, dict) を順に返す。その行が読めない場合は dict の代わりにエラーメッセージ（str）
+    空行は飛ばす（行番号は数える）。CSV の行番号はレコード単位
+    """
+    if fmt == "csv":
+        async for item in _iter_csv_records(chunks):
+            yield item
+        return
+    row = 0
+    async for line in iter_lines(chunks):
+        row += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield row, "Each line must be a JSON object"
+            continue
+        yield row, record
+
+
+async def _iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    header = None
+    row = 0
+    async for lines in iter_csv_lines(chunks):
+        if len(lines) == 1 and not lines[0].strip():
+            if header is not None:
+                row += 1
+            continue
+        # 行末の改行を戻して渡す（フィールド内の改行をそのまま値に残すため）
+        values = next(csv.reader(line + "\n" for line in lines))
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            if "name" not in header or "password" not in header:
+                raise ImportFormatError("CSV header must contain name and password")
+            continue
+        row += 1
+        if len(values) > len(header):
+            yield row, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        record = dict(zip(header, values))
+        categories = record.get("categories") or ""
+        record["categories"] = [c.strip() for c in categories.split(CSV_CATEGORY_SEPARATOR) if c.strip()]
+        yield row, record
+
+
+def _result(row: int, name: Optional[str], status: str, user_id: Optional[int] = None,
+            detail: Optional[str] = None) -> dict:
+    """行ごとの結果（UserImportRowResult と同じキー）"""
+    return {"row": row, "name": name, "status": status, "user_id": user_id, "detail": detail}
+
+
+class UserImporter:
+    def __init__(self, batch_size: int = USER_IMPORT_BATCH_SIZE, max_rows: int = USER_IMPORT_MAX_ROWS):
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.results: List[dict] = []
+        self.truncated = False
+        self._seen = set()
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str) -> dict:
+        batch = []
+        row = 0
+        try:
+            async for row, record in iter_records(chunks, fmt):
+                if row > self.max_rows:
+                    self.truncated = True
+                    break
+                batch.append((row, record))
+                if len(batch) >= self.batch_size:
+                    await self._process(batch)
+                    batch = []
+        except ImportFormatError as e:
+            # 何も登録していなければアップロード全体のエラー。途中なら登録済みの分を報告して打ち切る
+            if row == 0:
+                raise
+            self.truncated = True
+            self.results.append(_result(row + 1, None, "invalid", detail=str(e)))
+        if batch:
+            await self._process(batch)
+        self.results.sort(key=lambda r: r["row"])
+        created = sum(1 for r in self.results if r["status"] == "created")
+        return {
+            "total": len(self.results),
+            "created": created,
+            "failed": len(self.results) - created,
+            "truncated": self.truncated,
+            "results": self.results,
+        }
+
+    def _validate(self, batch, known_categories) -> List[Tuple[int, UserImportRow]]:
+        """読めない・制約違反・カテゴリー一覧にないカテゴリー・アップロード内での重複を結果に記録し、残りを返す"""
+        valid = []
+        for row, record in batch:
+            if isinstance(record, str):
+                self.results.append(_result(row, None, "invalid", detail=record))
+                continue
+            name = record.get("name")
+            try:
+                user = UserImportRow(**record)
+            except ValidationError as e:
+                detail = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                self.results.append(_result(row, name if isinstance(name, str) else None, "invalid", detail=detail))
+                continue
+            user.categories = list(dict.fromkeys(c for c in (user.categories or []) if c))
+            unknown = [c for c in user.categories if c not in known_categories]
+            if unknown:
+                self.results.append(_result(row, user.name, "invalid", detail=f"Unknown categories: {', '.join(unknown)}"))
+                continue
+            if user.name in self._seen:
+                self.results.append(_result(row, user.name, "duplicate", detail="Duplicate name in upload"))
+                continue
+            self._seen.add(user.name)
+            valid.append((row, user))
+        return valid
+
+    async def _process(self, batch):
+        users = self._validate(batch, (await load_snapshot()).names)
+        if not users:
+            return
+        try:
+            existing = await run_db(UserModel.get_existing_names, [u.name for _, u in users])
+        except Exception:
+            logger.exception("Error checking existing users")
+            self._fail(users, "Database error")
+            return
+        users = self._drop_existing(users, existing)
+        if not users:
+            return
+
+        try:
+            hashes = await hash_passwords_async(u.password for _, u in users)
+        except PasswordHasherBusy:
+            self._fail(users, "Server is busy, please retry")
+            return
+
+        rows = [(u.name, password, u.categories) for (_, u), password in zip(users, hashes)]
+        try:
+            user_ids = await run_db(UserModel.bulk_create, rows)
+        except pymysql.err.IntegrityError:
+            # チェック後に同じ名前が別のリクエストで登録された。その分を除いて1度だけやり直す
+            try:
+                existing = await run_db(UserModel.get_existing_names, [u.name for _, u in users])
+                keep = {u.name for _, u in self._drop_existing(users, existing)}
+                users = [(row, u) for row, u in users if u.name in keep]
+                user_ids = await run_db(UserModel.bulk_create, [r for r in rows if r[0] in keep])
+            except Exception:
+                logger.exception("Error importing users")
+                self._fail(users, "Database error")
+                return
+        except Exception:
+            logger.exception("Error importing users")
+            self._fail(users, "Database error")
+            return
+
+        for row, user in users:
+            self.results.append(_result(row, user.name, "created", user_id=user_ids.get(user.name)))
+
+    def _drop_existing(self, users, existing):
+        remaining = []
+        for row, user in users:
+            if user.name in existing:
+                self.results.append(_result(row, user.name, "exists", detail="Username already registered"))
+            else:
+                remaining.append((row, user))
+        return remaining
+
+    def _fail(self, users, detail: str):
+        for row, user in users:
+            self.results.append(_result(row, user.name, "error", detail=detail))
+
+
+async def import_users(chunks: AsyncIterator[bytes], fmt: str) -> Dict:
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Unsupported format: {fmt}")
+    return await UserImporter().run(chunks, fmt)
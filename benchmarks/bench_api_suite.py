@@ -0,0 +1,272 @@
+"""
+APIの負荷・レイテンシのベンチマークスイート（回帰検知つき）
+
+ASGIアプリをプロセス内で起動し（lifespan も実行する）、並行クライアントから
+主要エンドポイントを叩いてシナリオごとの p50/p95/p99 と RPS を計測する。
+MySQLの代わりに benchmarks.fake_mysql のインメモリDBを使う（1往復ごとに --db-latency-ms）。
+
+シナリオ: token (POST /token), register (POST /api/auth/register), me (GET /api/users/me),
+          points (POST /api/users/points), answers (POST /api/users/answers),
+          categories (GET /api/categories/)
+
+1回の計測のp95はぶれが大きいため、スイートを --runs 回繰り返し、各値はその中央値をとる。
+結果はJSONで保存でき（--save）、ベースライン（--baseline）と比べて
+p95 が許容幅を超えて悪化した、または RPS が許容幅を超えて低下したシナリオがあれば
+終了コード1で終わる（--min-delta-ms 未満の差はノイズとして無視する）。
+許容幅はシナリオごとに、--threshold とベースラインの繰り返し計測のぶれ（中央値から最も離れた
+計測までの割合）の大きい方にする。
+
+ベースライン benchmarks/results/api_baseline.json はこのスイートの既定のパラメーター
+（fake_mysql、--db-latency-ms 0.5、--runs 5）で、下の手順で3プロセス分まとめたものをコミットしてある。
+マシンによって値が変わるため、別の環境で比較する場合は、変更前のコードで作り直してから比べる。
+
+使い方:
+    # ベースラインを作り直す（マシン全体の速さのぶれも入るように、別プロセスで3回計測してまとめる）
+    python -m benchmarks.bench_api_suite --save benchmarks/results/api_baseline.json
+    python -m benchmarks.bench_api_suite --save benchmarks/results/api_baseline.json --merge
+    python -m benchmarks.bench_api_suite --save benchmarks/results/api_baseline.json --merge
+    # 変更後に比較する（許容幅を超える悪化で失敗）
+    python -m benchmarks.bench_api_suite --baseline benchmarks/results/api_baseline.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from benchmarks import fake_mysql  # noqa: E402
+
+SCENARIOS = ("token", "register", "me", "points", "answers", "categories")
+# 中央値をとる値（errors は最大値）
+MEDIAN_FIELDS = ("rps", "p50_ms", "p95_ms", "p99_ms", "mean_ms")
+PASSWORD = "bench-password"
+CATEGORIES = ["営業部", "音楽"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def build_requests(scenario: str, users: int, run_id: str):
+    """シナリオごとに (method, url, kwargs) を順に返すジェネレーターを作る"""
+    from app.core.security import create_access_token
+
+    names = itertools.cycle(f"bench-user-{i}" for i in range(1, users + 1))
+    tokens = {}
+
+    def auth_headers(name):
+        token = tokens.get(name)
+        if token is None:
+            token = tokens[name] = create_access_token({"sub": name})
+        return {"Authorization": f"Bearer {token}"}
+
+    if scenario == "token":
+        for name in names:
+            yield "POST", "/token", {"data": {"username": name, "password": PASSWORD}}
+    elif scenario == "register":
+        for i in itertools.count():
+            yield "POST", "/api/auth/register", {"json": {
+                "name": f"new-{run_id}-{i}", "password": PASSWORD, "confirm_password": PASSWORD,
+                "categories": CATEGORIES,
+            }}
+    elif scenario == "me":
+        for name in names:
+            yield "GET", "/api/users/me", {"headers": auth_headers(name)}
+    elif scenario == "points":
+        for name in names:
+            yield "POST", "/api/users/points", {"params": {"points": 1}, "headers": auth_headers(name)}
+    elif scenario == "answers":
+        for name in names:
+            yield "POST", "/api/users/answers", {"headers": auth_headers(name)}
+    elif scenario == "categories":
+        while True:
+            yield "GET", "/api/categories/", {}
+
+
+async def run_scenario(client, scenario: str, total: int, concurrency: int, users: int, run_id: str) -> dict:
+    requests = build_requests(scenario, users, run_id)
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = next(requests)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(statistics.mean(latencies), 3),
+    }
+
+
+async def run_suite(args, db) -> dict:
+    import main
+    from app.core.rate_limit import rate_limiter
+
+    # 同じIP・同じユーザーで大量にログインするので、レート制限は外して純粋な処理時間を測る
+    rate_limiter.enabled = False
+    run_id = str(int(time.time() * 1000))
+    samples = {scenario: [] for scenario in args.scenarios}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for scenario in args.scenarios:
+                # ウォームアップ（キャッシュ・接続プールを温める）
+                await run_scenario(client, scenario, min(args.requests, 50), args.concurrency, args.users, run_id + "w")
+            for run in range(args.runs):
+                for scenario in args.scenarios:
+                    samples[scenario].append(await run_scenario(
+                        client, scenario, args.requests, args.concurrency, args.users, f"{run_id}-{run}"
+                    ))
+    return samples
+
+
+def summarize(runs: list) -> dict:
+    """繰り返した計測を1つにまとめる（各値は中央値、errors は最大値。各回の値も samples に残す）"""
+    summary = {
+        "requests": runs[0]["requests"],
+        "concurrency": runs[0]["concurrency"],
+        "errors": max(r["errors"] for r in runs),
+        "runs": len(runs),
+    }
+    for field in MEDIAN_FIELDS:
+        summary[field] = round(statistics.median(r[field] for r in runs), 3)
+    summary["samples"] = [
+        {field: r[field] for field in ("requests", "concurrency", "errors") + MEDIAN_FIELDS} for r in runs
+    ]
+    return summary
+
+
+def tolerances(previous: dict, threshold: float):
+    """シナリオの許容幅 (p95の悪化, RPSの低下)。ベースラインの計測のぶれより狭くしない"""
+    p95_tolerance = rps_tolerance = threshold
+    samples = previous.get("samples")
+    if samples and previous["p95_ms"] > 0:
+        p95_tolerance = max(threshold, max(r["p95_ms"] for r in samples) / previous["p95_ms"] - 1)
+    if samples and previous["rps"] > 0:
+        rps_tolerance = max(threshold, 1 - min(r["rps"] for r in samples) / previous["rps"])
+    return p95_tolerance, rps_tolerance
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float):
+    """ベースラインより悪化したシナリオの一覧 [(シナリオ, 理由), ...]"""
+    regressions = []
+    for scenario, current in results.items():
+        previous = baseline.get("results", {}).get(scenario)
+        if previous is None:
+            continue
+        p95_tolerance, rps_tolerance = tolerances(previous, threshold)
+        p95_limit = previous["p95_ms"] * (1 + p95_tolerance)
+        if current["p95_ms"] > p95_limit and current["p95_ms"] - previous["p95_ms"] >= min_delta_ms:
+            regressions.append((
+                scenario, f"p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms (allowed +{p95_tolerance:.0%})"
+            ))
+        if current["rps"] < previous["rps"] * (1 - rps_tolerance):
+            regressions.append((scenario, f"rps {previous['rps']} -> {current['rps']} (allowed -{rps_tolerance:.0%})"))
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append((scenario, f"errors {previous.get('errors', 0)} -> {current['errors']}"))
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=1000, help="事前に登録しておくユーザー数")
+    parser.add_argument("--runs", type=int, default=5, help="繰り返す回数（各値はその中央値）")
+    parser.add_argument("--db-latency-ms", type=float, default=0.5)
+    parser.add_argument("--save", help="結果を保存するJSONファイル")
+    parser.add_argument("--merge", action="store_true", help="--save のファイルの計測に今回の計測を足して保存する")
+    parser.add_argument("--baseline", help="比較するベースラインのJSONファイル")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2,
+        help="許容する悪化の割合の下限（0.2 = 20%%。ベースラインのぶれが大きいシナリオはそれに合わせて広げる）",
+    )
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    db = fake_mysql.install(args.db_latency_ms / 1000)
+    from app.core.security import get_password_hash
+    password_hash = get_password_hash(PASSWORD)
+    for i in range(1, args.users + 1):
+        db.add_user(f"bench-user-{i}", password_hash, CATEGORIES[i % 2:])
+
+    samples = asyncio.run(run_suite(args, db))
+    results = {scenario: summarize(runs) for scenario, runs in samples.items()}
+
+    print(
+        f"db latency={args.db_latency_ms}ms requests={args.requests} concurrency={args.concurrency} "
+        f"runs={args.runs} (median)"
+    )
+    print(f"{'scenario':<11} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for scenario, r in results.items():
+        print(f"{scenario:<11} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>6}")
+    if db.unhandled:
+        print("statements not emulated by the fake DB (returned empty results):")
+        for shape in sorted(db.unhandled):
+            print(f"  {shape}")
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {
+            "requests": args.requests, "concurrency": args.concurrency,
+            "users": args.users, "db_latency_ms": args.db_latency_ms, "runs": args.runs,
+        },
+        "results": results,
+    }
+    if args.save and args.merge and os.path.exists(args.save):
+        # 別プロセスでの計測を足す（プロセスごとのぶれもベースラインの許容幅に入れる）
+        with open(args.save, encoding="utf-8") as f:
+            previous = json.load(f)
+        for scenario, summary in previous.get("results", {}).items():
+            runs = summary.get("samples", []) + samples.get(scenario, [])
+            if runs:
+                report["results"][scenario] = summarize(runs)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"saved results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"REGRESSION (threshold {args.threshold:.0%}):")
+            for scenario, reason in regressions:
+                print(f"  {scenario}: {reason}")
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main_cli()
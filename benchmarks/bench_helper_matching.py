@@ -0,0 +1,99 @@
+"""
+ヘルパーマッチングのレイテンシ計測
+
+合成ユーザー（既定10万人、カテゴリー10種、1人0〜3カテゴリー）でマッチングを構築し、
+お困りごとのカテゴリー（1〜2個）に対する上位K人の取得と、ポイント・回答数の差分更新の
+p50/p95/p99 を表示する。比較のため、全ユーザーを毎回スコア計算する素朴な実装も測る。
+MySQLは不要。
+
+使い方:
+    python -m benchmarks.bench_helper_matching --users 100000 --operations 20000 --top 10
+"""
+import argparse
+import gc
+import heapq
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.helper_matching import HelperMatcher, MATCH_CATEGORY_WEIGHT, activity_score  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(label, operations, func):
+    latencies = []
+    for args in operations:
+        started = time.perf_counter()
+        func(*args)
+        latencies.append((time.perf_counter() - started) * 1_000_000)
+    print(
+        f"{label:<22} p50={percentile(latencies, 0.50):.1f}us "
+        f"p95={percentile(latencies, 0.95):.1f}us p99={percentile(latencies, 0.99):.1f}us"
+    )
+    return latencies
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--operations", type=int, default=20_000)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--naive-operations", type=int, default=20, help="素朴な全件スコア計算の回数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    matcher = HelperMatcher()
+    users = []
+    started = time.perf_counter()
+    for user_id in range(1, args.users + 1):
+        categories = rng.sample(range(1, 11), rng.randint(0, 3))
+        num_answer, point_total = rng.randint(0, 200), rng.randint(0, 100_000)
+        users.append((user_id, set(categories), num_answer, point_total))
+        matcher.add_user(user_id, categories, num_answer, point_total)
+    print(f"built matcher for {args.users} users in {time.perf_counter() - started:.1f}s: {matcher.stats()}")
+    # 本番（app.server）と同じく、構築済みのオブジェクトを世代別GCの走査対象から外す
+    # （外さないと、たまに起きる全世代のGCが10万人分のタプルを走査して数msかかる）
+    gc.collect()
+    gc.freeze()
+
+    def troubles(count):
+        return [(rng.sample(range(1, 11), rng.randint(1, 2)), args.top) for _ in range(count)]
+
+    latencies = measure(f"top {args.top}", troubles(args.operations), matcher.top)
+    measure(
+        f"top {args.top} (exclude)",
+        [(categories, k, (rng.randint(1, args.users),)) for categories, k in troubles(args.operations)],
+        matcher.top,
+    )
+    measure("apply_points", [(rng.randint(1, args.users), rng.randint(1, 100)) for _ in range(args.operations)],
+            matcher.apply_points)
+    measure("add_answers", [(rng.randint(1, args.users),) for _ in range(args.operations)], matcher.add_answers)
+
+    category_weight = int(MATCH_CATEGORY_WEIGHT * 1000)
+
+    def naive_top(categories, k):
+        categories = set(categories)
+        return heapq.nsmallest(k, (
+            (-(len(c & categories) * category_weight + activity_score(a, p)), user_id)
+            for user_id, c, a, p in users
+        ))
+
+    measure(f"naive top {args.top}", troubles(args.naive_operations), naive_top)
+
+    # p99 は共有環境ではスケジューラーの停止（数ms）を拾いやすいので、判定は p95 で行う
+    p95_ms = percentile(latencies, 0.95) / 1000
+    over = sum(1 for latency in latencies if latency >= 1000) / len(latencies)
+    print(f"top {args.top} p95 = {p95_ms:.3f}ms ({'sub-millisecond' if p95_ms < 1 else 'over 1ms'}), "
+          f"{over:.2%} of queries took 1ms or more")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,65 @@
+"""
+ランキングのレイテンシ計測
+
+合成ユーザー（既定10万人、カテゴリー10種）でランキングを構築し、
+ポイント加算・上位N件・自分の順位・前後の取得それぞれのp50/p95/p99を表示する。
+MySQLは不要。
+
+使い方:
+    python -m benchmarks.bench_leaderboard --users 100000 --operations 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.leaderboard import LeaderboardRegistry  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(label, operations, func):
+    latencies = []
+    for args in operations:
+        started = time.perf_counter()
+        func(*args)
+        latencies.append((time.perf_counter() - started) * 1_000_000)
+    print(
+        f"{label:<18} p50={percentile(latencies, 0.50):.1f}us "
+        f"p95={percentile(latencies, 0.95):.1f}us p99={percentile(latencies, 0.99):.1f}us"
+    )
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--operations", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    registry = LeaderboardRegistry()
+    started = time.perf_counter()
+    for user_id in range(1, args.users + 1):
+        categories = rng.sample(range(1, 11), rng.randint(0, 3))
+        registry.add_user(user_id, f"user{user_id}", rng.randint(0, 100_000), categories)
+    print(f"built leaderboard for {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    def user_ids():
+        return [(rng.randint(1, args.users),) for _ in range(args.operations)]
+
+    measure("apply_delta", [(u, rng.randint(1, 100)) for (u,) in user_ids()], registry.apply_delta)
+    measure("top 10", [(10,)] * args.operations, registry.top)
+    measure("top 10 (category)", [(10, rng.randint(1, 10)) for _ in range(args.operations)], registry.top)
+    measure("my rank", user_ids(), registry.rank)
+    measure("neighbors +-5", [(u, 5) for (u,) in user_ids()], registry.neighbors)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,95 @@
+"""
+ログイン（bcrypt検証）スループットのベンチマーク
+
+bcryptのコスト(BCRYPT_ROUNDS)とハッシュ用ワーカー数(PASSWORD_HASH_WORKERS)の組み合わせごとに、
+同時ログイン時の1秒あたりの検証数・p95レイテンシ・イベントループの最大停止時間を計測する。
+ワーカー数の列が "inline" の行は変更前と同じくイベントループ上で直接検証した場合。
+
+使い方:
+    python -m benchmarks.bench_login_throughput --rounds 10 12 --workers 1 2 4 --logins 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passlib.context import CryptContext  # noqa: E402
+
+from app.core import security  # noqa: E402
+
+PASSWORD = "benchmark-password"
+
+
+async def _watch_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """イベントループが止まっていた最大時間を計測する"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run_case(hashed: str, logins: int, concurrency: int, inline: bool):
+    latencies = []
+    remaining = logins
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            if inline:
+                ok = security.pwd_context.verify(PASSWORD, hashed)
+            else:
+                ok, _ = await security.verify_password_async(PASSWORD, hashed)
+            assert ok
+            latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    loop_lag = await watcher
+
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    return logins / elapsed, p95, loop_lag
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 12])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    security.DEV_MODE = False
+    security.PASSWORD_HASH_MAX_QUEUE = max(security.PASSWORD_HASH_MAX_QUEUE, args.concurrency)
+    print(f"logins={args.logins} concurrency={args.concurrency} cpus={os.cpu_count()}")
+    print(f"{'rounds':>6} {'workers':>7} {'logins/s':>9} {'p95 ms':>8} {'max loop stall ms':>18}")
+    for rounds in args.rounds:
+        # 再ハッシュが走らないよう、計測するコストをそのまま既定値にする
+        # （ワーカーはfork時にこのコンテキストを引き継ぐ）
+        security.pwd_context = CryptContext(
+            schemes=["bcrypt"], bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds
+        )
+        hashed = security.pwd_context.hash(PASSWORD)
+        cases = [("inline", True)] + [(str(w), False) for w in args.workers]
+        for label, inline in cases:
+            if not inline:
+                security.shutdown_password_executor()
+                security.PASSWORD_HASH_WORKERS = int(label)
+            rps, p95, lag = asyncio.run(run_case(hashed, args.logins, args.concurrency, inline))
+            print(f"{rounds:>6} {label:>7} {rps:>9.1f} {p95 * 1000:>8.1f} {lag * 1000:>18.1f}")
+    security.shutdown_password_executor()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,99 @@
+"""
+起動時間の計測
+
+新しいPythonプロセスで main をインポートし、lifespan の起動処理を経て最初のリクエスト(GET /)に
+応答できるまでの時間を計測する。リリースごとの推移を追えるよう、--history を指定すると
+結果を1行のJSONとして追記する。
+
+DB接続先は通常どおり環境変数（DB_HOST など）で指定する。
+
+使い方:
+    python -m benchmarks.bench_startup --runs 5 --history benchmarks/results/startup.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+import httpx
+
+async def boot():
+    async with main.app.router.lifespan_context(main.app):
+        lifespan_done = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get("/")
+        first_response = time.perf_counter()
+    return {
+        "import_ms": (imported - started) * 1000,
+        "lifespan_ms": (lifespan_done - imported) * 1000,
+        "first_request_ms": (first_response - lifespan_done) * 1000,
+        "ready_ms": (first_response - started) * 1000,
+        "status": response.status_code,
+        "app_timings": main.app.state.startup_timings,
+    }
+
+print(json.dumps(asyncio.run(boot())))
+"""
+
+
+def run_once() -> dict:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    data["process_wall_ms"] = wall_ms
+    return data
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--history", help="結果を追記するJSONLファイル")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    keys = ["import_ms", "lifespan_ms", "first_request_ms", "ready_ms", "process_wall_ms"]
+    summary = {key: round(statistics.median(r[key] for r in runs), 2) for key in keys}
+
+    print(f"runs={args.runs} (median)")
+    for key in keys:
+        print(f"  {key:<18} {summary[key]:>9.2f}")
+
+    if args.history:
+        record = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "runs": args.runs,
+            **summary,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main_cli()
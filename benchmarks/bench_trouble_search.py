@@ -0,0 +1,109 @@
+"""
+お困りごと検索インデックスのレイテンシ計測
+
+語彙からランダムに組み立てた日本語の合成コーパス（既定10万件）を索引し、
+構築時間とクエリのp50/p95/p99レイテンシ（カテゴリー絞り込みあり/なし）を表示する。
+MySQLは不要。
+
+使い方:
+    python -m benchmarks.bench_trouble_search --documents 100000 --queries 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.trouble_search import TroubleSearchIndex  # noqa: E402
+
+SUBJECTS = [
+    "経費精算", "請求書", "パスワード", "VPN", "プリンター", "契約書", "商標", "デザインレビュー",
+    "見積もり", "社内Wiki", "勤怠システム", "ノートPC", "セキュリティ研修", "Slack", "会議室予約",
+    "ロゴ", "BGM", "著作権", "予算申請", "アカウント", "メール", "Excelマクロ", "データベース",
+    "名刺", "出張申請", "監査対応", "ライセンス", "サーバー", "新規事業", "プレゼン資料",
+]
+PROBLEMS = [
+    "がうまくいきません", "の手順がわかりません", "でエラーが出ます", "の承認が止まっています",
+    "を至急確認してほしいです", "の書き方を教えてください", "が遅くて困っています",
+    "の担当者を探しています", "の期限が迫っています", "が見つかりません",
+]
+DETAILS = [
+    "昨日から急に", "先週の更新以降", "月末の締め前に", "新しい部署に異動してから", "リモートワーク中に",
+    "取引先から指摘されて", "何度やり直しても", "マニュアルを読んでも", "上長に確認したところ", "初めての作業で",
+]
+
+
+# 取引先名・製品名などの固有名詞を作るための文字（語彙の多様性を実データに近づける）
+NAME_CHARS = (
+    "山田中川村林森木本井上下田原野小大高石松竹梅桜青赤白黒金銀東西南北新古光明電機商事工業"
+    "データクラウドシステムネットワークアプリモバイルサービスプロジェクトチームサポートセンター"
+)
+
+
+def make_name(rng: random.Random) -> str:
+    return "".join(rng.choice(NAME_CHARS) for _ in range(rng.randint(2, 4)))
+
+
+def make_document(rng: random.Random):
+    subject = rng.choice(SUBJECTS)
+    title = f"{make_name(rng)}の{subject}{rng.choice(PROBLEMS)}"
+    description = "。".join(
+        f"{rng.choice(DETAILS)}{make_name(rng)}の{rng.choice(SUBJECTS)}{rng.choice(PROBLEMS)}"
+        for _ in range(rng.randint(2, 5))
+    )
+    return title, description, rng.randint(1, 10)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = TroubleSearchIndex()
+    started = time.perf_counter()
+    for trouble_id in range(1, args.documents + 1):
+        title, description, category_id = make_document(rng)
+        index.add(trouble_id, title, description, category_id)
+    build_seconds = time.perf_counter() - started
+    print(f"indexed {len(index)} documents in {build_seconds:.1f}s ({index.stats()['terms']} terms)")
+
+    # 「似たお困りごと」を探す想定: 既存の文書に近い表現（一般的な語のみのクエリも混ぜる）
+    queries = [
+        f"{make_name(rng)}の{rng.choice(SUBJECTS)}{rng.choice(PROBLEMS)}" if i % 4 else
+        f"{rng.choice(SUBJECTS)}{rng.choice(PROBLEMS)}"
+        for i in range(args.queries)
+    ]
+    for label, category_id in (("all categories", None), ("category filter", 3)):
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, category_id, limit=20)
+            latencies.append((time.perf_counter() - started) * 1000)
+        print(
+            f"{label:<16} p50={percentile(latencies, 0.50):.2f}ms "
+            f"p95={percentile(latencies, 0.95):.2f}ms p99={percentile(latencies, 0.99):.2f}ms "
+            f"mean={statistics.mean(latencies):.2f}ms"
+        )
+
+    updates = 1000
+    started = time.perf_counter()
+    for trouble_id in range(1, updates + 1):
+        title, description, category_id = make_document(rng)
+        index.add(trouble_id, title, description, category_id)
+    per_update_ms = (time.perf_counter() - started) * 1000 / updates
+    print(f"incremental update (edit existing): {per_update_ms:.3f}ms per document")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,102 @@
+"""
+ユーザー一括書き出しのメモリ使用量の計測
+
+インメモリDB（benchmarks/fake_mysql.py）にユーザーを入れ、書き出し（app.services.user_export）を
+最後まで読んだときのピークメモリ（tracemalloc）と所要時間を件数ごとに表示する。
+比較として、同じSELECTを fetchall() して JSON 配列にまとめて返す場合（従来のやり方）も計測する。
+書き出しのピークは件数によらずほぼ一定（1バッチ分）になる。MySQLは不要。
+
+使い方:
+    python -m benchmarks.bench_user_export --users 10000 50000 200000 --batch-size 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fake_mysql  # noqa: E402
+
+CATEGORIES = ["営業部", "経理部", "人事部", "開発部", "デザイン部"]
+
+
+def seed(db, total: int):
+    base = datetime(2026, 1, 1)
+    for i in range(len(db.users) + 1, total + 1):
+        user_id = db.add_user(
+            f"export-user-{i}", "x", [CATEGORIES[i % len(CATEGORIES)], CATEGORIES[i % 2]], points=i % 1000
+        )
+        db.users[user_id]["last_login_at"] = base + timedelta(minutes=i)
+
+
+async def run_stream(fmt: str, batch_size: int):
+    from app.services.user_export import UserExporter
+
+    exporter = UserExporter(fmt, batch_size=batch_size)
+    await exporter.open()
+    size = 0
+    async for chunk in exporter.stream():
+        size += len(chunk)
+    return exporter.rows, size
+
+
+def run_fetchall():
+    from app.core.database import get_db_connection
+    from app.services.user_export import build_query
+
+    with get_db_connection(read_only=True) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(*build_query())
+            rows = cursor.fetchall()
+    body = json.dumps([
+        {**row, "last_login_at": row["last_login_at"].isoformat() if row["last_login_at"] else None}
+        for row in rows
+    ], ensure_ascii=False).encode("utf-8")
+    return len(rows), len(body)
+
+
+def measure(call):
+    """(行数, バイト数, 秒, 実行中に増えたメモリのピーク)。秒は tracemalloc の分だけ遅く出る"""
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        rows, size = call()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return rows, size, seconds, peak
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 50_000, 200_000])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0)
+    parser.add_argument("--skip-baseline", action="store_true", help="fetchall() での比較を省く")
+    args = parser.parse_args()
+
+    db = fake_mysql.install(args.db_latency_ms / 1000)
+    print(f"{'users':>8} {'mode':<16} {'rows':>8} {'MiB':>8} {'seconds':>8} {'peak KiB':>10}")
+    for total in sorted(args.users):
+        seed(db, total)
+        modes = [
+            ("stream ndjson", lambda: asyncio.run(run_stream("ndjson", args.batch_size))),
+            ("stream csv", lambda: asyncio.run(run_stream("csv", args.batch_size))),
+        ]
+        if not args.skip_baseline:
+            modes.append(("fetchall + json", run_fetchall))
+        for label, call in modes:
+            rows, size, seconds, peak = measure(call)
+            print(f"{total:>8} {label:<16} {rows:>8} {size / 2**20:>8.1f} {seconds:>8.2f} {peak / 1024:>10.0f}")
+    if db.unhandled:
+        print("unhandled SQL:", *sorted(db.unhandled), sep="\n  ")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,85 @@
+"""
+/api/users/me の同時実行ベンチマーク
+
+DBアクセスを同期のまま実行した場合（イベントループをブロック）と、
+run_db でDB専用スレッドプールに逃がした場合のスループットを比較する。
+MySQLは不要: UserModel.get_by_username を固定レイテンシのスタブに差し替える。
+
+使い方:
+    python -m benchmarks.bench_users_me_concurrency --concurrency 1 10 50 --requests 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from app.api.categories.models import CategoryModel  # noqa: E402
+
+# 起動時のカテゴリー登録でMySQLに接続しに行かないようにする
+CategoryModel.ensure_categories_exist = staticmethod(lambda: True)
+
+import main  # noqa: E402
+from app.api.users.models import UserModel  # noqa: E402
+from app.api.users.schemas import UserInDB  # noqa: E402
+from app.core import dependencies  # noqa: E402
+from app.core.database import run_db  # noqa: E402
+from app.core.security import create_access_token  # noqa: E402
+
+
+def install_stub(db_latency: float):
+    def get_by_username(username: str):
+        time.sleep(db_latency)
+        return UserInDB(user_id=1, name=username, password="secret", point_total=0, num_answer=0)
+
+    UserModel.get_by_username = staticmethod(get_by_username)
+
+
+async def _blocking_run_db(func, *args, **kwargs):
+    # 変更前の挙動: 同期呼び出しでイベントループを止める
+    return func(*args, **kwargs)
+
+
+async def run_case(concurrency: int, total: int, blocking: bool) -> float:
+    dependencies.run_db = _blocking_run_db if blocking else run_db
+    token = create_access_token({"sub": "bench-user"})
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=main.app)
+    remaining = total
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.get("/api/users/me", headers=headers)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return total / elapsed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    install_stub(args.db_latency_ms / 1000)
+    print(f"db latency={args.db_latency_ms}ms requests={args.requests}")
+    print(f"{'concurrency':>11} {'blocking rps':>13} {'run_db rps':>11} {'speedup':>8}")
+    for concurrency in args.concurrency:
+        blocking = asyncio.run(run_case(concurrency, args.requests, blocking=True))
+        offloaded = asyncio.run(run_case(concurrency, args.requests, blocking=False))
+        print(f"{concurrency:>11} {blocking:>13.1f} {offloaded:>11.1f} {offloaded / blocking:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
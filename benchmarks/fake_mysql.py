@@ -0,0 +1,368 @@
+"""
+ベンチマーク用のMySQLの代わり（プロセス内のインメモリDB）
+
+pymysql.connect を差し替え、アプリが発行するSQLのうちベンチマーク対象のエンドポイントと
+起動処理で使うものだけを、正規化したSQLの形（app.core.query_trace.normalize_sql）で判別して
+メモリ上のテーブルに対して実行する。1回の往復ごとに --db-latency-ms だけ sleep して
+ネットワーク越しのMySQLを模す。
+
+知らない形のSQLは空の結果を返し、unhandled に記録する（ベンチマークの最後に表示する）。
+
+使い方:
+    from benchmarks import fake_mysql
+    db = fake_mysql.install(latency=0.0005)
+    db.add_user("bench-user-1", "password", ["営業部"])
+"""
+import itertools
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pymysql
+from pymysql.cursors import SSCursor
+from pymysql.constants.SERVER_STATUS import SERVER_STATUS_IN_TRANS
+
+from app.core.database import _TracingMixin
+from app.core.query_trace import normalize_sql
+
+
+# カウンターの UPDATE（app.services.counters / app.api.users.models）の読み取り用
+_COUNTER_CASES = re.compile(r"(\w+) = \1 \+ CASE user_id ((?:WHEN %s THEN %s )+)ELSE 0 END")
+_LOGIN_CASE = re.compile(r"CASE WHEN user_id IN \(([^)]*)\) THEN NOW\(\)")
+_SINGLE_COUNTER = re.compile(r"SET (\w+) = (?:\1 \+ (%s|\d+)|NOW\(\))")
+
+
+class FakeDatabase:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.users: Dict[int, dict] = {}
+        self.users_by_name: Dict[str, int] = {}
+        self.categories: Dict[str, int] = {}
+        self.user_categories = set()
+        # ユーザーごとのカテゴリーID（書き出しの相関サブクエリ用）
+        self.categories_by_user: Dict[int, List[int]] = {}
+        self.app_meta: Dict[str, str] = {}
+        self.unhandled = set()
+        self.statements = 0
+        self._shape = ""
+        self._query = ""
+        self._handlers = [
+            (re.compile(pattern), handler) for pattern, handler in (
+                (r"^SELECT \* FROM users WHERE name = \?$", self._select_user_by_name),
+                (r"^SELECT \* FROM users WHERE user_id = \?$", self._select_user_by_id),
+                (r"^SELECT name FROM users WHERE name IN", self._select_names),
+                (r"^SELECT user_id, name FROM users WHERE name IN", self._select_ids_by_name),
+                (r"^INSERT INTO users \(name, password, categories", self._insert_user),
+                (r"^UPDATE users SET password = \? WHERE user_id = \?$", self._update_password),
+                (r"^UPDATE users SET ", self._update_counters),
+                (r"^SELECT user_id, name, point_total FROM users WHERE user_id > \?", self._select_users_after),
+                (r"^SELECT user_id, num_answer, point_total FROM users WHERE user_id > \?", self._select_users_after),
+                (r"^SELECT user_id, num_answer, point_total FROM users WHERE user_id IN", self._select_users_by_id),
+                (r"^SELECT user_id, point_total FROM users WHERE user_id IN", self._select_users_by_id),
+                (r"^SELECT id, name FROM categories WHERE name IN", self._select_category_ids),
+                (r"^INSERT IGNORE INTO categories \(name\) VALUES", self._insert_categories),
+                (r"^SELECT \* FROM categories ORDER BY name$", self._select_categories),
+                (r"^INSERT IGNORE INTO user_categories", self._insert_user_category),
+                (r"^SELECT user_id, category_id FROM user_categories$", self._select_user_categories),
+                (r"^SELECT u\.user_id, u\.name, u\.point_total, u\.num_answer, u\.last_login_at, \(SELECT GROUP_CONCAT",
+                 self._select_users_export),
+                (r"^SELECT meta_value FROM app_meta WHERE meta_key = \?$", self._select_meta),
+                (r"^SELECT NOW\(\) AS now$", self._select_now),
+                (r"^INSERT INTO app_meta", self._upsert_meta),
+                # お困りごと検索インデックスの構築（ベンチマークでは空）
+                (r"^SELECT trouble_id, title, description, category_id, updated_at FROM troubles", lambda args: ([], 0, None)),
+                # 失効済みトークン（ベンチマークでは失効させない）
+                (r"^SELECT id, jti, expires_at, created_at FROM revoked_tokens", lambda args: ([], 0, None)),
+                (r"^CREATE TABLE", lambda args: ([], 0, None)),
+                (r"^SET SESSION ", lambda args: ([], 0, None)),
+            )
+        ]
+
+    # --- テストデータ ---
+
+    def add_user(self, name: str, password: str, categories: Optional[List[str]] = None, points: int = 0) -> int:
+        with self._lock:
+            user_id = len(self.users) + 1
+            self.users[user_id] = {
+                "user_id": user_id, "name": name, "password": password, "category_id": None,
+                "categories": ",".join(categories or []) or None, "num_answer": 0,
+                "point_total": points, "last_login_at": None,
+            }
+            self.users_by_name[name] = user_id
+            for category in categories or []:
+                category_id = self.categories.setdefault(category, len(self.categories) + 1)
+                self._add_user_category(user_id, category_id)
+            return user_id
+
+    # --- 実行 ---
+
+    def execute(self, query, args):
+        if isinstance(query, bytes):
+            query = query.decode("utf-8")
+        shape = normalize_sql(query)
+        if args is not None and not isinstance(args, (list, tuple)):
+            args = (args,)
+        with self._lock:
+            self.statements += 1
+            self._shape = shape
+            self._query = " ".join(query.split())
+            for pattern, handler in self._handlers:
+                if pattern.search(shape):
+                    return handler(list(args or ()))
+            self.unhandled.add(shape)
+            return [], 0, None
+
+    def _select_user_by_name(self, args):
+        user_id = self.users_by_name.get(args[0])
+        return ([dict(self.users[user_id])] if user_id else []), (1 if user_id else 0), None
+
+    def _select_user_by_id(self, args):
+        user = self.users.get(args[0])
+        return ([dict(user)] if user else []), (1 if user else 0), None
+
+    def _insert_user(self, args):
+        name, password, categories = args[:3]
+        if name in self.users_by_name:
+            raise pymysql.err.IntegrityError(1062, f"Duplicate entry '{name}' for key 'name'")
+        user_id = len(self.users) + 1
+        self.users[user_id] = {
+            "user_id": user_id, "name": name, "password": password, "category_id": None,
+            "categories": categories, "num_answer": 0, "point_total": 0,
+            "last_login_at": args[3] if len(args) > 3 else datetime.now(),
+        }
+        self.users_by_name[name] = user_id
+        return [], 1, user_id
+
+    def _select_names(self, args):
+        rows = [{"name": name} for name in args if name in self.users_by_name]
+        return rows, len(rows), None
+
+    def _select_ids_by_name(self, args):
+        rows = [{"user_id": self.users_by_name[name], "name": name} for name in args if name in self.users_by_name]
+        return rows, len(rows), None
+
+    def _update_password(self, args):
+        user = self.users.get(args[1])
+        if user:
+            user["password"] = args[0]
+        return [], int(bool(user)), None
+
+    def _update_counters(self, args):
+        """
+        ポイント・回答数・最終ログインの UPDATE
+        UserCounterBuffer のまとめ書き（CASE user_id WHEN ...）と UserModel の即時更新（1ユーザー）の両方
+        """
+        now = datetime.now()
+        if "CASE" not in self._query:
+            *values, user_id = args
+            user = self.users.get(user_id)
+            if user is None:
+                return [], 0, None
+            column, increment = _SINGLE_COUNTER.search(self._query).groups()
+            if column == "last_login_at":
+                user[column] = now
+            else:
+                user[column] += values[0] if increment == "%s" else int(increment)
+            return [], 1, None
+
+        args = iter(args)
+        for column, cases in _COUNTER_CASES.findall(self._query):
+            for _ in range(cases.count("WHEN")):
+                user = self.users.get(next(args))
+                delta = next(args)
+                if user is not None:
+                    user[column] += delta
+        logins = _LOGIN_CASE.search(self._query)
+        if logins:
+            for _ in range(logins.group(1).count("%s")):
+                user = self.users.get(next(args))
+                if user is not None:
+                    user["last_login_at"] = now
+        return [], sum(user_id in self.users for user_id in args), None
+
+    def _select_users_after(self, args):
+        after_id, limit = args
+        rows = [
+            {"user_id": u["user_id"], "name": u["name"], "num_answer": u["num_answer"], "point_total": u["point_total"]}
+            for user_id, u in sorted(self.users.items()) if user_id > after_id
+        ][:limit]
+        return rows, len(rows), None
+
+    def _select_users_by_id(self, args):
+        rows = [
+            {"user_id": u["user_id"], "num_answer": u["num_answer"], "point_total": u["point_total"]}
+            for u in (self.users.get(user_id) for user_id in args) if u is not None
+        ]
+        return rows, len(rows), None
+
+    def _select_category_ids(self, args):
+        rows = [{"id": self.categories[name], "name": name} for name in args if name in self.categories]
+        return rows, len(rows), None
+
+    def _insert_categories(self, args):
+        inserted = 0
+        for name in args:
+            if name not in self.categories:
+                self.categories[name] = len(self.categories) + 1
+                inserted += 1
+        return [], inserted, None
+
+    def _select_categories(self, args):
+        rows = [{"id": category_id, "name": name} for name, category_id in sorted(self.categories.items())]
+        return rows, len(rows), None
+
+    def _add_user_category(self, user_id: int, category_id: int) -> bool:
+        if (user_id, category_id) in self.user_categories:
+            return False
+        self.user_categories.add((user_id, category_id))
+        self.categories_by_user.setdefault(user_id, []).append(category_id)
+        return True
+
+    def _insert_user_category(self, args):
+        return [], int(self._add_user_category(args[0], args[1])), None
+
+    def _select_users_export(self, args):
+        """
+        app.services.user_export の SELECT。行はジェネレーターで返し、
+        サーバー側カーソルでは fetchmany のたびに作る（結果全体をリストにしない）
+        """
+        args = iter(args)
+        category_id = next(args) if "f.category_id = ?" in self._shape else None
+        login_from = next(args) if "u.last_login_at >= ?" in self._shape else None
+        login_to = next(args) if "u.last_login_at < ?" in self._shape else None
+        names = {category_id: name for name, category_id in self.categories.items()}
+
+        def rows():
+            # users は user_id の昇順に追加されるので、そのまま ORDER BY u.user_id の順
+            for user_id, user in self.users.items():
+                ids = self.categories_by_user.get(user_id, ())
+                if category_id is not None and category_id not in ids:
+                    continue
+                last_login_at = user["last_login_at"]
+                if login_from is not None and (last_login_at is None or last_login_at < login_from):
+                    continue
+                if login_to is not None and (last_login_at is None or last_login_at >= login_to):
+                    continue
+                yield {
+                    "user_id": user_id, "name": user["name"], "point_total": user["point_total"],
+                    "num_answer": user["num_answer"], "last_login_at": last_login_at,
+                    "categories": ";".join(sorted(names[c] for c in ids)) or None,
+                }
+        return rows(), -1, None
+
+    def _select_user_categories(self, args):
+        rows = [{"user_id": u, "category_id": c} for u, c in sorted(self.user_categories)]
+        return rows, len(rows), None
+
+    def _select_now(self, args):
+        return [{"now": datetime.now()}], 1, None
+
+    def _select_meta(self, args):
+        value = self.app_meta.get(args[0])
+        return ([{"meta_value": value}] if value is not None else []), int(value is not None), None
+
+    def _upsert_meta(self, args):
+        self.app_meta[args[0]] = args[1]
+        return [], 1, None
+
+
+class _FakeCursorBase:
+    def __init__(self, connection, unbuffered: bool = False):
+        self.connection = connection
+        # True: サーバー側カーソル（SSCursor）。結果をためず、fetchmany のたびに1往復して読む
+        self.unbuffered = unbuffered
+        self.rowcount = -1
+        self.lastrowid = None
+        self._rows = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _round_trip(self):
+        if self.connection.db.latency:
+            time.sleep(self.connection.db.latency)
+
+    def _run(self, query, args):
+        rows, self.rowcount, lastrowid = self.connection.db.execute(query, args)
+        self._rows = iter(rows) if self.unbuffered else iter(list(rows))
+        if lastrowid is not None:
+            self.lastrowid = lastrowid
+        return self.rowcount
+
+    def execute(self, query, args=None):
+        self._round_trip()
+        return self._run(query, args)
+
+    def executemany(self, query, args):
+        # pymysql と同じく1往復で送る想定
+        self._round_trip()
+        total = 0
+        for row in args:
+            total += self._run(query, row)
+        self.rowcount = total
+        return total
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=1):
+        if self.unbuffered:
+            self._round_trip()
+        return list(itertools.islice(self._rows, size))
+
+    def fetchall(self):
+        rows = list(self._rows)
+        self._rows = iter(())
+        return rows
+
+    def close(self):
+        self._rows = iter(())
+
+
+class FakeCursor(_TracingMixin, _FakeCursorBase):
+    """アプリと同じくSQLのトレースを通す"""
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.open = True
+        self.server_status = 0
+        self._autocommit = True
+
+    def cursor(self, cursor=None):
+        return FakeCursor(self, unbuffered=cursor is not None and issubclass(cursor, SSCursor))
+
+    def get_autocommit(self):
+        return self._autocommit
+
+    def autocommit(self, value):
+        self._autocommit = bool(value)
+
+    def begin(self):
+        self.server_status |= SERVER_STATUS_IN_TRANS
+
+    def commit(self):
+        self.server_status &= ~SERVER_STATUS_IN_TRANS
+
+    def rollback(self):
+        self.server_status &= ~SERVER_STATUS_IN_TRANS
+
+    def ping(self, reconnect=False):
+        return True
+
+    def close(self):
+        self.open = False
+
+
+def install(latency: float = 0.0) -> FakeDatabase:
+    """pymysql.connect をインメモリDBへの接続に差し替える"""
+    db = FakeDatabase(latency)
+    pymysql.connect = lambda *args, **kwargs: FakeConnection(db)
+    return db
@@ -1,27 +1,118 @@
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request
 
 # 環境変数の読み込み
 load_dotenv()
 
+from app.middlewares.logging import setup_logging
+setup_logging()
+logger = logging.getLogger("app.main")
+
 # APIルーターのインポート
 from app.api.auth.router import router as auth_router
 from app.api.users.router import router as users_router
 from app.api.categories.router import router as categories_router
 # 必要に応じて他のルーターもインポート
 # from app.api.projects.router import router as projects_router
-# from app.api.troubles.router import router as troubles_router
-# from app.api.messages.router import router as messages_router
+from app.api.messages.router import router as messages_router
+from app.api.troubles.router import router as troubles_router
+from app.api.realtime.router import router as realtime_router
+from app.api.leaderboard.router import router as leaderboard_router
+from app.api.attachments.router import router as attachments_router
+from app.api.profiling.router import router as profiling_router
 
-# カテゴリーの初期セットアップ
+from app.api.categories.catalog import category_catalog
 from app.api.categories.models import CategoryModel
-CategoryModel.ensure_categories_exist()
+from app.core.cache import principal_cache
+from app.core.database import (
+    close_pool, get_pool_stats, get_replica_stats, ping_database, run_db, shutdown_db_executor,
+)
+from app.core.metrics import metrics
+from app.core import revocation
+from app.core.profiling import profiler
+from app.core.security import shutdown_password_executor
+from app.services.attachments import attachment_store
+from app.services.counters import user_counter_buffer
+from app.services.realtime import realtime_hub
+from app.services import attachments, helper_matching, leaderboard, trouble_search
+from app.middlewares.db_routing import ReadRoutingMiddleware
+from app.middlewares.metrics import MetricsMiddleware
+from app.middlewares.profiling import ProfilingMiddleware
+
+# 起動時のカテゴリー登録を待つ最大秒数（超えたら登録を待たずに起動を続ける）
+STARTUP_SEED_TIMEOUT_SECONDS = float(os.getenv("STARTUP_SEED_TIMEOUT_SECONDS", "5"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    起動処理: ライトビハインド書き込み・リアルタイム配信の開始、カテゴリーの初期セットアップ、
+              失効済みトークンの読み込み、カテゴリー一覧の読み込み、
+              お困りごと検索インデックス・ランキング・ヘルパーマッチングの構築
+    終了処理: リアルタイム配信の停止、保留中のカウンター更新の書き込み、各種プールのクローズ
+    """
+    started = time.perf_counter()
+    user_counter_buffer.start()
+    await realtime_hub.start()
+
+    # カテゴリーの初期セットアップ（チェックサムが一致すればSELECT 1回で終わる）
+    try:
+        await asyncio.wait_for(run_db(CategoryModel.ensure_categories_exist), STARTUP_SEED_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning("Category seeding is taking too long; continuing startup")
+    seeded = time.perf_counter()
+    # 失効済みトークンは受け付け始める前に読み込む（以降は定期的に他ワーカーの分を取り込む）
+    try:
+        await asyncio.wait_for(run_db(revocation.token_denylist.sync), STARTUP_SEED_TIMEOUT_SECONDS)
+    except Exception:
+        logger.exception("Error loading token denylist; continuing startup")
+    denylist_sync = asyncio.create_task(revocation.run_sync_loop())
+    try:
+        await asyncio.wait_for(run_db(category_catalog.refresh), STARTUP_SEED_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning("Loading the category catalog is taking too long; continuing startup")
+    # 検索インデックスはバックグラウンドで構築し、以降は定期的に差分を取り込む
+    search_sync = asyncio.create_task(trouble_search.run_sync_loop())
+    # ランキングも同様にバックグラウンドでDBから構築し、定期的に作り直す
+    leaderboard_rebuild = asyncio.create_task(leaderboard.run_rebuild_loop())
+    # ヘルパーマッチングも同様
+    matcher_rebuild = asyncio.create_task(helper_matching.run_rebuild_loop())
+    # 参照のなくなった添付ファイルの掃除
+    attachment_sweep = asyncio.create_task(attachments.run_sweep_loop())
+    ready = time.perf_counter()
+
+    app.state.startup_timings = {
+        "import_ms": round((_app_created - _import_started) * 1000, 2),
+        "seed_ms": round((seeded - started) * 1000, 2),
+        "warmup_ms": round((ready - seeded) * 1000, 2),
+        "lifespan_ms": round((ready - started) * 1000, 2),
+    }
+    app.state.ready = True
+    yield
+    app.state.ready = False
 
-app = FastAPI()
+    search_sync.cancel()
+    denylist_sync.cancel()
+    leaderboard_rebuild.cancel()
+    matcher_rebuild.cancel()
+    attachment_sweep.cancel()
+    await realtime_hub.stop()
+    user_counter_buffer.stop()
+    shutdown_password_executor()
+    shutdown_db_executor()
+    close_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORSミドルウェアの設定
 app.add_middleware(
@@ -31,18 +122,37 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 書き込み直後の読み取りをプライマリに向けるためのリクエスト単位の状態（スティッキーはユーザー単位）
+app.add_middleware(ReadRoutingMiddleware)
+# 指定したリクエストのサンプリングプロファイル（無効時は素通り）
+app.add_middleware(ProfilingMiddleware)
+# リクエストのメトリクスとアクセスログ
+app.add_middleware(MetricsMiddleware)
+
+# 既存の統計情報も /metrics にゲージとして出す
+metrics.register_stats("db_pool", get_pool_stats)
+metrics.register_stats("db_replicas", get_replica_stats)
+metrics.register_stats("principal_cache", principal_cache.stats)
+metrics.register_stats("token_denylist", revocation.token_denylist.stats)
+metrics.register_stats("user_counter_buffer", user_counter_buffer.stats)
+metrics.register_stats("realtime", realtime_hub.stats)
+metrics.register_stats("leaderboard", leaderboard.leaderboards.stats)
+metrics.register_stats("helper_matcher", helper_matching.helper_matcher.stats)
+metrics.register_stats("trouble_search_index", trouble_search.trouble_search_index.stats)
+metrics.register_stats("attachments", attachment_store.stats)
+metrics.register_stats("profiler", profiler.stats)
 
 # 重要: ルートURLでもトークンエンドポイントを提供
 # フロントエンドが ${API_URL}/token にアクセスしているため
 @app.post("/token")
-async def token_root(form_data: OAuth2PasswordRequestForm = Depends()):
+async def token_root(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """
     ルートレベルでのトークンエンドポイント
     フロントエンド互換性のために提供
     """
     # auth_router内の関数を直接インポートして使用
     from app.api.auth.router import login_for_access_token
-    return await login_for_access_token(form_data)
+    return await login_for_access_token(form_data, request)
 
 # APIルートに各ルーターを登録
 app.include_router(auth_router, prefix="/api/auth", tags=["認証"])
@@ -50,8 +160,12 @@ app.include_router(users_router, prefix="/api/users", tags=["ユーザー"])
 app.include_router(categories_router, prefix="/api/categories", tags=["カテゴリー"])
 # 必要に応じて他のルーターも追加
 # app.include_router(projects_router, prefix="/api/projects", tags=["プロジェクト"])
-# app.include_router(troubles_router, prefix="/api/troubles", tags=["お困りごと"])
-# app.include_router(messages_router, prefix="/api/messages", tags=["メッセージ"])
+app.include_router(troubles_router, prefix="/api/troubles", tags=["お困りごと"])
+app.include_router(messages_router, prefix="/api/messages", tags=["メッセージ"])
+app.include_router(realtime_router, prefix="/api/realtime", tags=["リアルタイム通知"])
+app.include_router(leaderboard_router, prefix="/api/leaderboard", tags=["ランキング"])
+app.include_router(attachments_router, prefix="/api/attachments", tags=["添付ファイル"])
+app.include_router(profiling_router, prefix="/api/admin/profiles", tags=["プロファイル"])
 
 # ルートエンドポイント
 @app.get("/")
@@ -61,8 +175,49 @@ def read_root():
         "version": "0.1.0"
     }
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Prometheusテキスト形式のメトリクス"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# レディネスチェックでDBの応答を待つ最大秒数
+READINESS_DB_TIMEOUT_SECONDS = float(os.getenv("READINESS_DB_TIMEOUT_SECONDS", "1"))
+
+@app.get("/healthz", include_in_schema=False)
+def read_healthz():
+    """生存確認（このワーカーのイベントループが応答できるか）"""
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/readyz", include_in_schema=False)
+async def read_readyz():
+    """
+    リクエストを受けられるか（ロードバランサー用）
+    起動処理が終わっていない、停止中（SIGTERM受信後）、DBに接続できない場合は503
+    """
+    if getattr(app.state, "draining", False):
+        status = "draining"
+    elif not getattr(app.state, "ready", False):
+        status = "starting"
+    else:
+        try:
+            db_ok = await asyncio.wait_for(run_db(ping_database), READINESS_DB_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            db_ok = False
+        status = "ready" if db_ok else "database unavailable"
+    return JSONResponse(
+        {"status": status, "pid": os.getpid()},
+        status_code=200 if status == "ready" else 503,
+    )
+
+_app_created = time.perf_counter()
+
 if __name__ == "__main__":
-    import uvicorn
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run("main:app", host=host, port=port, reload=True)
\ No newline at end of file
+    if os.getenv("APP_ENV", "development") == "production":
+        # 本番: アプリを読み込んでから複数ワーカーを fork する（app/server.py）
+        from app.server import serve
+        serve(app, host, port)
+    else:
+        import uvicorn
+        uvicorn.run("main:app", host=host, port=port, reload=True)
\ No newline at end of file
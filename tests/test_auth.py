@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+from app.core import database, revocation
+
+
+class _FakeRevokedTokens:
+    """revoked_tokens の (created_at, id) 順ページングだけを模す接続"""
+
+    def __init__(self):
+        self.rows = []
+        self._result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, args):
+        since, _, after_id, limit = args
+        rows = [
+            row for row in self.rows
+            if (row["created_at"] > since or (row["created_at"] == since and row["id"] > after_id))
+            and row["expires_at"] > datetime.utcnow()
+        ]
+        self._result = sorted(rows, key=lambda row: (row["created_at"], row["id"]))[:limit]
+
+    def fetchall(self):
+        return self._result
+
+
+def test_sync_picks_up_lower_id_committed_later(monkeypatch):
+    table = _FakeRevokedTokens()
+    monkeypatch.setattr(revocation, "get_db_connection", lambda *args, **kwargs: table)
+    denylist = revocation.TokenDenylist()
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=1)
+
+    table.rows.append({"id": 2, "jti": "later-id", "expires_at": expires_at, "created_at": now})
+    assert denylist.sync() == 1
+
+    # id=1 は id=2 より先に割り当てられたが、後からコミットされた
+    table.rows.append({"id": 1, "jti": "earlier-id", "expires_at": expires_at, "created_at": now - timedelta(seconds=1)})
+    assert denylist.sync() == 1
+    assert denylist.is_revoked("earlier-id")
+    assert denylist.sync() == 0
+
+
+def test_reads_stick_to_primary_for_the_registered_subject(monkeypatch):
+    monkeypatch.setattr(database, "_sticky_clients", database._StickyClients())
+
+    # 登録（認証前のリクエスト）で発行したトークンの sub を記録する
+    token = database.begin_read_session()
+    database.mark_read_sticky("new-user")
+    database.end_read_session(token)
+
+    # 同じ sub で認証された次のリクエストはプライマリを読む（別の Authorization ヘッダーでも）
+    token = database.begin_read_session()
+    database.bind_read_session("new-user")
+    assert database._prefer_primary()
+    database.end_read_session(token)
+
+    token = database.begin_read_session()
+    database.bind_read_session("other-user")
+    assert not database._prefer_primary()
+    database.end_read_session(token)
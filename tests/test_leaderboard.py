@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+
+from app.services import leaderboard
+from app.services.leaderboard import LeaderboardRegistry
+
+
+class _FakeCounterBuffer:
+    """保留中の加算を持ち、フラッシュを止めている間かどうかを記録する"""
+
+    def __init__(self):
+        self.points = {}
+        self.holding = False
+
+    @contextmanager
+    def holding_flushes(self):
+        self.holding = True
+        try:
+            yield
+        finally:
+            self.holding = False
+
+    def pending_points(self):
+        return dict(self.points)
+
+
+def test_leaderboard_replays_updates_made_during_rebuild(monkeypatch):
+    registry = LeaderboardRegistry()
+    users = [{"user_id": 1, "name": "alice", "point_total": 10}, {"user_id": 2, "name": "bob", "point_total": 20}]
+    rows = {row["user_id"]: row for row in users}
+    buffer = _FakeCounterBuffer()
+    monkeypatch.setattr(leaderboard, "user_counter_buffer", buffer)
+
+    def load(batch_size):
+        assert not buffer.holding
+        # 読み込み中の登録と加算（加算はフラッシュされず保留中に残っている）
+        registry.add_user(3, "carol", 0, [7])
+        buffer.points[3] = 50
+        registry.apply_delta(3, 50)
+        buffer.points[1] = 15
+        registry.apply_delta(1, 15)
+        return users, {1: [7], 2: [7]}
+
+    def load_points(user_ids, batch_size):
+        # 保留中の加算を読んだ後の加算は journal から適用される
+        registry.apply_delta(2, 1)
+        return [rows.get(user_id, {"user_id": user_id, "point_total": 0}) for user_id in user_ids]
+
+    monkeypatch.setattr(registry, "_load", load)
+    monkeypatch.setattr(registry, "_load_points", load_points)
+    registry.rebuild()
+
+    assert [(entry["user_id"], entry["point_total"]) for entry in registry.top(3)] == [(3, 50), (1, 25), (2, 21)]
+    assert [entry["user_id"] for entry in registry.top(3, category_id=7)] == [3, 1, 2]
+    assert registry._journal is None
@@ -0,0 +1,66 @@
+from app.api.messages import models
+from app.api.messages.models import MessageModel
+
+
+def test_mark_read_with_empty_message_ids_does_nothing(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("mark_read must not touch the database for an empty message_ids")
+
+    monkeypatch.setattr(models, "get_db_connection", fail)
+    assert MessageModel.mark_read(1, 2, message_ids=[]) == 0
+
+
+class _FakeMessages:
+    """messages の会話キー・message_id < カーソルの降順ページングだけを模す接続"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, args):
+        if len(args) == 3:
+            key, before_id, limit = args
+        else:
+            (key, limit), before_id = args, None
+        rows = [
+            row for row in self.rows
+            if row["conversation_key"] == key and (before_id is None or row["message_id"] < before_id)
+        ]
+        self._result = sorted(rows, key=lambda row: row["message_id"], reverse=True)[:limit]
+
+    def fetchall(self):
+        return self._result
+
+
+def _pages(user_id, other_user_id, limit, before_id=None):
+    pages = []
+    while True:
+        rows, before_id = MessageModel.list_messages(user_id, other_user_id, before_id, limit)
+        pages.append([row["message_id"] for row in rows])
+        if before_id is None:
+            return pages
+
+
+def test_list_messages_keyset_pages_end_exactly_at_the_oldest_message(monkeypatch):
+    rows = [{"message_id": message_id, "conversation_key": "1:2"} for message_id in range(1, 7)]
+    # 別の会話のメッセージは混ざらない
+    rows.append({"message_id": 100, "conversation_key": "1:3"})
+    monkeypatch.setattr(models, "get_db_connection", lambda *args, **kwargs: _FakeMessages(rows))
+
+    # 最後のページがちょうど limit 件でも、空のページを返さずにカーソルが None になる
+    assert _pages(1, 2, limit=3) == [[6, 5, 4], [3, 2, 1]]
+    assert _pages(2, 1, limit=4) == [[6, 5, 4, 3], [2, 1]]
+    # 最初のページ: 最新より大きい before_id は before_id なしと同じ
+    assert MessageModel.list_messages(1, 2, before_id=7, limit=3) == MessageModel.list_messages(1, 2, limit=3)
+    # 最後のページの境界: before_id より前が limit 件ちょうど / 最古のメッセージより前は空
+    assert MessageModel.list_messages(1, 2, before_id=4, limit=3) == (rows[2::-1], None)
+    assert MessageModel.list_messages(1, 2, before_id=1, limit=3) == ([], None)
@@ -0,0 +1,183 @@
+import heapq
+import math
+import random
+from contextlib import contextmanager
+
+from app.services import helper_matching, trouble_search
+from app.services.helper_matching import HelperMatcher
+from app.services.trouble_search import TroubleSearchIndex, tokenize
+
+
+def brute_force(index: TroubleSearchIndex, query: str, category_id=None, limit: int = 20):
+    """全文書をBM25で採点した上位 limit 件の trouble_id"""
+    n = len(index._documents)
+    k = trouble_search.BM25_K1 * (1 - trouble_search.BM25_B)
+    k_length = trouble_search.BM25_K1 * trouble_search.BM25_B / (index._total_length / n)
+    scores = {}
+    for term in set(tokenize(query)):
+        postings = index._postings.get(term, {})
+        idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+        for trouble_id, tf in postings.items():
+            document = index._documents[trouble_id]
+            if category_id is not None and document.category_id != category_id:
+                continue
+            scores[trouble_id] = scores.get(trouble_id, 0.0) + (
+                idf * tf * (trouble_search.BM25_K1 + 1) / (tf + k + k_length * document.length)
+            )
+    top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+    return [trouble_id for trouble_id, _ in top]
+
+
+def test_search_keeps_documents_without_the_rarest_bigram():
+    index = TroubleSearchIndex()
+    for trouble_id in (1, 2, 3):
+        index.add(trouble_id, "プリンターが動かない", f"朝から{trouble_id}回試しました")
+    index.add(4, "経費精算の締め", "至急対応お願いします")
+
+    total, is_estimate, hits = index.search("プリンターが動かない 至急")
+
+    assert total == 4
+    assert not is_estimate
+    assert [trouble_id for trouble_id, _ in hits[:3]] == [3, 2, 1]
+    assert hits[3][0] == 4
+
+
+def test_search_matches_exhaustive_bm25_ranking():
+    rng = random.Random(7)
+    words = ["プリンター", "経費精算", "パスワード", "VPN", "請求書", "至急", "動かない", "エラー", "承認", "会議室"]
+    index = TroubleSearchIndex()
+    for trouble_id in range(1, 2001):
+        title = "".join(rng.sample(words, 2))
+        description = "。".join(rng.choice(words) for _ in range(rng.randint(1, 6)))
+        index.add(trouble_id, title, description, rng.randint(1, 3))
+
+    for _ in range(50):
+        query = " ".join(rng.sample(words, rng.randint(1, 3)))
+        for category_id in (None, 2):
+            _, _, hits = index.search(query, category_id, limit=10)
+            assert [trouble_id for trouble_id, _ in hits] == brute_force(index, query, category_id, limit=10)
+
+
+def test_search_snapshot_is_not_modified_by_later_edits():
+    index = TroubleSearchIndex()
+    for trouble_id in range(1, 31):
+        index.add(trouble_id, "プリンターが動かない", "至急" * (trouble_id % 3 + 1), 1)
+    index.search("プリンター 至急", 1, limit=5)
+    postings = index._postings["プリ"]
+    documents = index._documents
+    members = index._by_category[1]
+
+    index.add(5, "経費精算の締め", "至急対応お願いします", 2)
+    index.add(31, "プリンターの設定", "手順を教えてください", 1)
+
+    assert 5 in postings and 31 not in postings
+    assert documents[5].category_id == 1 and 31 not in documents
+    assert 5 in members and 31 not in members
+    assert 5 not in index._postings["プリ"] and 31 in index._postings["プリ"]
+    _, _, hits = index.search("プリンター 至急", 1, limit=40)
+    assert sorted(trouble_id for trouble_id, _ in hits) == [i for i in range(1, 32) if i != 5]
+
+
+def test_search_reports_truncated_candidate_count_as_estimate():
+    index = TroubleSearchIndex()
+    for trouble_id in range(1, 201):
+        index.add(trouble_id, f"珍しい語{trouble_id % 2}" if trouble_id <= 4 else "ありふれた話", "よくある質問です")
+
+    total, is_estimate, hits = index.search("珍しい語 よくある質問", limit=2)
+
+    assert is_estimate
+    assert total == 200
+    assert len(hits) == 2
+
+
+class _FakeCatalog:
+    def __init__(self, ids):
+        self.ids = {f"category-{category_id}": category_id for category_id in ids}
+
+    def current(self):
+        return self
+
+
+class _FakeCounterBuffer:
+    """保留中の加算を持ち、フラッシュを止めている間かどうかを記録する"""
+
+    running = True
+
+    def __init__(self):
+        self.points = {}
+        self.answers = {}
+        self.holding = False
+
+    @contextmanager
+    def holding_flushes(self):
+        self.holding = True
+        try:
+            yield
+        finally:
+            self.holding = False
+
+    def pending_points(self):
+        return dict(self.points)
+
+    def pending_answers(self):
+        return dict(self.answers)
+
+
+def _stub_rebuild_sources(monkeypatch, matcher, users, categories, catalog_ids, during_load=None, during_reload=None):
+    buffer = _FakeCounterBuffer()
+    monkeypatch.setattr(helper_matching, "category_catalog", _FakeCatalog(catalog_ids))
+    monkeypatch.setattr(helper_matching, "user_counter_buffer", buffer)
+    rows = {row["user_id"]: row for row in users}
+
+    def load(batch_size):
+        assert not buffer.holding
+        if during_load is not None:
+            during_load(buffer)
+        return users, categories
+
+    def load_counts(user_ids, batch_size):
+        if during_reload is not None:
+            during_reload(buffer)
+        return [rows.get(user_id, {"user_id": user_id, "num_answer": 0, "point_total": 0}) for user_id in user_ids]
+
+    monkeypatch.setattr(matcher, "_load", load)
+    monkeypatch.setattr(matcher, "_load_counts", load_counts)
+    return buffer
+
+
+def test_helper_matching_uses_categories_beyond_64_bits(monkeypatch):
+    matcher = HelperMatcher()
+    users = [{"user_id": user_id, "num_answer": 0, "point_total": user_id} for user_id in range(1, 81)]
+    categories = {user_id: [user_id] for user_id in range(1, 81)}
+    _stub_rebuild_sources(monkeypatch, matcher, users, categories, range(1, 81))
+    matcher.rebuild()
+
+    assert matcher.top([75], k=1) == [(75, round(10 + 0.5 * math.log1p(75), 3), 1)]
+    # 前回の rebuild の後に作られたカテゴリーも無視しない
+    matcher.add_user(81, [200])
+    assert matcher.top([200], k=1)[0][::2] == (81, 1)
+
+
+def test_helper_matching_replays_updates_made_during_rebuild(monkeypatch):
+    matcher = HelperMatcher()
+    users = [{"user_id": 1, "num_answer": 0, "point_total": 0}]
+
+    def concurrent_updates(buffer):
+        # 読み込み中の加算はフラッシュされていなければ保留中の加算に残っている
+        matcher.add_user(2, [1])
+        buffer.points[2] = 100
+        matcher.apply_points(2, 100)
+        buffer.answers[1] = 3
+        matcher.add_answers(1, 3)
+
+    def late_update(buffer):
+        # 保留中の加算を読んだ後の加算は journal から適用される
+        matcher.apply_points(1, 1)
+
+    _stub_rebuild_sources(monkeypatch, matcher, users, {1: [1]}, [1], concurrent_updates, late_update)
+    matcher.rebuild()
+
+    assert matcher._points[matcher._slots[2]] == 100
+    assert matcher._answers[matcher._slots[1]] == 3
+    assert matcher._points[matcher._slots[1]] == 1
+    assert [user_id for user_id, _, _ in matcher.top([1], k=2)] == [2, 1]